@@ -0,0 +1,662 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from database.utils_db import DB_PATH, Data, DataSet
+from memory import MemoryTracker, WorkerPool, release, solver_tempfiles
+from selection import History, config_key, features
+
+# Nombres de las condiciones de parada por límite (ver limits.py)
+TIME_LIMIT = 'time_limit'
+ITERATION_LIMIT = 'iteration_limit'
+
+# Configuraciones de solver que se ejecutan por defecto sobre cada modelo
+SOLVERS = [{'solver': 'mpec_nlp', 'solver_options': '', 'transformation': ''},
+           {'solver': 'ipopt', 'solver_options': '', 'transformation': 'mpec.standard_form'},
+           {'solver': 'mpec_minlp', 'solver_options': '', 'transformation': ''}
+           ]
+
+# Instancias que run_pipeline mantiene construidas (o resueltas sin guardar) entre etapas
+PIPELINE_DEPTH = 2
+
+# Módulos que cada proceso que resuelve carga y congela al iniciarse (ver memory.freeze_worker)
+WORKER_MODULES = ('eip_model', )
+
+
+def parse_model_ids(spec: str, available: list) -> list:
+    '''
+    Selecciona identificadores de modelos a partir de una especificación de rangos ('1-3,7,10-12')
+
+    :param spec: especificación de rangos (cadena vacía para todos los modelos)
+    :param available: identificadores de los modelos existentes en la base de datos
+    :return: lista ordenada de identificadores seleccionados
+    '''
+
+    if not spec:
+        return sorted(available)
+
+    selected = set()
+
+    for part in spec.split(','):
+        first, _, last = part.strip().partition('-')
+        selected.update(range(int(first), int(last or first) + 1))
+
+    return sorted(selected.intersection(available))
+
+
+def load_solvers(path: str) -> list:
+    '''
+    Carga las configuraciones de solver desde un archivo JSON con una lista de
+    diccionarios {'solver', 'transformation', 'solver_options'} y opcionalmente
+    'time_limit', 'iter_limit' y 'fallback' (lista de configuraciones que se intentan
+    en orden si la anterior falla o se detiene por un límite)
+
+    :param path: ruta del archivo (None para usar las configuraciones por defecto)
+    :return: lista de configuraciones
+    '''
+
+    if path is None:
+        return SOLVERS
+
+    with open(path) as f:
+        configs = json.load(f)
+
+    return [parse_config(item) for item in configs]
+
+
+def parse_config(item: dict) -> dict:
+    '''
+    Normaliza una configuración de solver leída de JSON (ver load_solvers)
+
+    :raises KeyError: si no define el solver
+    '''
+
+    config = {'solver': item['solver'],
+              'transformation': item.get('transformation', ''),
+              'solver_options': item.get('solver_options', '')}
+
+    for key in ('time_limit', 'iter_limit'):
+        if item.get(key) is not None:
+            config[key] = item[key]
+
+    if item.get('fallback'):
+        config['fallback'] = [parse_config(fallback) for fallback in item['fallback']]
+
+    return config
+
+
+def run_job(model_id: int, config: dict, db_path: str = DB_PATH, tee: bool = False, log_dir: str = None,
+            time_limit: float = None, iter_limit: int = None, persist: bool = True, evaluate_csv: bool = True,
+            data: Data = None, fp_tol: float = None, build_workers: int = 1, track_memory: bool = False) -> dict:
+    '''
+    Construye, resuelve y guarda un modelo con una configuración de solver.
+    Si el solve falla, no encuentra un punto factible o se detiene por un límite se
+    intentan en orden las configuraciones de 'fallback'
+
+    :param model_id: identificador del modelo
+    :param config: configuración del solver {'solver', 'transformation', 'solver_options'}
+    :param db_path: ruta de la base de datos
+    :param tee: mostrar la salida del solver en la consola
+    :param log_dir: directorio donde se guarda la salida del solver (None para no guardarla)
+    :param time_limit: tiempo límite del solver en segundos (si la configuración no define uno)
+    :param iter_limit: límite de iteraciones del solver (si la configuración no define uno)
+    :param persist: guardar los resultados en la base de datos
+    :param evaluate_csv: guardar la evaluación de las restricciones en data_csv/
+    :param data: datos del modelo ya cargados (p. ej. con DataSet); None para leerlos de la base de datos
+    :param fp_tol: guardar solo los Fp con |Fp| > fp_tol (None para guardar todas las tuberías)
+    :param build_workers: procesos que calculan las filas de estacionariedad de las empresas al construir el modelo
+    :param track_memory: medir también la memoria reservada por Python con tracemalloc (más lento)
+    :return: diccionario con el resultado del último intento; 'Memory' tiene la memoria del proceso al
+             terminar (ver memory.MemoryTracker)
+    '''
+
+    attempts = [config] + config.get('fallback', [])
+
+    tracker = MemoryTracker(track_memory)
+    start = time.time()
+
+    try:
+        if data is None:
+            data = Data(model_id, db_path)
+
+        with solver_tempfiles():
+            for i, attempt in enumerate(attempts):
+                rslt = _run_attempt(model_id, attempt, data, tee, log_dir, attempt.get('time_limit', time_limit),
+                                    attempt.get('iter_limit', iter_limit), persist, evaluate_csv, fp_tol, build_workers)
+                rslt['Fallbacks'] = i
+
+                if _solved(rslt):
+                    break
+
+    except Exception as e:
+        rslt = _failed(model_id, config, e)
+
+    finally:
+        if data is not None:
+            data.close()
+
+    rslt['Wall Time'] = time.time() - start
+
+    # las instancias de los intentos ya no se usan: se liberan antes de medir
+    release()
+    rslt['Memory'] = tracker.stop()
+
+    return rslt
+
+
+def _failed(model_id: int, config: dict, e: Exception) -> dict:
+    '''
+    Resultado de un trabajo que lanzó una excepción
+    '''
+
+    return {'Model': model_id, 'Solver': f"{config['solver']}_{config['transformation']}",
+            'Options': config['solver_options'], 'Error': '%s: %s' % (type(e).__name__, e)}
+
+
+def _run_data_job(model_id: int, config: dict, data: Data, **kwargs) -> dict:
+    # run_job con los datos como argumento posicional (ver WorkerPool.map)
+    return run_job(model_id, config, data=data, **kwargs)
+
+
+def _pool_error(job: tuple, e: Exception) -> dict:
+    # trabajo perdido porque su worker terminó abruptamente (p. ej. sin memoria)
+    return dict(_failed(job[0], job[1], e), **{'Wall Time': 0.0})
+
+
+def _solved(rslt: dict) -> bool:
+    '''
+    Indica si un intento encontró un punto factible sin detenerse por un límite (si no, se intenta el fallback)
+    '''
+
+    return 'Error' not in rslt and rslt['Objective Value'] is not None \
+        and rslt['Termination Condition'] not in (TIME_LIMIT, ITERATION_LIMIT)
+
+
+def _run_attempt(model_id: int, config: dict, data: Data, tee: bool, log_dir: str, time_limit: float,
+                 iter_limit: int, persist: bool, evaluate_csv: bool, fp_tol: float = None, build_workers: int = 1) -> dict:
+    '''
+    Construye y resuelve una instancia nueva del modelo con una configuración de solver
+
+    :return: diccionario con el resultado del intento
+    '''
+
+    rslt, built = _build_attempt(model_id, config, data, build_workers)
+    rslt, status = _solve_attempt(rslt, built, config, model_id, tee, log_dir, time_limit, iter_limit)
+
+    return _store_attempt(rslt, built, status, config, data, persist, evaluate_csv, fp_tol)
+
+
+def _build_attempt(model_id: int, config: dict, data: Data, workers: int = 1) -> tuple:
+    '''
+    Etapa de construcción de un intento: crea la instancia y aplica presolve, transformación y escalado
+
+    :return: tupla (resultado parcial, (instancia, opciones del solver, datos del presolve, stats) o None si falló)
+    '''
+
+    # los módulos de pyomo solo se cargan cuando se construye un modelo
+    from eip_model import model, prepare
+
+    rslt = {'Model': model_id, 'Solver': f"{config['solver']}_{config['transformation']}", 'Options': config['solver_options']}
+
+    start = time.time()
+    stats = dict()
+
+    try:
+        instance = model(model_id, data, workers)
+        rslt['Build Time'] = time.time() - start
+
+        options, presolved = prepare(instance, config['solver'], config['transformation'], config['solver_options'], stats)
+
+    except Exception as e:
+        rslt['Error'] = '%s: %s' % (type(e).__name__, e)
+        return rslt, None
+
+    return rslt, (instance, options, presolved, stats)
+
+
+def _solve_attempt(rslt: dict, built: tuple, config: dict, model_id: int, tee: bool, log_dir: str,
+                   time_limit: float, iter_limit: int) -> tuple:
+    '''
+    Etapa de solve de un intento construido con _build_attempt
+
+    :return: tupla (resultado del intento, (condición de parada, estado del solver) o None si falló)
+    '''
+
+    if built is None:
+        return rslt, None
+
+    from eip_model import solve_prepared
+
+    instance, options, presolved, stats = built
+    solver = config['solver']
+    transformation = config['transformation']
+
+    logfile = None
+    if log_dir is not None:
+        logfile = os.path.join(log_dir, f'EIP_{model_id}_{solver}_{transformation}.log')
+
+    try:
+        obj_value, termination_condition, solver_status, solve_time = solve_prepared(
+            instance, solver, options, presolved, tee=tee, logfile=logfile, time_limit=time_limit,
+            iter_limit=iter_limit, stats=stats)
+
+        rslt.update({'Objective Value': obj_value, 'Termination Condition': str(termination_condition), 'Time': solve_time})
+        rslt.update(stats)
+
+    except Exception as e:
+        rslt['Error'] = '%s: %s' % (type(e).__name__, e)
+        return rslt, None
+
+    return rslt, (termination_condition, solver_status)
+
+
+def _store_attempt(rslt: dict, built: tuple, status: tuple, config: dict, data: Data, persist: bool,
+                   evaluate_csv: bool, fp_tol: float = None) -> dict:
+    '''
+    Etapa de evaluación y escritura en la base de datos de un intento resuelto con _solve_attempt
+
+    :return: diccionario con el resultado del intento
+    '''
+
+    if status is None:
+        return rslt
+
+    from eip_model import evaluate
+
+    instance, _, _, stats = built
+    solver = config['solver']
+    transformation = config['transformation']
+    solver_options = config['solver_options']
+    obj_value = rslt['Objective Value']
+
+    try:
+        if evaluate_csv and obj_value is not None:
+            evaluate(instance, solver + '_' + transformation) # guardar resultados en .csv
+
+        if persist:
+            termination_condition, solver_status = status
+            data.insert_results(instance.Fw, instance.Fp, solver, transformation, solver_options, obj_value, termination_condition, solver_status, rslt['Time'], fp_tol=fp_tol)
+
+            if 'stages' in stats:
+                data.insert_stage_results(solver, transformation, solver_options, stats['stages'])
+
+            if 'starts' in stats:
+                data.insert_start_results(solver, transformation, solver_options, stats['starts'])
+
+    except Exception as e:
+        rslt['Error'] = '%s: %s' % (type(e).__name__, e)
+
+    return rslt
+
+
+def load_data(model_ids: list, db_path: str = DB_PATH):
+    '''
+    Carga los datos de los modelos con un solo DataSet, en el orden de model_ids
+
+    :param model_ids: identificadores de los modelos (ordenados de menor a mayor, como los de parse_model_ids)
+    :param db_path: ruta de la base de datos
+    :return: generador de tuplas (identificador, Data); Data es None para los modelos que no se cargaron
+             (no existen o model_ids no está ordenado) y que run_job leerá por su cuenta
+    '''
+
+    with DataSet(db_path) as dataset:
+        loaded = dataset.load(model_ids)
+        pending = next(loaded, None)
+
+        for id_ in model_ids:
+            while pending is not None and pending.model_id < id_:
+                pending = next(loaded, None)
+
+            yield id_, pending if pending is not None and pending.model_id == id_ else None
+
+
+def run_campaign(model_ids: list, configs: list, workers: int = 1, progress=None, max_tasks: int = None,
+                 max_memory: int = None, **kwargs) -> list:
+    '''
+    Ejecuta todas las combinaciones de modelos y configuraciones de solver. Con max_tasks o max_memory los
+    trabajos se resuelven en procesos que se reemplazan periódicamente (ver memory.WorkerPool), aunque
+    haya un solo worker
+
+    :param model_ids: identificadores de los modelos
+    :param configs: configuraciones de solver
+    :param workers: cantidad de procesos que resuelven en paralelo
+    :param progress: función que recibe cada resultado al terminar (None para no notificar)
+    :param max_tasks: trabajos por worker antes de reemplazar los procesos (None para no reciclarlos)
+    :param max_memory: RSS en bytes de un worker a partir del cual se reemplazan los procesos
+    :param kwargs: argumentos adicionales de run_job
+    :return: lista de resultados en el orden de los trabajos
+    '''
+
+    # los datos de todos los modelos se leen con una sola conexión a medida que se necesitan
+    jobs = ((id_, config, data) for id_, data in load_data(model_ids, kwargs.get('db_path', DB_PATH))
+            for config in configs)
+    rslt = []
+
+    if workers <= 1 and max_tasks is None and max_memory is None:
+        for id_, config, data in jobs:
+            rslt.append(run_job(id_, config, data=data, **kwargs))
+
+            if progress is not None:
+                progress(rslt[-1])
+
+        return rslt
+
+    with WorkerPool(workers, max_tasks, max_memory, WORKER_MODULES) as pool:
+        # los Data sin conexión abierta se envían a los procesos junto con el trabajo
+        for r in pool.map(_run_data_job, jobs, _pool_error, **kwargs):
+            rslt.append(r)
+
+            if progress is not None:
+                progress(r)
+
+    return rslt
+
+
+def run_pipeline(model_ids: list, configs: list, depth: int = PIPELINE_DEPTH, progress=None, db_path: str = DB_PATH,
+                 tee: bool = False, log_dir: str = None, time_limit: float = None, iter_limit: int = None,
+                 persist: bool = True, evaluate_csv: bool = True, fp_tol: float = None, build_workers: int = 1) -> list:
+    '''
+    Ejecuta todas las combinaciones de modelos y configuraciones de solver en tres etapas que trabajan
+    a la vez, unidas por colas de a lo sumo `depth` elementos:
+
+    - un hilo carga los datos y construye y prepara (presolve, transformación, escalado) las instancias siguientes
+    - el hilo principal llama al solver (y construye los fallbacks, que dependen del resultado)
+    - un hilo evalúa las restricciones y guarda los resultados en la base de datos
+
+    Mientras el solver externo trabaja en su subproceso, los otros hilos avanzan con las instancias
+    vecinas. Los resultados son los mismos que los de run_campaign con un worker, salvo que un error al
+    guardar un intento no lanza su fallback
+
+    :param model_ids: identificadores de los modelos
+    :param configs: configuraciones de solver
+    :param depth: tamaño de las colas entre etapas
+    :param progress: función que recibe cada resultado al terminar (None para no notificar); se llama
+                     desde el hilo que guarda los resultados
+    :return: lista de resultados en el orden de los trabajos
+    '''
+
+    built_jobs = queue.Queue(maxsize=depth)
+    solved_jobs = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    rslt = []
+
+    def build_stage():
+        try:
+            for id_, data in load_data(model_ids, db_path):
+                start = time.time()
+
+                try:
+                    if data is None:
+                        data = Data(id_, db_path)
+
+                    # la conexión de Data la abre el hilo que guarda los resultados
+                    data.close()
+
+                except Exception as e:
+                    data = None
+                    error = '%s: %s' % (type(e).__name__, e)
+
+                for i, config in enumerate(configs):
+                    if stop.is_set():
+                        return
+
+                    if data is None:
+                        built = {'Model': id_, 'Solver': f"{config['solver']}_{config['transformation']}",
+                                 'Options': config['solver_options'], 'Error': error}, None
+
+                    else:
+                        built = _build_attempt(id_, config, data, build_workers)
+
+                    built_jobs.put((id_, config, data, i == len(configs) - 1, start, built))
+                    start = time.time()
+
+        except Exception as e:
+            errors.append(e)
+
+        finally:
+            built_jobs.put(None)
+
+    def store_stage():
+        while True:
+            job = solved_jobs.get()
+
+            if job is None:
+                break
+
+            attempt, data, last_config, done, start, job_rslt, built, status = job
+
+            try:
+                # después de un error solo se vacía la cola para no bloquear la etapa de solve
+                if errors:
+                    continue
+
+                job_rslt = _store_attempt(job_rslt, built, status, attempt, data, persist, evaluate_csv, fp_tol)
+
+                if not done:
+                    continue
+
+                job_rslt['Wall Time'] = time.time() - start
+                rslt.append(job_rslt)
+
+                if progress is not None:
+                    progress(job_rslt)
+
+            except Exception as e:
+                errors.append(e)
+
+            finally:
+                # la conexión de Data se cierra aunque falle el guardado o la campaña se haya detenido
+                if done and last_config and data is not None:
+                    data.close()
+
+    threads = [threading.Thread(target=build_stage, daemon=True), threading.Thread(target=store_stage, daemon=True)]
+
+    for thread in threads:
+        thread.start()
+
+    job = ()
+
+    try:
+        while True:
+            job = built_jobs.get()
+
+            if job is None:
+                break
+
+            if errors:
+                # otra etapa falló: la campaña se detiene sin resolver los trabajos que quedan
+                stop.set()
+                break
+
+            id_, config, data, last_config, start, (job_rslt, built) = job
+            attempts = [config] + config.get('fallback', []) if data is not None else [config]
+
+            for i, attempt in enumerate(attempts):
+                if i > 0:
+                    job_rslt, built = _build_attempt(id_, attempt, data, build_workers)
+
+                job_rslt, status = _solve_attempt(job_rslt, built, attempt, id_, tee, log_dir,
+                                                  attempt.get('time_limit', time_limit), attempt.get('iter_limit', iter_limit))
+                job_rslt['Fallbacks'] = i
+
+                done = i == len(attempts) - 1 or _solved(job_rslt)
+                solved_jobs.put((attempt, data, last_config, done, start, job_rslt, built, status))
+
+                if done:
+                    break
+
+    finally:
+        # si el solve se interrumpe, la etapa de construcción se detiene y su cola se vacía
+        stop.set()
+
+        while job is not None:
+            job = built_jobs.get()
+
+        solved_jobs.put(None)
+
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return rslt
+
+
+def run_auto_campaign(model_ids: list, configs: list, top_k: int = 1, workers: int = 1, progress=None,
+                      max_tasks: int = None, max_memory: int = None, **kwargs) -> tuple:
+    '''
+    Modo auto: para cada modelo se ejecutan solo las top_k configuraciones que mejor resultado dieron en
+    los modelos más parecidos del historial (ver selection.History.select). El historial se carga de
+    Results_Info y se actualiza con cada resultado, por lo que los modelos siguientes aprovechan los
+    anteriores. Los modelos se procesan en grupos de `workers` modelos
+
+    :param model_ids: identificadores de los modelos
+    :param configs: configuraciones de solver candidatas
+    :param top_k: cantidad de configuraciones que se ejecutan por modelo
+    :param workers: cantidad de procesos que resuelven en paralelo
+    :param progress: función que recibe cada resultado al terminar (None para no notificar)
+    :param max_tasks: trabajos por worker antes de reemplazar los procesos (ver run_campaign)
+    :param max_memory: RSS en bytes de un worker a partir del cual se reemplazan los procesos
+    :param kwargs: argumentos adicionales de run_job
+    :return: tupla (lista de resultados, resumen con Models, Jobs, Exhaustive_Jobs, Time y
+             Estimated_Exhaustive_Time: tiempo de los trabajos más el estimado de las configuraciones omitidas)
+    '''
+
+    db_path = kwargs.get('db_path', DB_PATH)
+    history = History.load(db_path, [config_key(config) for config in configs])
+
+    rslt = []
+    report = {'Models': 0, 'Jobs': 0, 'Exhaustive_Jobs': 0, 'Time': 0.0, 'Estimated_Exhaustive_Time': 0.0}
+
+    recycle = max_tasks is not None or max_memory is not None
+    pool = WorkerPool(workers, max_tasks, max_memory, WORKER_MODULES) if workers > 1 or recycle else None
+    models = load_data(model_ids, db_path)
+
+    try:
+        while True:
+            batch = [item for _, item in zip(range(max(1, workers)), models)]
+
+            if not batch:
+                break
+
+            jobs = []
+
+            for id_, data in batch:
+                if data is None:
+                    data = Data(id_, db_path)
+                    data.close()
+
+                feats = features(data)
+                selected, predicted = history.select(feats, configs, top_k)
+
+                report['Models'] += 1
+                report['Exhaustive_Jobs'] += len(configs)
+
+                # tiempo estimado de las configuraciones que no se ejecutan
+                skipped = set(map(config_key, configs)) - set(map(config_key, selected))
+                report['Estimated_Exhaustive_Time'] += sum(predicted.get(key, 0.0) for key in skipped)
+
+                jobs.extend((id_, config, data, feats) for config in selected)
+
+            if pool is None:
+                results = (run_job(id_, config, data=data, **kwargs) for id_, config, data, _ in jobs)
+
+            else:
+                results = pool.map(_run_data_job, [job[:3] for job in jobs], _pool_error, **kwargs)
+
+            for (id_, config, _, feats), r in zip(jobs, results):
+                time = r.get('Time', r['Wall Time'])
+
+                history.add(id_, feats, config_key(config), None if 'Error' in r else r['Objective Value'], time)
+
+                report['Jobs'] += 1
+                report['Time'] += time
+                report['Estimated_Exhaustive_Time'] += time
+
+                rslt.append(r)
+
+                if progress is not None:
+                    progress(r)
+
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return rslt, report
+
+
+def benchmark_memory(model_ids: list, configs: list, solves: int = 1000, workers: int = 1, max_tasks: int = None,
+                     max_memory: int = None, every: int = 100, db_path: str = DB_PATH, progress=None, **kwargs) -> dict:
+    '''
+    Resuelve `solves` trabajos repitiendo en orden los modelos y las configuraciones y registra la memoria de
+    los procesos que resuelven, para comprobar que se mantiene estable en campañas largas
+
+    :param model_ids: identificadores de los modelos
+    :param configs: configuraciones de solver
+    :param solves: cantidad de trabajos
+    :param workers: procesos que resuelven (con 1 y sin reciclado se resuelve en este proceso)
+    :param max_tasks: trabajos por worker antes de reemplazar los procesos (ver run_campaign)
+    :param max_memory: RSS en bytes de un worker a partir del cual se reemplazan los procesos
+    :param every: trabajos entre muestras
+    :param db_path: ruta de la base de datos
+    :param progress: función que recibe cada muestra (None para no notificar)
+    :param kwargs: argumentos adicionales de run_job
+    :return: diccionario con Samples (lista de tuplas (trabajos, RSS máximo de los procesos que resolvieron
+             desde la muestra anterior, memoria de Python con track_memory o None)), Errors, Recycled y Slope
+             (crecimiento del RSS en bytes cada 1000 trabajos, ajustado por mínimos cuadrados en la segunda mitad)
+    '''
+
+    with DataSet(db_path) as dataset:
+        pairs = [(data.model_id, config, data) for data in dataset.load(model_ids) for config in configs]
+
+    jobs = (pairs[i % len(pairs)] for i in range(solves))
+    pool = WorkerPool(workers, max_tasks, max_memory, WORKER_MODULES) if workers > 1 or max_tasks or max_memory else None
+
+    if pool is None:
+        results = (_run_data_job(*job, db_path=db_path, **kwargs) for job in jobs)
+
+    else:
+        results = pool.map(_run_data_job, jobs, _pool_error, db_path=db_path, **kwargs)
+
+    report = {'Samples': [], 'Errors': 0, 'Recycled': 0, 'Slope': 0.0}
+    rss, traced = dict(), dict()  # PID -> última medición desde la muestra anterior
+
+    try:
+        for i, r in enumerate(results, 1):
+            report['Errors'] += 'Error' in r
+            memory = r.get('Memory')
+
+            if memory is not None:
+                rss[memory['PID']] = memory['RSS']
+
+                if 'Traced' in memory:
+                    traced[memory['PID']] = memory['Traced']
+
+            if i % every == 0 or i == solves:
+                sample = (i, max(rss.values(), default=None), max(traced.values(), default=None))
+                report['Samples'].append(sample)
+                rss.clear()
+                traced.clear()
+
+                if progress is not None:
+                    progress(sample)
+
+    finally:
+        if pool is not None:
+            report['Recycled'] = pool.recycled
+            pool.shutdown()
+
+    points = [(x, y) for x, y, _ in report['Samples'][len(report['Samples']) // 2:] if y is not None]
+
+    if len(points) > 1:
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+
+        report['Slope'] = 1000 * sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x if var_x else 0.0
+
+    return report
@@ -0,0 +1,612 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from campaign import PIPELINE_DEPTH, load_solvers, parse_model_ids, run_auto_campaign, run_campaign, run_pipeline
+from database.utils_db import DB_PATH, load_models_id
+from reports import format_table
+
+# Este módulo es el punto de entrada `pei-opt`: no debe importar pyomo al cargarse
+
+RESULT_COLUMNS = ['Model', 'Solver', 'Objective Value', 'Termination Condition', 'Time']
+
+# Crecimiento del RSS (KiB cada 1000 trabajos) a partir del cual memory-bench falla
+MAX_RSS_SLOPE = 1024.0
+
+
+def add_job_arguments(parser: argparse.ArgumentParser) -> None:
+    '''
+    Añade los argumentos de selección de trabajos y control de ejecución
+
+    :param parser: parser de argparse de un subcomando
+    '''
+
+    parser.add_argument('-m', '--models', default='', help="rangos de modelos a resolver, p. ej. '1-3,7' (por defecto todos)")
+    parser.add_argument('-s', '--solvers', default=None, help='archivo JSON con las configuraciones de solver')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='cantidad de procesos que resuelven en paralelo')
+    parser.add_argument('-b', '--build-workers', type=int, default=1,
+                        help='procesos que calculan las filas KKT de las empresas al construir cada modelo')
+    parser.add_argument('-t', '--time-limit', type=float, default=None, help='tiempo límite por solve en segundos')
+    parser.add_argument('-i', '--iter-limit', type=int, default=None, help='límite de iteraciones por solve')
+    parser.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    parser.add_argument('--tee', action='store_true', help='mostrar la salida de los solvers en la consola')
+    parser.add_argument('--log-dir', default=None, help='directorio donde guardar la salida de los solvers')
+    parser.add_argument('--pipeline', type=int, nargs='?', const=PIPELINE_DEPTH, default=0, metavar='DEPTH',
+                        help='construir y guardar en hilos aparte mientras se resuelve (en lugar de --workers)')
+    parser.add_argument('--max-tasks', type=int, default=None, metavar='N',
+                        help='reemplazar los procesos que resuelven después de N trabajos por worker')
+    parser.add_argument('--max-memory', type=float, default=None, metavar='MIB',
+                        help='reemplazar los procesos que resuelven cuando uno supera MIB MiB de RSS')
+    parser.add_argument('--track-memory', action='store_true',
+                        help='medir la memoria de Python de cada trabajo con tracemalloc (más lento)')
+
+
+def job_kwargs(args: argparse.Namespace) -> dict:
+    '''
+    Argumentos de run_job comunes a los subcomandos
+
+    :param args: argumentos de la línea de comandos
+    :return: diccionario de argumentos
+    '''
+
+    if args.log_dir is not None:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    return {'db_path': args.db, 'tee': args.tee, 'log_dir': args.log_dir, 'time_limit': args.time_limit,
+            'iter_limit': args.iter_limit, 'build_workers': args.build_workers}
+
+
+def memory_kwargs(args: argparse.Namespace) -> dict:
+    '''
+    Argumentos de reciclado de workers y medición de memoria de run_campaign (no se usan con --pipeline)
+
+    :param args: argumentos de la línea de comandos
+    :return: diccionario de argumentos
+    '''
+
+    return {'max_tasks': args.max_tasks, 'max_memory': args.max_memory * 2**20 if args.max_memory else None,
+            'track_memory': args.track_memory}
+
+
+def uses_memory_options(args: argparse.Namespace) -> bool:
+    return args.max_tasks is not None or args.max_memory is not None or args.track_memory
+
+
+def print_progress(rslt: dict) -> None:
+    '''
+    Imprime una línea por trabajo terminado
+
+    :param rslt: resultado de un trabajo
+    '''
+
+    if 'Error' in rslt:
+        print('Modelo %s %s: error %s' % (rslt['Model'], rslt['Solver'], rslt['Error']), file=sys.stderr)
+
+    else:
+        print('Modelo %s %s: %s %s (%.3f s)' % (rslt['Model'], rslt['Solver'], rslt['Objective Value'],
+                                                rslt['Termination Condition'], rslt['Wall Time']), file=sys.stderr)
+
+
+def write_csv(rslt: list, path: str, columns: list) -> None:
+    '''
+    Guarda los resultados de los trabajos en un .csv
+
+    :param rslt: resultados de los trabajos
+    :param path: ruta del archivo
+    :param columns: columnas a guardar
+    '''
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rslt)
+
+
+def execute(model_ids: list, configs: list, args: argparse.Namespace, **kwargs) -> list:
+    '''
+    Ejecuta la campaña con procesos en paralelo (--workers) o con las etapas en paralelo (--pipeline)
+
+    :param model_ids: identificadores de los modelos
+    :param configs: configuraciones de solver
+    :param args: argumentos de la línea de comandos
+    :param kwargs: argumentos adicionales de run_job
+    :return: lista de resultados
+    '''
+
+    if args.pipeline:
+        return run_pipeline(model_ids, configs, depth=args.pipeline, **kwargs, **job_kwargs(args))
+
+    return run_campaign(model_ids, configs, workers=args.workers, **kwargs, **job_kwargs(args), **memory_kwargs(args))
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    model_ids = parse_model_ids(args.models, load_models_id(args.db))
+    configs = load_solvers(args.solvers)
+
+    if args.pipeline and (args.workers > 1 or args.auto or uses_memory_options(args)):
+        print('error: --pipeline no se combina con --workers, --auto ni las opciones de memoria', file=sys.stderr)
+        return 2
+
+    kwargs = dict(progress=None if args.quiet else print_progress, evaluate_csv=not args.no_evaluate, fp_tol=args.fp_tol)
+
+    if args.auto:
+        rslt, report = run_auto_campaign(model_ids, configs, top_k=args.auto, workers=args.workers, **kwargs,
+                                         **job_kwargs(args), **memory_kwargs(args))
+
+    else:
+        rslt = execute(model_ids, configs, args, **kwargs)
+
+    if args.output is not None:
+        write_csv(rslt, args.output, RESULT_COLUMNS)
+
+    print(format_table([r for r in rslt if 'Error' not in r], RESULT_COLUMNS))
+
+    if args.auto:
+        print_auto_report(report)
+
+    return 1 if any('Error' in r for r in rslt) else 0
+
+
+def print_auto_report(report: dict) -> None:
+    '''
+    Imprime el resumen del modo auto: trabajos ejecutados y tiempo ahorrado frente a la ejecución exhaustiva
+    '''
+
+    exhaustive = report['Estimated_Exhaustive_Time']
+    saved = 1 - report['Time'] / exhaustive if exhaustive > 0 else 0.0
+
+    print('Modo auto: %d de %d trabajos en %d modelos' % (report['Jobs'], report['Exhaustive_Jobs'], report['Models']))
+    print('Tiempo de solver: %.3f s (exhaustivo estimado %.3f s, ahorro %.1f %%)' % (report['Time'], exhaustive, 100 * saved))
+
+
+def cmd_auto_eval(args: argparse.Namespace) -> int:
+    from selection import History, config_key, evaluate
+
+    configs = load_solvers(args.solvers)
+    history = History.load(args.db, [config_key(config) for config in configs])
+    report = evaluate(history, configs, top_k=args.top_k)
+
+    print('Modelos evaluados: %d' % report['Models'])
+
+    if report['Solved']:
+        print('Aciertos: %d de %d modelos con solución (%.1f %%)'
+              % (report['Hits'], report['Solved'], 100 * report['Hits'] / report['Solved']))
+
+    if report['Models']:
+        print('Tiempo de solver: %.3f s (exhaustivo %.3f s, ahorro %.1f %%)'
+              % (report['Time'], report['Exhaustive_Time'], 100 * report['Saved']))
+
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    model_ids = parse_model_ids(args.models, load_models_id(args.db))
+    configs = load_solvers(args.solvers)
+
+    if args.pipeline and (args.workers > 1 or uses_memory_options(args)):
+        print('error: --pipeline no se combina con --workers ni las opciones de memoria', file=sys.stderr)
+        return 2
+
+    serial = argparse.Namespace(**dict(vars(args), pipeline=0, workers=1, max_tasks=None, max_memory=None,
+                                       track_memory=False))
+
+    # un trabajo sin medir para no sumar la carga de pyomo y de los solvers a la primera ejecución
+    if model_ids and configs:
+        execute(model_ids[:1], configs[:1], serial, persist=False, evaluate_csv=False)
+
+    # --compare: medir antes el bucle serie (un worker, como test.py) con los mismos trabajos
+    runs = [('serie', serial)] if args.compare else []
+    runs.append(('pipeline' if args.pipeline else 'campaña', args))
+
+    for name, run_args in runs:
+        start = time.time()
+        rslt = execute(model_ids, configs, run_args, persist=args.persist, evaluate_csv=False)
+        elapsed = time.time() - start
+
+        solved = [r for r in rslt if 'Error' not in r]
+
+        print('[%s]' % name)
+        print('Trabajos: %d (%d con error)' % (len(rslt), len(rslt) - len(solved)))
+        print('Tiempo total: %.3f s' % elapsed)
+        print('Throughput: %.1f instancias/hora' % (3600 * len(rslt) / elapsed if elapsed > 0 else 0))
+
+        if solved:
+            print('Construcción media: %.3f s' % (sum(r['Build Time'] for r in solved) / len(solved)))
+            print('Solver medio: %.3f s' % (sum(r['Time'] for r in solved) / len(solved)))
+
+        # llamadas a los subsolvers: tiempo propio del solver y sobrecarga (carga del modelo, archivos, solución)
+        solves = [r['solves'] for r in solved if 'solves' in r]
+        calls = sum(item['Solves'] for item in solves)
+
+        if calls:
+            print('Llamadas al solver: %d (solver %.3f s, sobrecarga %.1f ms por llamada)'
+                  % (calls, sum(item['Solver_Time'] for item in solves),
+                     1000 * sum(item['Overhead'] for item in solves) / calls))
+
+    return 0
+
+
+def cmd_persistent_bench(args: argparse.Namespace) -> int:
+    from persistent import benchmark
+
+    rslt = benchmark(args.model, args.solver, args.solves, args.db)
+
+    for mode, stats in rslt.items():
+        print('%-10s %4d llamadas  total %.1f ms por llamada  solver %.3f s  sobrecarga %.3f s (%.1f ms por llamada; carga %.3f s, actualización %.3f s)'
+              % (mode, stats['Solves'], 1000 * (stats['Solver_Time'] + stats['Overhead']) / stats['Solves'], stats['Solver_Time'],
+                 stats['Overhead'], 1000 * stats['Overhead'] / stats['Solves'], stats['Set_Instance'], stats['Update']))
+
+    same = all(a is not None and b is not None and abs(a - b) <= 1e-6 * max(1.0, abs(a))
+               for a, b in zip(rslt['File']['Objectives'], rslt['Persistent']['Objectives']))
+
+    print('Objetivos iguales en ambos modos: %s' % ('sí' if same else 'no'))
+
+    return 0 if same else 1
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    import importtime
+
+    failures = importtime.check()
+
+    for module in importtime.BUDGETS:
+        print('%-20s %10d us' % (module, importtime.measure(module)[0]))
+
+    models = load_models_id(args.db)
+    print('Modelos en la base de datos: %d' % len(models))
+
+    if not models:
+        failures.append('la base de datos %s no tiene modelos' % args.db)
+
+    kkt_model = args.kkt_model if args.kkt_model is not None else min(models, default=None)
+
+    if kkt_model:
+        from database.utils_db import Data
+        from eip_model import model
+        from kkt import check_reference
+
+        # filas de estacionariedad de kkt.firm_coefficients contra las derivadas con sympy (rules.lagrangian_expr)
+        mismatches = check_reference(model(kkt_model, Data(kkt_model, args.db)))
+        print('Filas KKT del modelo %d distintas de lagrangian_expr: %d' % (kkt_model, len(mismatches)))
+
+        failures.extend('fila KKT %s del modelo %d distinta de lagrangian_expr' % (arc, kkt_model) for arc in mismatches)
+
+    for failure in failures:
+        print('FALLO', failure)
+
+    return 1 if failures else 0
+
+
+def cmd_sensitivity(args: argparse.Namespace) -> int:
+    from database.utils_db import Data
+    from eip_model import model, solve
+    from sensitivity import PARAMETERS, sensitivity, sensitivity_table
+
+    instance = model(args.model, Data(args.model, args.db))
+    objective, termination, status, elapsed = solve(instance, args.solver, args.transformation, args.options,
+                                                    tee=args.tee, time_limit=args.time_limit)
+
+    if objective is None:
+        print('error: el modelo %d no tiene punto factible con %s (%s)' % (args.model, args.solver, termination),
+              file=sys.stderr)
+        return 1
+
+    parameters = tuple(args.parameters.split(',')) if args.parameters else PARAMETERS
+    unknown = [name for name in parameters if instance.component(name) is None]
+
+    if unknown:
+        print('error: parámetros desconocidos: %s' % ', '.join(unknown), file=sys.stderr)
+        return 1
+
+    report = sensitivity(instance, parameters)
+
+    print('Modelo %d  %s  objetivo %.6g  (%s, %.2f s)' % (args.model, args.solver, objective, termination, elapsed))
+    print(format_table(sensitivity_table(report),
+                       ['Parameter', 'Value', 'dObjective', 'Lower', 'Upper', 'Lower_Limit', 'Upper_Limit']))
+
+    return 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    from database.insert_db import import_files
+
+    start = time.time()
+
+    try:
+        ids = import_files(args.files, args.db, new_ids=args.new_ids, chunk_size=args.chunk_size)
+
+    except (ValueError, ImportError) as e:
+        # la importación es una sola transacción: no se insertó ningún modelo
+        print('error: %s' % e, file=sys.stderr)
+        return 1
+
+    elapsed = time.time() - start
+
+    for label, model_id in ids.items():
+        print('%s -> modelo %d' % (label, model_id))
+
+    print('Modelos importados: %d (%.3f s)' % (len(ids), elapsed))
+
+    return 0 if ids else 1
+
+
+def cmd_import_bench(args: argparse.Namespace) -> int:
+    from database.insert_db import benchmark
+    from database.utils_db import benchmark_load
+
+    rslt = benchmark(args.models, args.processes, args.db, chunk_size=args.chunk_size, compare=args.compare)
+
+    for method, (rows, elapsed) in rslt.items():
+        print('%-12s %8d filas %8.3f s %12.0f filas/s' % (method, rows, elapsed, rows / elapsed if elapsed > 0 else 0))
+
+    if args.load:
+        for method, (models, elapsed) in benchmark_load(args.models, args.processes, args.db).items():
+            print('%-12s %8d modelos %6.3f s %10.0f modelos/s' % (method, models, elapsed, models / elapsed if elapsed > 0 else 0))
+
+    return 0
+
+
+def cmd_storage_bench(args: argparse.Namespace) -> int:
+    from database.utils_db import benchmark_storage
+
+    rslt = benchmark_storage(args.processes, args.runs, args.db, fp_tol=args.fp_tol, density=args.density)
+
+    for mode, stats in rslt.items():
+        print('%-8s %9d filas Fp %10.1f KiB  escritura %.3f s  lectura %.3f s'
+              % (mode, stats['Rows'], stats['Bytes'] / 1024, stats['Write'], stats['Read']))
+
+    return 0
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    from service import JobService, serve
+
+    configs = load_solvers(args.solvers)
+    service = JobService(args.db, args.queue, workers=args.workers, capacity=args.capacity, default_config=configs[0],
+                         time_limit=args.time_limit, iter_limit=args.iter_limit, fp_tol=args.fp_tol,
+                         build_workers=args.build_workers)
+
+    print('Servicio en http://%s:%d (cola %s, %d workers, capacidad %d variables)'
+          % (args.host, args.port, args.queue, service.workers, service.capacity), file=sys.stderr)
+
+    serve(service, args.host, args.port, verbose=args.verbose)
+
+    return 0
+
+
+def request(url: str, body: dict = None) -> tuple:
+    '''
+    Petición a la API del servicio (POST si hay cuerpo, GET si no)
+
+    :return: tupla (código HTTP, respuesta JSON)
+    '''
+
+    import urllib.error
+    import urllib.request
+
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def cmd_submit(args: argparse.Namespace) -> int:
+    body = {'model': args.model}
+
+    try:
+        if args.overrides:
+            body['overrides'] = json.loads(args.overrides)
+
+        if args.config:
+            body['config'] = json.loads(args.config)
+
+    except ValueError as e:
+        print('error: JSON inválido: %s' % e, file=sys.stderr)
+        return 2
+
+    code, job = request(args.url.rstrip('/') + '/jobs', body)
+
+    if code != 201:
+        print('error: %s' % job.get('error'), file=sys.stderr)
+        return 1
+
+    print('Trabajo %d encolado (%d variables)' % (job['ID'], job['Size']))
+
+    if not args.wait:
+        return 0
+
+    while job['State'] in ('queued', 'running'):
+        time.sleep(1)
+        _, job = request('%s/jobs/%d' % (args.url.rstrip('/'), job['ID']))
+
+    print('Trabajo %d %s: %s %s (espera %.3f s, ejecución %.3f s)' % (job['ID'], job['State'], job['Objective'],
+          job['Error'] or job['Termination_Condition'], job['Started'] - job['Submitted'], job['Finished'] - job['Started']))
+
+    return 0 if job['State'] == 'done' else 1
+
+
+def cmd_status(args: argparse.Namespace) -> int:
+    path = '/metrics' if args.job is None else '/jobs/%d' % args.job
+    code, rslt = request(args.url.rstrip('/') + path)
+
+    print(json.dumps(rslt, indent=2, ensure_ascii=False))
+
+    return 0 if code == 200 else 1
+
+
+def cmd_memory_bench(args: argparse.Namespace) -> int:
+    from campaign import benchmark_memory
+
+    model_ids = parse_model_ids(args.models, load_models_id(args.db))
+    configs = load_solvers(args.solvers)
+
+    if args.pipeline:
+        print('error: memory-bench no usa --pipeline', file=sys.stderr)
+        return 2
+
+    def progress(sample):
+        jobs, rss, traced = sample
+        print('%6d trabajos  RSS %8.1f MiB%s' % (jobs, (rss or 0) / 2**20,
+                                                 '' if traced is None else '  Python %8.1f MiB' % (traced / 2**20)))
+
+    start = time.time()
+    report = benchmark_memory(model_ids, configs, args.solves, args.workers, every=args.every, progress=progress,
+                              persist=args.persist, evaluate_csv=False, **job_kwargs(args), **memory_kwargs(args))
+    elapsed = time.time() - start
+
+    print('Trabajos: %d (%d con error) en %.1f s' % (args.solves, report['Errors'], elapsed))
+    print('Reciclados del grupo de workers: %d' % report['Recycled'])
+    print('Crecimiento del RSS en la segunda mitad: %.1f KiB cada 1000 trabajos' % (report['Slope'] / 1024))
+
+    failures = []
+
+    if report['Slope'] / 1024 > args.max_slope:
+        failures.append('el RSS crece más de %.1f KiB cada 1000 trabajos' % args.max_slope)
+
+    peak = max((rss or 0 for _, rss, _ in report['Samples']), default=0)
+
+    if args.max_rss is not None and peak > args.max_rss * 2**20:
+        failures.append('el RSS máximo (%.1f MiB) supera %.1f MiB' % (peak / 2**20, args.max_rss))
+
+    for failure in failures:
+        print('FALLO', failure)
+
+    return 1 if failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='pei-opt', description='Optimización de parques eco-industriales (EIP)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='resolver modelos y guardar los resultados')
+    add_job_arguments(run)
+    run.add_argument('-q', '--quiet', action='store_true', help='no imprimir el progreso de cada trabajo')
+    run.add_argument('-o', '--output', default=None, help='archivo .csv donde guardar el resumen de resultados')
+    run.add_argument('--no-evaluate', action='store_true', help='no guardar la evaluación de restricciones en data_csv/')
+    run.add_argument('--fp-tol', type=float, default=None, help='guardar solo los Fp mayores que esta tolerancia (almacenamiento disperso)')
+    run.add_argument('--auto', type=int, default=0, metavar='K',
+                     help='ejecutar en cada modelo solo las K configuraciones que mejor resultado dieron en modelos parecidos')
+    run.set_defaults(func=cmd_run)
+
+    bench = subparsers.add_parser('bench', help='medir el throughput sin guardar resultados')
+    add_job_arguments(bench)
+    bench.add_argument('--compare', action='store_true', help='medir también el bucle serie con los mismos trabajos')
+    bench.add_argument('--persist', action='store_true', help='guardar los resultados (incluye la escritura en la base de datos)')
+    bench.set_defaults(func=cmd_bench)
+
+    m_bench = subparsers.add_parser('memory-bench', help='medir la memoria de los procesos que resuelven en una campaña larga')
+    add_job_arguments(m_bench)
+    m_bench.add_argument('-n', '--solves', type=int, default=1000, help='cantidad de trabajos (se repiten los modelos y configuraciones)')
+    m_bench.add_argument('--every', type=int, default=100, help='trabajos entre muestras')
+    m_bench.add_argument('--persist', action='store_true', help='guardar los resultados en la base de datos')
+    m_bench.add_argument('--max-slope', type=float, default=MAX_RSS_SLOPE, metavar='KIB',
+                         help='crecimiento del RSS (KiB cada 1000 trabajos) a partir del cual el comando falla')
+    m_bench.add_argument('--max-rss', type=float, default=None, metavar='MIB',
+                         help='RSS máximo de los procesos que resuelven a partir del cual el comando falla')
+    m_bench.set_defaults(func=cmd_memory_bench)
+
+    p_bench = subparsers.add_parser('persistent-bench', help='medir la sobrecarga por re-solve con y sin interfaz persistente')
+    p_bench.add_argument('-m', '--model', type=int, default=1, help='modelo a resolver')
+    p_bench.add_argument('-s', '--solver', default='appsi_highs', help='subsolver con interfaz persistente')
+    p_bench.add_argument('-n', '--solves', type=int, default=20, help='resoluciones del barrido de cargas M')
+    p_bench.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    p_bench.set_defaults(func=cmd_persistent_bench)
+
+    verify = subparsers.add_parser('verify', help='verificar tiempos de importación, la base de datos y las filas KKT')
+    verify.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    verify.add_argument('--kkt-model', type=int, default=None,
+                        help='modelo cuyas filas KKT se comparan con lagrangian_expr (por defecto el de menor id, 0 para omitir)')
+    verify.set_defaults(func=cmd_verify)
+
+    sens = subparsers.add_parser('sensitivity', help='resolver un modelo e imprimir el análisis de sensibilidad de sus parámetros')
+    sens.add_argument('-m', '--model', type=int, default=1, help='modelo a resolver')
+    sens.add_argument('-s', '--solver', default='lpcc_bb', help='solver a utilizar')
+    sens.add_argument('--transformation', default='', help='transformación de pyomo a aplicar antes de resolver')
+    sens.add_argument('--options', default='', help="opciones del solver ('clave=valor clave=valor')")
+    sens.add_argument('-p', '--parameters', default=None,
+                      help="parámetros separados por comas, p. ej. 'alpha,beta' (por defecto todos)")
+    sens.add_argument('-t', '--time-limit', type=float, default=None, help='tiempo límite del solve en segundos')
+    sens.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    sens.add_argument('--tee', action='store_true', help='mostrar la salida del solver en la consola')
+    sens.set_defaults(func=cmd_sensitivity)
+
+    auto_eval = subparsers.add_parser('auto-eval', help='evaluar el modo auto con el historial dejando un modelo afuera')
+    auto_eval.add_argument('-s', '--solvers', default=None, help='archivo JSON con las configuraciones candidatas')
+    auto_eval.add_argument('-k', '--top-k', type=int, default=1, help='configuraciones elegidas por modelo')
+    auto_eval.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    auto_eval.set_defaults(func=cmd_auto_eval)
+
+    imp = subparsers.add_parser('import', help='importar parques desde archivos .csv o .xlsx')
+    imp.add_argument('files', nargs='+', help='archivos con una fila por proceso (ID_M, Alpha, Beta, Delta, ID_EP, ID_P, Cmax_in, Cmax_out, M)')
+    imp.add_argument('--db', default=DB_PATH, help='ruta de la base de datos')
+    imp.add_argument('--new-ids', action='store_true', help='asignar identificadores nuevos a los modelos importados')
+    imp.add_argument('--chunk-size', type=int, default=5000, help='filas por cada inserción en bloque')
+    imp.set_defaults(func=cmd_import)
+
+    imp_bench = subparsers.add_parser('import-bench', help='medir el throughput de la importación con parques sintéticos')
+    imp_bench.add_argument('-n', '--models', type=int, default=1000, help='cantidad de modelos')
+    imp_bench.add_argument('-p', '--processes', type=int, default=15, help='procesos por modelo')
+    imp_bench.add_argument('--db', default='import_bench.db', help='base de datos temporal (se borra al terminar)')
+    imp_bench.add_argument('--chunk-size', type=int, default=5000, help='filas por cada inserción en bloque')
+    imp_bench.add_argument('--compare', action='store_true', help='medir también la inserción fila por fila')
+    imp_bench.add_argument('--load', action='store_true', help='medir también la carga de los modelos (Data y DataSet)')
+    imp_bench.set_defaults(func=cmd_import_bench)
+
+    st_bench = subparsers.add_parser('storage-bench', help='comparar el almacenamiento denso y disperso de Fp')
+    st_bench.add_argument('-p', '--processes', type=int, default=100, help='procesos del modelo')
+    st_bench.add_argument('-r', '--runs', type=int, default=20, help='cantidad de resultados guardados')
+    st_bench.add_argument('--fp-tol', type=float, default=1e-3, help='tolerancia del almacenamiento disperso')
+    st_bench.add_argument('--density', type=float, default=0.02, help='fracción de tuberías con flujo')
+    st_bench.add_argument('--db', default='storage_bench.db', help='base de datos temporal (se borra al terminar)')
+    st_bench.set_defaults(func=cmd_storage_bench)
+
+    serve_p = subparsers.add_parser('serve', help='servicio local de trabajos con cola persistente y API HTTP')
+    serve_p.add_argument('--host', default='127.0.0.1', help='dirección donde escuchar')
+    serve_p.add_argument('--port', type=int, default=8765, help='puerto')
+    serve_p.add_argument('--queue', default='database/jobs.db', help='base de datos de la cola')
+    serve_p.add_argument('--db', default=DB_PATH, help='ruta de la base de datos de los modelos')
+    serve_p.add_argument('-w', '--workers', type=int, default=2, help='procesos que resuelven')
+    serve_p.add_argument('--capacity', type=int, default=200_000,
+                         help='tamaño estimado total (variables) de los trabajos que se ejecutan a la vez')
+    serve_p.add_argument('-s', '--solvers', default=None, help='archivo JSON cuya primera configuración se usa por defecto')
+    serve_p.add_argument('-t', '--time-limit', type=float, default=None, help='tiempo límite por solve en segundos')
+    serve_p.add_argument('-i', '--iter-limit', type=int, default=None, help='límite de iteraciones por solve')
+    serve_p.add_argument('-b', '--build-workers', type=int, default=1,
+                         help='procesos que calculan las filas KKT de las empresas al construir cada modelo')
+    serve_p.add_argument('--fp-tol', type=float, default=None, help='guardar solo los Fp mayores que esta tolerancia')
+    serve_p.add_argument('-v', '--verbose', action='store_true', help='registrar cada petición en la consola')
+    serve_p.set_defaults(func=cmd_serve)
+
+    submit = subparsers.add_parser('submit', help='enviar un escenario al servicio de trabajos')
+    submit.add_argument('-m', '--model', type=int, required=True, help='modelo a resolver')
+    submit.add_argument('-p', '--overrides', default=None,
+                        help='JSON con los parámetros que se reemplazan, p. ej. \'{"alpha": 0.6, "M": {"1,2": 120}}\'')
+    submit.add_argument('-c', '--config', default=None, help='JSON con la configuración de solver (por defecto la del servicio)')
+    submit.add_argument('--url', default='http://127.0.0.1:8765', help='dirección del servicio')
+    submit.add_argument('--wait', action='store_true', help='esperar a que termine el trabajo')
+    submit.set_defaults(func=cmd_submit)
+
+    status = subparsers.add_parser('status', help='estado de un trabajo o métricas del servicio de trabajos')
+    status.add_argument('job', type=int, nargs='?', default=None, help='trabajo (sin él se muestran las métricas de la cola)')
+    status.add_argument('--url', default='http://127.0.0.1:8765', help='dirección del servicio')
+    status.set_defaults(func=cmd_status)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import time
+
+from pyomo.environ import SolverFactory, TransformationFactory, Suffix, value
+from pyomo.mpec import Complementarity
+
+from limits import (COMP_TOL, ITERATION_LIMIT, LIMIT_OPTIONS, TIME_LIMIT, complementarity_pairs,
+                    complementarity_violation, limit_options, limit_termination, max_violation, original_rows,
+                    restore, snapshot)
+from persistent import PersistentSolver, persistent_solver, record, reported_time, resolve_stats
+from scaling import is_scaled, scale_rows
+
+# Valores por defecto del esquema de relajación
+EPSILON_INITIAL = 1.0
+EPSILON_FINAL = 1e-8
+FACTOR = 0.1
+OBJ_TOL = 1e-6
+
+
+def solve_continuation(instance, options: dict, tee: bool = False, time_limit: float = None,
+                       iter_limit: int = None, feasibility_tol: float = 1e-5, stats: dict = None):
+    '''
+    Resuelve una secuencia de problemas con la complementariedad relajada (v * g <= epsilon),
+    reduciendo epsilon en cada etapa y partiendo de la solución (primal y dual) de la etapa anterior.
+    Se detiene cuando epsilon llega a epsilon_final o cuando el objetivo se estabiliza y la violación
+    de complementariedad es menor que comp_tol
+
+    :param instance: instancia de un modelo de pyomo
+    :param options: opciones del esquema (solver, epsilon_initial, epsilon_final, factor, obj_tol, comp_tol,
+                    persistent) y del subsolver (el resto); con persistent=1 el subsolver mantiene el modelo
+                    cargado entre etapas y solo recibe el nuevo epsilon (el arranque en caliente es solo primal)
+    :param tee: mostrar la salida del subsolver en la consola
+    :param time_limit: tiempo límite total en segundos
+    :param iter_limit: límite de iteraciones de cada etapa
+    :param feasibility_tol: tolerancia de factibilidad de los puntos aceptados: una etapa solo se acepta si las
+                            restricciones originales se cumplen con esta tolerancia y la violación de
+                            complementariedad es menor que comp_tol; los puntos relajados quedan solo en 'stages'
+    :param stats: diccionario donde se guardan los resultados de cada etapa en 'stages' y el tiempo del
+                  subsolver y la sobrecarga de sus llamadas en 'solves' (None para no guardarlos)
+    :return: tupla (condición de parada, estado del solver, tiempo, punto factible encontrado)
+    '''
+
+    start = time.time()
+    options = dict(options)
+
+    subsolver = options.pop('solver', 'ipopt')
+    epsilon = options.pop('epsilon_initial', EPSILON_INITIAL)
+    epsilon_final = options.pop('epsilon_final', EPSILON_FINAL)
+    factor = options.pop('factor', FACTOR)
+    obj_tol = options.pop('obj_tol', OBJ_TOL)
+    comp_tol = options.pop('comp_tol', COMP_TOL)
+    persistent = options.pop('persistent', 0)
+
+    pairs = complementarity_pairs(instance)
+
+    TransformationFactory('mpec.simple_nonlinear').apply_to(instance)
+    rows = original_rows(instance)
+
+    if is_scaled(instance):
+        scale_rows(instance)
+
+    # las interfaces persistentes no leen el suffix scaling_factor ni los multiplicadores de ipopt
+    opt = persistent_solver(subsolver, instance) if persistent and not is_scaled(instance) else None
+
+    if opt is None:
+        opt = SolverFactory(subsolver)
+        solves = resolve_stats('file')
+
+    else:
+        solves = opt.stats
+
+    warm_start = subsolver == 'ipopt' and not isinstance(opt, PersistentSolver)
+
+    if warm_start:
+        # multiplicadores de las cotas y de las restricciones para el arranque en caliente de ipopt
+        instance.ipopt_zL_out = Suffix(direction=Suffix.IMPORT)
+        instance.ipopt_zU_out = Suffix(direction=Suffix.IMPORT)
+        instance.ipopt_zL_in = Suffix(direction=Suffix.EXPORT)
+        instance.ipopt_zU_in = Suffix(direction=Suffix.EXPORT)
+        instance.dual = Suffix(direction=Suffix.IMPORT_EXPORT)
+
+    stages = []
+    best = None
+    termination_condition = None
+    solver_status = None
+    prev_obj = None
+
+    while True:
+        remaining = None
+
+        if time_limit is not None:
+            remaining = time_limit - (time.time() - start)
+
+            if remaining <= 0:
+                termination_condition = TIME_LIMIT
+                break
+
+        instance.mpec_bound.set_value(epsilon)
+
+        stage_start = time.time()
+
+        if isinstance(opt, PersistentSolver):
+            termination_condition, solver_status, _, found = opt.solve(options, tee, remaining, iter_limit)
+
+        else:
+            for key, val in dict(options, **limit_options(subsolver, remaining, iter_limit)).items():
+                opt.options[key] = val
+
+            if warm_start and stages:
+                opt.options['warm_start_init_point'] = 'yes'
+                opt.options['warm_start_bound_push'] = 1e-9
+                opt.options['warm_start_mult_bound_push'] = 1e-9
+                opt.options['mu_init'] = max(epsilon, 1e-9)
+
+                instance.ipopt_zL_in.update(instance.ipopt_zL_out)
+                instance.ipopt_zU_in.update(instance.ipopt_zU_out)
+
+            # como en solve_meta, timelimit solo se usa en los backends sin opción de tiempo propia
+            timelimit = remaining if LIMIT_OPTIONS.get(subsolver, (None, ))[0] is None else None
+
+            results = opt.solve(instance, tee=tee, timelimit=timelimit, load_solutions=False)
+            record(solves, time.time() - stage_start, reported_time(results))
+
+            solver_status = results.solver.status
+            termination_condition = limit_termination(results) or results.solver.termination_condition
+            found = len(results.solution) > 0
+
+            if found:
+                instance.solutions.load_from(results)
+
+        obj = None
+        comp = None
+
+        if found:
+            obj = value(instance.upper_level_objective)
+            comp = complementarity_violation(pairs)
+
+            # un punto de la relajación no es solución del MPEC hasta que la complementariedad se cumple
+            if comp <= comp_tol and max_violation(instance, rows) <= feasibility_tol:
+                best = snapshot(instance)
+
+        stages.append({'Stage': len(stages) + 1, 'Epsilon': epsilon, 'Objective': obj, 'Comp_Violation': comp,
+                       'Time': time.time() - stage_start, 'Termination': str(termination_condition)})
+
+        if termination_condition in (TIME_LIMIT, ITERATION_LIMIT) or obj is None:
+            break
+
+        # objetivo estable y complementariedad satisfecha: no hace falta seguir ajustando epsilon
+        if prev_obj is not None and abs(obj - prev_obj) <= obj_tol * max(1.0, abs(prev_obj)) and comp <= comp_tol:
+            break
+
+        prev_obj = obj
+        epsilon *= factor
+
+        if epsilon < epsilon_final:
+            break
+
+    # reclasificar los componentes de complementariedad como lo hace el meta-solver mpec_nlp
+    for cuid in instance._transformation_data['mpec.simple_nonlinear'].compl_cuids:
+        cobj = cuid.find_component_on(instance)
+        cobj.parent_block().reclassify_component_type(cobj, Complementarity)
+
+    if best is not None:
+        restore(best)
+
+    if stats is not None:
+        stats['stages'] = stages
+        stats['solves'] = solves
+
+    return termination_condition, solver_status, time.time() - start, best is not None
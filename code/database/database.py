@@ -1,71 +1,168 @@
 import sqlite3
 
-# Conectarse a la base de datos o crearla si no existe
-conn = sqlite3.connect('database/database.db')
-
-# Crear un cursor para ejecutar consultas
-cursor = conn.cursor()
-
-# Modelo
-cursor.execute(''' CREATE TABLE IF NOT EXISTS Modelo (
-                        ID_M INTEGER PRIMARY KEY NOT NULL UNIQUE, 
-                        Alpha REAL NOT NULL, 
-                        Beta REAL NOT NULL, 
-                        Delta REAL NOT NULL) ''')
-
-# # Empresa_Proceso
-cursor.execute(''' CREATE TABLE IF NOT EXISTS Empresa_Proceso (
-                        ID_M INTEGER, 
-                        ID_EP INTEGER NOT NULL, 
-                        ID_P INTEGER NOT NULL, 
-                        Cmax_in REAL, 
-                        Cmax_out REAL,
-                        M REAL, 
-                        PRIMARY KEY(ID_M, ID_EP, ID_P), 
-                        FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M)) ''')
-
-cursor.execute(''' CREATE TABLE IF NOT EXISTS Fw_Results (
-                        ID_M INTEGER, 
-                        ID_EP INTEGER NOT NULL, 
-                        ID_P INTEGER NOT NULL, 
-                        Solver STRING,
-                        Transformation STRING,
-                        Options STRING,
-                        Fw REAL,
-                        PRIMARY KEY(ID_M, ID_EP, ID_P, Solver),
-                        FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M)) ''')
-
-
-cursor.execute(''' CREATE TABLE IF NOT EXISTS Fp_Results (
-                        ID_M INTEGER,
-                        ID_EP1 INTEGER, 
-                        ID_P1 INTEGER, 
-                        ID_M2 INTEGER,
-                        ID_EP2 INTEGER, 
-                        ID_P2 INTEGER, 
-                        Solver STRING,
-                        Transformation STRING,
-                        Options STRING,
-                        Fp REAL,
-                        PRIMARY KEY(ID_M, Solver, Transformation, Options, ID_EP1, ID_P1, ID_EP2, ID_P2),
-                        FOREIGN KEY(ID_M, ID_EP1, ID_P1) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P),
-                        FOREIGN KEY(ID_M2, ID_EP2, ID_P2) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P),
-                        CHECK (ID_M = ID_M2))''')
-
-
-# results
-cursor.execute(''' CREATE TABLE IF NOT EXISTS Results_Info (
-                        ID_M INTEGER,
-                        Solver STRING,
-                        Transformation STRING,
-                        Options STRING,
-                        Total_Fw FLOAT, 
-                        Termination_Condition STRING,
-                        Solver_Status STRING,
-                        Time FLOAT,
-                        PRIMARY KEY(ID_M, Solver, Transformation, Options),
-                        FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M))''')
-
-conn.commit()
-
-conn.close()
+# Tablas de la base de datos
+SCHEMA = [
+    # Modelo
+    ''' CREATE TABLE IF NOT EXISTS Modelo (
+                ID_M INTEGER PRIMARY KEY NOT NULL UNIQUE, 
+                Alpha REAL NOT NULL, 
+                Beta REAL NOT NULL, 
+                Delta REAL NOT NULL) ''',
+
+    # # Empresa_Proceso
+    ''' CREATE TABLE IF NOT EXISTS Empresa_Proceso (
+                ID_M INTEGER, 
+                ID_EP INTEGER NOT NULL, 
+                ID_P INTEGER NOT NULL, 
+                Cmax_in REAL, 
+                Cmax_out REAL,
+                M REAL, 
+                PRIMARY KEY(ID_M, ID_EP, ID_P), 
+                FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M)) ''',
+
+    # Conexion: tuberías permitidas entre procesos (si un modelo no tiene filas la red es completa)
+    ''' CREATE TABLE IF NOT EXISTS Conexion (
+                ID_M INTEGER,
+                ID_EP1 INTEGER NOT NULL,
+                ID_P1 INTEGER NOT NULL,
+                ID_EP2 INTEGER NOT NULL,
+                ID_P2 INTEGER NOT NULL,
+                Capacidad REAL,
+                Costo_Bombeo REAL,
+                PRIMARY KEY(ID_M, ID_EP1, ID_P1, ID_EP2, ID_P2),
+                FOREIGN KEY(ID_M, ID_EP1, ID_P1) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P),
+                FOREIGN KEY(ID_M, ID_EP2, ID_P2) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P)) ''',
+
+    ''' CREATE TABLE IF NOT EXISTS Fw_Results (
+                ID_M INTEGER, 
+                ID_EP INTEGER NOT NULL, 
+                ID_P INTEGER NOT NULL, 
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Fw REAL,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options, ID_EP, ID_P),
+                FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M)) ''',
+
+    ''' CREATE TABLE IF NOT EXISTS Fp_Results (
+                ID_M INTEGER,
+                ID_EP1 INTEGER, 
+                ID_P1 INTEGER, 
+                ID_M2 INTEGER,
+                ID_EP2 INTEGER, 
+                ID_P2 INTEGER, 
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Fp REAL,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options, ID_EP1, ID_P1, ID_EP2, ID_P2),
+                FOREIGN KEY(ID_M, ID_EP1, ID_P1) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P),
+                FOREIGN KEY(ID_M2, ID_EP2, ID_P2) REFERENCES Empresa_Proceso(ID_M, ID_EP, ID_P),
+                CHECK (ID_M = ID_M2))''',
+
+    # Almacenamiento de los Fp de cada resultado: con Sparse=1 Fp_Results solo tiene los |Fp| > Tolerance.
+    # Arc_Set es la lista JSON de tuberías del modelo resuelto (NULL para la red completa)
+    ''' CREATE TABLE IF NOT EXISTS Fp_Storage (
+                ID_M INTEGER,
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Sparse INTEGER,
+                Tolerance FLOAT,
+                Arcs INTEGER,
+                Nonzeros INTEGER,
+                Arc_Set STRING,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options),
+                FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M))''',
+
+    # results
+    ''' CREATE TABLE IF NOT EXISTS Results_Info (
+                ID_M INTEGER,
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Total_Fw FLOAT, 
+                Termination_Condition STRING,
+                Solver_Status STRING,
+                Time FLOAT,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options),
+                FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M))''',
+
+    # Etapas del esquema de relajación progresiva (mpec_continuation)
+    ''' CREATE TABLE IF NOT EXISTS Stage_Results (
+                ID_M INTEGER,
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Stage INTEGER,
+                Epsilon FLOAT,
+                Objective FLOAT,
+                Comp_Violation FLOAT,
+                Time FLOAT,
+                Termination_Condition STRING,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options, Stage),
+                FOREIGN KEY(ID_M) REFERENCES Modelo(ID_M))''',
+
+    # Puntos iniciales de la búsqueda multi-start: distribución del objetivo del resultado en Results_Info
+    ''' CREATE TABLE IF NOT EXISTS Start_Results (
+                ID_M INTEGER,
+                Solver STRING,
+                Transformation STRING,
+                Options STRING,
+                Start INTEGER,
+                Seed INTEGER,
+                Objective FLOAT,
+                Cutoff FLOAT,
+                Time FLOAT,
+                Termination_Condition STRING,
+                PRIMARY KEY(ID_M, Solver, Transformation, Options, Start),
+                FOREIGN KEY(ID_M, Solver, Transformation, Options) REFERENCES Results_Info(ID_M, Solver, Transformation, Options))''',
+]
+
+
+def migrate_fw_results(cursor: sqlite3.Cursor) -> None:
+    '''
+    Cambia la clave de Fw_Results de las bases de datos creadas con la clave (ID_M, ID_EP, ID_P, Solver), que
+    solo guardaba los Fw de la primera transformación u opciones de cada solver, por la del resto de las tablas
+    de resultados. Las filas existentes se conservan
+
+    :param cursor: cursor de la base de datos
+    '''
+
+    key = [row[1] for row in sorted(cursor.execute('PRAGMA table_info(Fw_Results)'), key=lambda row: row[5]) if row[5]]
+
+    if not key or 'Options' in key:
+        return
+
+    cursor.execute('ALTER TABLE Fw_Results RENAME TO Fw_Results_Old')
+    cursor.execute(next(sql for sql in SCHEMA if 'TABLE IF NOT EXISTS Fw_Results' in sql))
+    cursor.execute('INSERT INTO Fw_Results (ID_M, ID_EP, ID_P, Solver, Transformation, Options, Fw) '
+                   'SELECT ID_M, ID_EP, ID_P, Solver, Transformation, Options, Fw FROM Fw_Results_Old')
+    cursor.execute('DROP TABLE Fw_Results_Old')
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    '''
+    Crea las tablas que no existan en la base de datos y actualiza las claves de las tablas antiguas
+
+    :param conn: conexión a la base de datos
+    '''
+
+    cursor = conn.cursor()
+
+    migrate_fw_results(cursor)
+
+    for sql in SCHEMA:
+        cursor.execute(sql)
+
+    conn.commit()
+    cursor.close()
+
+
+if __name__ == '__main__':
+    # Conectarse a la base de datos o crearla si no existe
+    conn = sqlite3.connect('database/database.db')
+
+    create_tables(conn)
+
+    conn.close()
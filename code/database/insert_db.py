@@ -1,51 +1,433 @@
+import csv
+import os
+import re
 import sqlite3
+import time
 
-# # Conectarse a la base de datos o crearla si no existe
-# conn = sqlite3.connect('database.db')
+from database.database import create_tables
 
-# # Crear un cursor para ejecutar consultas
-# cursor = conn.cursor()
+# Filas por cada executemany
+CHUNK_SIZE = 5000
 
-# cursor.execute('INSERT INTO modelo (columna1, columna2, columna3) VALUES (?, ?, ?)',
-#                ('valor1', 'valor2', 'valor3'))
+# Columnas de los parques (una fila por proceso, los parámetros del modelo se repiten en cada fila)
+MODEL_COLUMNS = ('Alpha', 'Beta', 'Delta')
+PROCESS_COLUMNS = ('ID_EP', 'ID_P', 'Cmax_in', 'Cmax_out', 'M')
 
-def insert_Fpart_result(id_modelo: int, id_ep_1: int, id_p_1: int, id_ep_2: int, id_p_2: int, solver: str, fpart: float):
+# Nombres alternativos de las columnas en las planillas (p. ej. las hojas de Resultados.xlsx)
+ALIASES = {
+    'id_m': 'ID_M', 'modelo': 'ID_M', 'model': 'ID_M',
+    'alpha': 'Alpha', 'alfa': 'Alpha', 'beta': 'Beta', 'delta': 'Delta',
+    'id_ep': 'ID_EP', 'ep': 'ID_EP', 'id_p': 'ID_P', 'p': 'ID_P',
+    'cmax_in': 'Cmax_in', 'cmax_out': 'Cmax_out', 'm': 'M',
+}
+
+
+def column_name(cell) -> str:
+    '''
+    Nombre normalizado de una columna (None si no es una columna de los parques)
+    '''
+
+    if cell is None:
+        return None
+
+    return ALIASES.get(str(cell).strip().lower())
+
+
+def parse_rows(rows, model: str = None, source: str = ''):
     '''
-    Inserta en la base de datos los valores de las variables Fpart
-    obtenidos al resolver un modelo de EIP con un solver específico
+    Recorre las filas de una hoja y genera un diccionario por proceso. Una fila con alguna columna
+    conocida es un encabezado y las filas siguientes, hasta una fila vacía, forman su tabla:
+
+    - encabezado con Alpha, Beta y Delta (sin ID_EP): define los parámetros de las tablas siguientes,
+      como en las hojas de Resultados.xlsx
+    - encabezado con ID_EP, ID_P, Cmax_in, Cmax_out y M: una fila por proceso
+    - cualquier otro encabezado (p. ej. la tabla de Fp de Resultados.xlsx): la tabla se ignora
+
+    Las columnas desconocidas (p. ej. resultados) y las filas fuera de una tabla se ignoran
+
+    :param rows: iterable de listas de celdas
+    :param model: identificador del modelo de las filas sin ID_M (p. ej. el de la hoja)
+    :param source: nombre del archivo u hoja para los mensajes de error
+    :return: generador de tuplas (ubicación de la fila, diccionario con las columnas de la fila)
+    '''
+
+    header = None
+    params = dict()
+
+    for line, cells in enumerate(rows, start=1):
+        cells = ['' if cell is None else str(cell).strip() for cell in cells]
+
+        if not any(cells):
+            header = None
+            continue
+
+        names = [column_name(cell) for cell in cells]
+
+        if any(names):
+            header = names
+            continue
+
+        if header is None:
+            continue
+
+        row = {name: cell for name, cell in zip(header, cells) if name is not None and cell != ''}
+
+        if all(col in header for col in PROCESS_COLUMNS):
+            row = {**params, **row}
+            row.setdefault('ID_M', model)
+
+            yield '%s fila %d' % (source, line), row
+
+        elif 'ID_EP' not in header and all(col in header for col in MODEL_COLUMNS):
+            params.update(row)
+
+
+def read_csv(path: str):
+    '''
+    Lee un .csv con una fila por proceso
+
+    :param path: ruta del archivo
+    :return: generador de tuplas (ubicación de la fila, diccionario con las columnas de la fila)
+    '''
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from parse_rows(csv.reader(f), source=path)
+
+
+def read_xlsx(path: str):
+    '''
+    Lee todas las hojas de un .xlsx. Las filas sin ID_M toman el número del nombre de la hoja
+    ('Modelo 3' -> 3) o, si no tiene, el nombre de la hoja
+
+    :param path: ruta del archivo
+    :return: generador de tuplas (ubicación de la fila, diccionario con las columnas de la fila)
+    '''
+
+    try:
+        import openpyxl
+
+    except ImportError:
+        raise ImportError('leer archivos .xlsx requiere openpyxl (pip install openpyxl)') from None
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+    try:
+        for sheet in workbook.worksheets:
+            number = re.search(r'\d+', sheet.title)
+            model = number.group() if number else sheet.title
+
+            yield from parse_rows(sheet.iter_rows(values_only=True), model, '%s [%s]' % (path, sheet.title))
+
+    finally:
+        workbook.close()
+
+
+def read_file(path: str):
+    '''
+    Lee un archivo de parques según su extensión (.csv o .xlsx)
+    '''
+
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == '.csv':
+        return read_csv(path)
+
+    if ext in ('.xlsx', '.xlsm'):
+        return read_xlsx(path)
+
+    raise ValueError('formato no soportado: %s' % path)
+
+
+def validate(row: dict, where: str = '') -> tuple:
+    '''
+    Valida y convierte una fila de proceso
+
+    :param row: diccionario con las columnas de la fila
+    :param where: ubicación de la fila para los mensajes de error
+    :return: tupla (identificador del modelo en el archivo, (Alpha, Beta, Delta), (ID_EP, ID_P, Cmax_in, Cmax_out, M))
+    '''
+
+    missing = [col for col in ('ID_M', ) + MODEL_COLUMNS + PROCESS_COLUMNS if row.get(col) in (None, '')]
+
+    if missing:
+        raise ValueError('%s: faltan las columnas %s' % (where, ', '.join(missing)))
+
+    try:
+        params = tuple(float(row[col]) for col in MODEL_COLUMNS)
+        ep, p = (float(row[col]) for col in ('ID_EP', 'ID_P'))
+        c_in, c_out, m = (float(row[col]) for col in ('Cmax_in', 'Cmax_out', 'M'))
+
+    except ValueError as e:
+        raise ValueError('%s: valor no numérico (%s)' % (where, e)) from None
+
+    if any(val < 0 for val in params):
+        raise ValueError('%s: Alpha, Beta y Delta deben ser no negativos' % where)
+
+    if not (ep.is_integer() and p.is_integer() and ep > 0 and p > 0):
+        raise ValueError('%s: ID_EP e ID_P deben ser enteros positivos' % where)
+
+    if c_in < 0 or m < 0:
+        raise ValueError('%s: Cmax_in y M deben ser no negativos' % where)
+
+    if c_out <= 0:
+        raise ValueError('%s: Cmax_out debe ser positivo' % where)
+
+    return str(row['ID_M']).strip(), params, (int(ep), int(p), c_in, c_out, m)
+
+
+def model_number(label: str) -> int:
+    '''
+    Identificador entero de un modelo ('3' o '3.0' -> 3), None si la etiqueta no es un entero positivo
+    '''
+
+    try:
+        number = float(label)
+
+    except ValueError:
+        return None
+
+    return int(number) if number.is_integer() and number > 0 else None
+
+
+def next_model_id(conn: sqlite3.Connection) -> int:
+    '''
+    Primer identificador de modelo libre en la base de datos
+    '''
+
+    return conn.execute(' SELECT COALESCE(MAX(ID_M), 0) + 1 FROM Modelo ').fetchone()[0]
 
+
+def import_models(conn: sqlite3.Connection, rows, new_ids: bool = False, chunk_size: int = CHUNK_SIZE) -> dict:
+    '''
+    Inserta parques en las tablas Modelo y Empresa_Proceso en una sola transacción. Las filas se
+    validan a medida que se leen y se insertan en bloques de chunk_size con executemany; si alguna es
+    inválida no se inserta ningún modelo
+
+    :param conn: conexión a la base de datos
+    :param rows: iterable de tuplas (ubicación de la fila, diccionario con las columnas de la fila)
+    :param new_ids: si es True el ID_M del archivo es solo una etiqueta y los modelos reciben
+                    identificadores nuevos a partir del primero libre
+    :param chunk_size: filas por cada executemany
+    :return: diccionario {ID_M del archivo: ID_M en la base de datos}
+    '''
+
+    create_tables(conn)
+
+    models = dict()  # ID_M del archivo -> (ID_M, (Alpha, Beta, Delta))
+    processes = set()
+
+    model_rows = []
+    process_rows = []
+
+    def flush() -> None:
+        conn.executemany(' INSERT INTO Modelo (ID_M, Alpha, Beta, Delta) VALUES (?, ?, ?, ?) ', model_rows)
+        conn.executemany(' INSERT INTO Empresa_Proceso (ID_M, ID_EP, ID_P, Cmax_in, Cmax_out, M) VALUES (?, ?, ?, ?, ?, ?) ',
+                         process_rows)
+
+        model_rows.clear()
+        process_rows.clear()
+
+    with conn:
+        next_id = next_model_id(conn)
+        existing = {row[0] for row in conn.execute(' SELECT ID_M FROM Modelo ')}
+
+        for where, row in rows:
+            label, params, process = validate(row, where)
+
+            if not new_ids:
+                label = model_number(label)
+
+                if label is None:
+                    raise ValueError('%s: ID_M %r no es un entero positivo (use new_ids)' % (where, row['ID_M']))
+
+            if label not in models:
+                if new_ids:
+                    model_id = next_id
+                    next_id += 1
+
+                else:
+                    model_id = label
+
+                if model_id in existing:
+                    raise ValueError('%s: el modelo %d ya existe' % (where, model_id))
+
+                models[label] = (model_id, params)
+                existing.add(model_id)
+                model_rows.append((model_id, ) + params)
+
+            model_id, model_params = models[label]
+
+            if params != model_params:
+                raise ValueError('%s: Alpha, Beta y Delta distintos en el modelo %s' % (where, label))
+
+            if (model_id, ) + process[:2] in processes:
+                raise ValueError('%s: proceso %s repetido en el modelo %s' % (where, process[:2], label))
+
+            processes.add((model_id, ) + process[:2])
+            process_rows.append((model_id, ) + process)
+
+            if len(process_rows) >= chunk_size:
+                flush()
+
+        flush()
+
+    return {label: model_id for label, (model_id, _) in models.items()}
+
+
+def import_files(paths: list, db_path: str, new_ids: bool = False, chunk_size: int = CHUNK_SIZE) -> dict:
+    '''
+    Importa los parques de varios archivos .csv o .xlsx en una sola transacción
+
+    :param paths: rutas de los archivos
+    :param db_path: ruta de la base de datos
+    :param new_ids: asignar identificadores nuevos a los modelos (ver import_models)
+    :param chunk_size: filas por cada executemany
+    :return: diccionario {'archivo:ID_M del archivo' (con new_ids) o ID_M: ID_M en la base de datos}
+    '''
+
+    def rows():
+        for path in paths:
+            for where, row in read_file(path):
+                # las etiquetas de modelos de archivos distintos no se mezclan con new_ids
+                # y un archivo sin ID_M es un solo modelo
+                if new_ids:
+                    row['ID_M'] = '%s:%s' % (path, row['ID_M']) if row.get('ID_M') else path
+
+                yield where, row
+
+    conn = sqlite3.connect(db_path, timeout=30)
+
+    try:
+        return import_models(conn, rows(), new_ids, chunk_size)
+
+    finally:
+        conn.close()
+
+
+def synthetic_rows(models: int, processes: int, seed: int = 0):
+    '''
+    Genera parques aleatorios para medir el throughput de la importación
+
+    :param models: cantidad de modelos
+    :param processes: procesos por modelo (repartidos en empresas de hasta 5 procesos)
+    :param seed: semilla
+    :return: generador de tuplas (ubicación de la fila, diccionario con las columnas de la fila)
+    '''
+
+    import random
+
+    rng = random.Random(seed)
+    line = 0
+
+    for model in range(1, models + 1):
+        for k in range(processes):
+            line += 1
+            c_out = rng.choice([100, 200, 400, 800])
+
+            yield 'sintético fila %d' % line, {'ID_M': str(model), 'Alpha': 0.13, 'Beta': 0.22, 'Delta': 0.02,
+                         'ID_EP': k // 5 + 1, 'ID_P': k % 5 + 1, 'Cmax_in': rng.uniform(0, c_out / 2),
+                         'Cmax_out': c_out, 'M': rng.choice([500, 1000, 2000])}
+
+
+def insert_row_by_row(conn: sqlite3.Connection, rows) -> None:
+    '''
+    Inserción fila por fila con un commit por fila (la forma anterior), solo para comparar en benchmark
+    '''
+
+    create_tables(conn)
+    seen = set()
+
+    for where, row in rows:
+        label, params, process = validate(row, where)
+
+        if label not in seen:
+            seen.add(label)
+            conn.execute(' INSERT INTO Modelo (ID_M, Alpha, Beta, Delta) VALUES (?, ?, ?, ?) ', (int(label), ) + params)
+            conn.commit()
+
+        conn.execute(' INSERT INTO Empresa_Proceso (ID_M, ID_EP, ID_P, Cmax_in, Cmax_out, M) VALUES (?, ?, ?, ?, ?, ?) ',
+                     (int(label), ) + process)
+        conn.commit()
+
+
+def benchmark(models: int, processes: int, db_path: str, chunk_size: int = CHUNK_SIZE, compare: bool = False) -> dict:
+    '''
+    Mide el throughput de import_models con parques sintéticos sobre una base de datos nueva
+
+    :param models: cantidad de modelos
+    :param processes: procesos por modelo
+    :param db_path: ruta de la base de datos temporal (se borra antes y después)
+    :param chunk_size: filas por cada executemany
+    :param compare: medir también la inserción fila por fila
+    :return: diccionario {método: (filas, segundos)}
+    '''
+
+    methods = {'bulk': lambda conn, rows: import_models(conn, rows, chunk_size=chunk_size)}
+
+    if compare:
+        methods['row_by_row'] = insert_row_by_row
+
+    rslt = dict()
+
+    for name, method in methods.items():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            start = time.time()
+            method(conn, synthetic_rows(models, processes))
+            rslt[name] = (models * processes, time.time() - start)
+
+        finally:
+            conn.close()
+            os.remove(db_path)
+
+    return rslt
+
+
+def insert_Fp_result(conn: sqlite3.Connection, id_modelo: int, id_ep_1: int, id_p_1: int, id_ep_2: int, id_p_2: int,
+                     solver: str, fp: float, transformation: str = '', options: str = ''):
+    '''
+    Inserta en la base de datos el valor de una variable Fp
+    obtenido al resolver un modelo de EIP con un solver específico
+
+    :param conn: conexión a la base de datos
     :param id_modelo: id del modelo
     :param id_ep_1: id de la empresa que envía
     :param id_p_1: id del proceso que envía
     :param id_ep_2: id de la empresa que recibe
     :param id_p_2: id del proceso que recibe
     :param solver: solver empleado en la obtención del resultado
-    :param fpart: valor obtenido por el solver
-    '''    
+    :param fp: valor obtenido por el solver
+    :param transformation: transformación empleada
+    :param options: opciones del solver
+    '''
 
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
+    conn.execute('INSERT INTO Fp_Results (ID_M, ID_EP1, ID_P1, ID_M2, ID_EP2, ID_P2, Solver, Transformation, Options, Fp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 (id_modelo, id_ep_1, id_p_1, id_modelo, id_ep_2, id_p_2, solver, transformation, options, fp))
 
-    cursor.execute('INSERT INTO Fpart_result (ID_M, ID_EP1, ID_P1, ID_M2, ID_EP2, ID_P2, Solver, Fpart) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                   (id_modelo, id_ep_1, id_p_1, id_modelo, id_ep_2, id_p_2, solver, fpart))
+    conn.commit()
 
 
-def insert_Fw_result(id_modelo: int, id_ep: int, id_p: int, solver: str, fw: float):
+def insert_Fw_result(conn: sqlite3.Connection, id_modelo: int, id_ep: int, id_p: int, solver: str, fw: float,
+                     transformation: str = '', options: str = ''):
     '''
-    Inserta en la base de datos los valores de las variables Fw
-    obtenidos al resolver un modelo de EIP con un solver específico
+    Inserta en la base de datos el valor de una variable Fw
+    obtenido al resolver un modelo de EIP con un solver específico
 
+    :param conn: conexión a la base de datos
     :param id_modelo: id del modelo
     :param id_ep: id de la empresa que recibe
     :param id_p: id del proceso que recibe
     :param solver: solver empleado en la obtención del resultado
     :param fw: valor obtenido por el solver
-    '''    
-
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
+    :param transformation: transformación empleada
+    :param options: opciones del solver
+    '''
 
-    cursor.execute('INSERT INTO Fw_results (ID_M, ID_EP, ID_P, Solver, Fw) VALUES (?, ?, ?, ?, ?)',
-                   (id_modelo, id_ep, id_p, solver, fw))
+    conn.execute('INSERT INTO Fw_Results (ID_M, ID_EP, ID_P, Solver, Transformation, Options, Fw) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (id_modelo, id_ep, id_p, solver, transformation, options, fw))
 
     conn.commit()
@@ -1,21 +1,44 @@
+import json
+import os
 import sqlite3
+import time
 
-def load_models_id():
-    conn = sqlite3.connect('database/database.db')
-    cursor = conn.cursor()
+from itertools import groupby
+from pathlib import Path
 
-    q = ' SELECT ID_M FROM modelo '
-    cursor.execute(q)
+from database.database import create_tables
 
-    models_id = []
-    for id_ in cursor.fetchall():
-        models_id.append(id_[0])
+# Ruta por defecto de la base de datos (relativa al directorio code/)
+DB_PATH = 'database/database.db'
 
-    return models_id
+# Modelos que DataSet lee por consulta
+BATCH_SIZE = 2000
+
+# Parámetros que Data.override puede reemplazar: escalares y cantidad de componentes del índice de los indexados
+SCALAR_PARAMS = ('alpha', 'beta', 'delta')
+INDEXED_PARAMS = {'M': 2, 'Cmax_out': 2, 'Cmax_in': 2, 'Fp_max': 4, 'Cb': 4}
+
+
+def load_models_id(db_path: str = DB_PATH):
+    conn = sqlite3.connect(db_path)
+
+    try:
+        q = ' SELECT ID_M FROM modelo '
+
+        return [id_[0] for id_ in conn.execute(q).fetchall()]
+
+    finally:
+        conn.close()
 
 
 class Data:
-    def __init__(self, model_id: int):
+    def __init__(self, model_id: int, db_path: str = DB_PATH, rows: tuple = None):
+        '''
+        :param model_id: identificador del modelo
+        :param db_path: ruta de la base de datos
+        :param rows: filas del modelo ya leídas (ver DataSet.load); si es None se leen de la base de datos
+        '''
+
         self.model_id = model_id
         self.alpha = 0
         self.beta = 0
@@ -31,10 +54,35 @@ class Data:
         self.EP_P = []
         self.EP_P_EP_P = []
 
-        self.conn = sqlite3.connect('database/database.db')
-        self.cursor = self.conn.cursor()
+        # Red de conexiones permitidas (por defecto todos los procesos están conectados)
+        self.EP_P_IN = dict()  # (ep, p) -> procesos que le envían agua
+        self.EP_P_OUT = dict()  # (ep, p) -> procesos a los que envía agua
+        self.Fp_max = dict()  # capacidad de las tuberías que la definen
+        self.Cb = dict()  # costo de bombeo de las tuberías que lo definen
+
+        # la conexión se abre al usarla: los modelos cargados con DataSet solo la abren para guardar resultados
+        self.db_path = db_path
+        self._conn = None
+        self._cursor = None
+
+        self.data = self.load_model() if rows is None else self.build(*rows)
+
 
-        self.data = self.load_model()
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # timeout para tolerar escrituras concurrentes de varios workers
+            self._conn = sqlite3.connect(self.db_path, timeout=30)
+
+        return self._conn
+
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+
+        return self._cursor
 
 
     def load_model(self) -> dict:
@@ -49,21 +97,32 @@ class Data:
         q = ' SELECT Alpha, Beta, Delta FROM Modelo WHERE ID_M=? '
         self.cursor.execute(q, (self.model_id, ))
 
-        rows = self.cursor.fetchall()
-
-        for row in rows:
-            self.alpha = row[0]
-            self.beta = row[1]
-            self.delta = row[2]
+        models = self.cursor.fetchall()
 
         ## empresa-proceso ##
 
-        q = ' SELECT ID_EP, ID_P, M, Cmax_out, Cmax_in FROM Empresa_Proceso WHERE ID_M=? '
+        q = ' SELECT ID_EP, ID_P, M, Cmax_out, Cmax_in FROM Empresa_Proceso WHERE ID_M=? ORDER BY ID_EP, ID_P '
         self.cursor.execute(q, (self.model_id, ))
 
-        rows = self.cursor.fetchall()
+        processes = self.cursor.fetchall()
+
+        return self.build(models[-1] if models else None, processes, self.load_connections())
+
+
+    def build(self, model: tuple, processes: list, connections: list) -> dict:
+        '''
+        Construye los parámetros de entrada del modelo a partir de sus filas
+
+        :param model: fila (Alpha, Beta, Delta) de Modelo (None si el modelo no existe)
+        :param processes: filas (ID_EP, ID_P, M, Cmax_out, Cmax_in) de Empresa_Proceso
+        :param connections: filas de Conexion (ver load_connections)
+        :return: diccionario con los parámetros de entrada del modelo
+        '''
+
+        if model is not None:
+            self.alpha, self.beta, self.delta = model
 
-        for row in rows:
+        for row in processes:
             key = (row[0], row[1])
 
             self.EP_P.append(key)
@@ -90,11 +149,39 @@ class Data:
             Cmax_in_value = row[4] 
             self.Cmax_in[key] = Cmax_in_value
 
-        for ep_p in self.EP_P:
-            for ep_p_ in self.EP_P:
-                if ep_p != ep_p_:
-                    self.EP_P_EP_P.append(
-                        (ep_p[0], ep_p[1], ep_p_[0], ep_p_[1]))
+        ## conexiones ##
+
+        if connections:
+            # red dispersa: solo las tuberías de la tabla Conexion
+            ep_p_set = set(self.EP_P)
+
+            for row in connections:
+                arc = tuple(row[:4])
+
+                if arc[:2] not in ep_p_set or arc[2:] not in ep_p_set or arc[:2] == arc[2:]:
+                    raise ValueError('Conexión inválida %s en el modelo %s' % (arc, self.model_id))
+
+                self.EP_P_EP_P.append(arc)
+
+                if row[4] is not None:
+                    self.Fp_max[arc] = row[4]
+
+                if row[5] is not None:
+                    self.Cb[arc] = row[5]
+
+            self.EP_P_IN = {key: [] for key in self.EP_P}
+            self.EP_P_OUT = {key: [] for key in self.EP_P}
+
+            for arc in self.EP_P_EP_P:
+                self.EP_P_OUT[arc[:2]].append(arc[2:])
+                self.EP_P_IN[arc[2:]].append(arc[:2])
+
+        else:
+            # red completa: cada proceso envía y recibe de todos los demás
+            self.EP_P_EP_P = [ep_p + ep_p_ for ep_p in self.EP_P for ep_p_ in self.EP_P if ep_p != ep_p_]
+
+            self.EP_P_IN = {key: [ep_p for ep_p in self.EP_P if ep_p != key] for key in self.EP_P}
+            self.EP_P_OUT = {key: list(self.EP_P_IN[key]) for key in self.EP_P}
 
         data = {None: {
             'alpha': {None: self.alpha},
@@ -107,27 +194,184 @@ class Data:
             'P': {None: self.P},
             'M': self.M,
             'Cmax_out': self.Cmax_out,
-            'Cmax_in': self.Cmax_in
+            'Cmax_in': self.Cmax_in,
+            'EP_P_IN': self.EP_P_IN,
+            'EP_P_OUT': self.EP_P_OUT,
+            'EP_P_EP_P_CAP': {None: list(self.Fp_max)},
+            'Fp_max': self.Fp_max,
+            'EP_P_EP_P_CB': {None: list(self.Cb)},
+            'Cb': self.Cb
         }}
 
         return data
 
 
-    def insert_results(self, Fw_results, Fp_results, solver: str, transformation:str, solver_options:str, obj_val: float, termination_condition: str, solver_status: str, time: float):
+    def override(self, overrides: dict) -> None:
+        '''
+        Reemplaza parámetros del modelo cargado (escenarios "qué pasa si"); los parámetros indexados
+        solo cambian en los índices indicados
+
+        :param overrides: diccionario {parámetro: valor}; alpha, beta y delta con un número, M, Cmax_out y
+                          Cmax_in con {'ep,p': valor} y Fp_max y Cb con {'ep,p,ep_,p_': valor}
+        :raises ValueError: si un parámetro o un índice no existe en el modelo
+        '''
+
+        for name, val in overrides.items():
+            if name in SCALAR_PARAMS:
+                setattr(self, name, float(val))
+                self.data[None][name] = {None: getattr(self, name)}
+                continue
+
+            if name not in INDEXED_PARAMS:
+                raise ValueError('Parámetro desconocido %s' % name)
+
+            valid = self.EP_P if INDEXED_PARAMS[name] == 2 else self.EP_P_EP_P
+            param = getattr(self, name)
+
+            for key, item in val.items():
+                index = tuple(int(i) for i in str(key).split(','))
+
+                if len(index) != INDEXED_PARAMS[name] or index not in valid:
+                    raise ValueError('Índice %s de %s inexistente en el modelo %s' % (key, name, self.model_id))
+
+                param[index] = float(item)
+
+        # las tuberías con capacidad o costo de bombeo pueden haber cambiado
+        self.data[None]['EP_P_EP_P_CAP'] = {None: list(self.Fp_max)}
+        self.data[None]['EP_P_EP_P_CB'] = {None: list(self.Cb)}
+
+
+    def load_connections(self) -> list:
+        '''
+        Cargar las tuberías permitidas del modelo desde la tabla Conexion
+
+        :return: lista de tuplas (ID_EP1, ID_P1, ID_EP2, ID_P2, Capacidad, Costo_Bombeo);
+                 vacía si el modelo no define conexiones (red completa)
+        '''
+
+        q = ' SELECT ID_EP1, ID_P1, ID_EP2, ID_P2, Capacidad, Costo_Bombeo FROM Conexion WHERE ID_M=? ORDER BY ID_EP1, ID_P1, ID_EP2, ID_P2 '
+
         try:
-            for item in Fw_results:
-                self.insert_Fw_result(
-                    item[0], item[1], solver, transformation, solver_options, round(Fw_results[item].value, 3))
+            self.cursor.execute(q, (self.model_id, ))
 
-            for item in Fp_results:
-                self.insert_Fp_result(
-                    item[0], item[1], item[2], item[3], solver, transformation, solver_options, round(Fp_results[item].value, 3))
-                
-            self.insert_solver_results(solver, transformation, solver_options, obj_val, termination_condition, solver_status, round(time, 3))
+        except sqlite3.OperationalError:
+            # bases de datos creadas antes de la tabla Conexion
+            return []
 
-        except:
+        return self.cursor.fetchall()
+
+
+    def insert_results(self, Fw_results, Fp_results, solver: str, transformation:str, solver_options:str, obj_val: float, termination_condition: str, solver_status: str, time: float, fp_tol: float = None):
+        '''
+        Guarda los valores de Fw y Fp y el resumen del solve en una sola transacción.
+        Si obj_val es None (solve sin punto factible) solo se guarda el resumen en Results_Info.
+        Un resultado ya guardado con el mismo solver, transformación y opciones se reemplaza; las variables
+        sin valor no se guardan
+
+        Con fp_tol solo se guardan los Fp con |Fp| > fp_tol (almacenamiento disperso); el conjunto de
+        tuberías y la tolerancia quedan en Fp_Storage para que load_Fp complete los ceros
+
+        :param fp_tol: tolerancia del almacenamiento disperso de Fp (None para guardar todas las tuberías)
+        :raises sqlite3.Error: si no se pudo escribir; la transacción se deshace
+        '''
+
+        run = (self.model_id, solver, transformation, solver_options)
+        fw = fp = []
+
+        if obj_val is not None:
+            fw = [run + (key[0], key[1], round(var.value, 3)) for key, var in Fw_results.items() if var.value is not None]
+            fp = [run + (arc[0], arc[1], self.model_id, arc[2], arc[3], round(var.value, 3)) for arc, var in Fp_results.items() if var.value is not None]
+
+            if fp_tol is not None:
+                fp = [row for row in fp if abs(row[-1]) > fp_tol]
+
+            # la red completa no se guarda tubería por tubería: se reconstruye con los procesos del modelo
+            arcs = list(Fp_results.keys())
+            arc_set = None if set(arcs) == set(self.full_network()) else json.dumps(arcs)
+
+        create_tables(self.conn)
+
+        with self.conn:
+            # las filas de una ejecución anterior del mismo resultado (etapas y puntos iniciales incluidos)
+            for table in ('Start_Results', 'Stage_Results', 'Fw_Results', 'Fp_Results', 'Fp_Storage', 'Results_Info'):
+                self.conn.execute('DELETE FROM %s WHERE ID_M=? AND Solver=? AND Transformation=? AND Options=?' % table, run)
+
+            self.conn.executemany('INSERT INTO Fw_Results (ID_M, Solver, Transformation, Options, ID_EP, ID_P, Fw) VALUES (?, ?, ?, ?, ?, ?, ?)', fw)
+            self.conn.executemany('INSERT INTO Fp_Results (ID_M, Solver, Transformation, Options, ID_EP1, ID_P1, ID_M2, ID_EP2, ID_P2, Fp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', fp)
+
+            if obj_val is not None:
+                self.conn.execute('INSERT INTO Fp_Storage (ID_M, Solver, Transformation, Options, Sparse, Tolerance, Arcs, Nonzeros, Arc_Set) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  run + (int(fp_tol is not None), fp_tol, len(arcs), len(fp), arc_set))
+
+            self.conn.execute('INSERT INTO Results_Info (ID_M, Solver, Transformation, Options, Total_Fw, Termination_Condition, Solver_Status, Time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              run + (obj_val, str(termination_condition), str(solver_status), round(time, 3)))
+
+
+    def full_network(self) -> list:
+        '''
+        Tuberías de la red completa entre los procesos del modelo
+        '''
+
+        return [ep_p + ep_p_ for ep_p in self.EP_P for ep_p_ in self.EP_P if ep_p != ep_p_]
+
+
+    def load_Fp(self, solver: str, transformation: str, solver_options: str) -> dict:
+        '''
+        Carga los valores de Fp de un resultado guardado, denso o disperso. Las tuberías del resultado
+        que no tienen fila en Fp_Results valen 0. El diccionario puede asignarse a una instancia con
+        instance.Fp.set_values(...) o convertirse en matriz con Fp_array
+
+        :return: diccionario {(ep, p, ep', p'): Fp} con todas las tuberías del resultado
+        '''
+
+        run = (self.model_id, solver, transformation, solver_options)
+        storage = None
+
+        try:
+            storage = self.cursor.execute('SELECT Arc_Set FROM Fp_Storage WHERE ID_M=? AND Solver=? AND Transformation=? AND Options=?', run).fetchone()
+
+        except sqlite3.OperationalError:
+            # bases de datos creadas antes de la tabla Fp_Storage
             pass
 
+        if storage is None:
+            # resultado guardado antes del almacenamiento disperso: todas las tuberías tienen fila
+            arcs = self.EP_P_EP_P
+
+        elif storage[0] is None:
+            arcs = self.full_network()
+
+        else:
+            arcs = [tuple(arc) for arc in json.loads(storage[0])]
+
+        fp = dict.fromkeys(arcs, 0.0)
+
+        q = 'SELECT ID_EP1, ID_P1, ID_EP2, ID_P2, Fp FROM Fp_Results WHERE ID_M=? AND Solver=? AND Transformation=? AND Options=?'
+
+        for row in self.cursor.execute(q, run):
+            fp[tuple(row[:4])] = row[4]
+
+        return fp
+
+
+    def Fp_array(self, fp: dict):
+        '''
+        Matriz de flujos entre procesos en el orden de EP_P (requiere numpy)
+
+        :param fp: diccionario {(ep, p, ep', p'): Fp} (p. ej. el de load_Fp)
+        :return: arreglo de numpy de tamaño (len(EP_P), len(EP_P)) con Fp[origen, destino]
+        '''
+
+        import numpy as np
+
+        index = {key: i for i, key in enumerate(self.EP_P)}
+        array = np.zeros((len(self.EP_P), len(self.EP_P)))
+
+        for arc, val in fp.items():
+            array[index[arc[:2]], index[arc[2:]]] = val
+
+        return array
+
 
     def insert_solver_results(self, solver: str, transformation: str, solver_options: str, obj_val: float,  termination_condition: str, solver_status: str, time: float):
         try:
@@ -162,6 +406,263 @@ class Data:
             pass
 
 
+    def insert_stage_results(self, solver: str, transformation: str, solver_options: str, stages: list):
+        '''
+        Guarda los resultados de cada etapa de un solve por etapas (p. ej. mpec_continuation).
+        Debe llamarse después de insert_results, que borra las etapas de una ejecución anterior
+
+        :param stages: lista de diccionarios con Stage, Epsilon, Objective, Comp_Violation, Time y Termination
+        :raises sqlite3.Error: si no se pudo escribir; la transacción se deshace
+        '''
+
+        # las tablas agregadas después de crear la base de datos se crean al usarlas
+        create_tables(self.conn)
+
+        with self.conn:
+            self.conn.executemany('INSERT INTO Stage_Results (ID_M, Solver, Transformation, Options, Stage, Epsilon, Objective, Comp_Violation, Time, Termination_Condition) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [(self.model_id, solver, transformation, solver_options, stage['Stage'], stage['Epsilon'], stage['Objective'], stage['Comp_Violation'], round(stage['Time'], 3), stage['Termination'])
+                                   for stage in stages])
+
+
+    def insert_start_results(self, solver: str, transformation: str, solver_options: str, starts: list):
+        '''
+        Guarda el resultado de cada punto inicial de una búsqueda multi-start.
+        Debe llamarse después de insert_results, que borra los puntos de una ejecución anterior
+
+        :param starts: lista de diccionarios con Start, Seed, Objective, Cutoff, Time y Termination
+        :raises sqlite3.Error: si no se pudo escribir; la transacción se deshace
+        '''
+
+        create_tables(self.conn)
+
+        with self.conn:
+            self.conn.executemany('INSERT INTO Start_Results (ID_M, Solver, Transformation, Options, Start, Seed, Objective, Cutoff, Time, Termination_Condition) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [(self.model_id, solver, transformation, solver_options, start['Start'], start['Seed'], start['Objective'], start['Cutoff'], round(start['Time'], 3), start['Termination'])
+                                   for start in starts])
+
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+
+        if self._conn is not None:
+            self._conn.close()
+
+        # la conexión se vuelve a abrir si se usa después de cerrarla
+        self._conn = None
+        self._cursor = None
+
+
+class DataSet:
+    '''
+    Carga muchos modelos con una sola conexión de solo lectura y una consulta ordenada por tabla:
+
+        with DataSet(db_path) as dataset:
+            for data in dataset.load(model_ids):
+                ...
+
+    Los objetos Data se construyen a medida que se recorren y abren su propia conexión solo si se
+    guardan resultados con ellos
+    '''
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+
+        uri = Path(db_path).resolve().as_uri() + '?mode=ro'
+        self.conn = sqlite3.connect(uri, uri=True, timeout=30)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def load(self, model_ids: list = None, batch_size: int = BATCH_SIZE):
+        '''
+        Genera los datos de los modelos en orden de ID_M. Por cada grupo de batch_size modelos las filas
+        de Modelo y Empresa_Proceso se leen con una sola consulta y las de Conexion con otra, y se agrupan
+        por modelo en una pasada. Cada consulta se lee completa antes de generar los modelos: una consulta
+        abierta mantendría el bloqueo de lectura y los resultados que se guardan mientras tanto esperarían
+
+        :param model_ids: identificadores de los modelos (None para todos); los que no existen se omiten
+        :param batch_size: modelos que se leen por consulta
+        :return: generador de objetos Data
+        '''
+
+        if model_ids is None:
+            model_ids = [row[0] for row in self.conn.execute(' SELECT ID_M FROM Modelo ')]
+
+        model_ids = sorted({int(id_) for id_ in model_ids})
+
+        for i in range(0, len(model_ids), batch_size):
+            yield from self._load_batch(model_ids[i:i + batch_size])
+
+
+    def _load_batch(self, model_ids: list):
+        # un solo parámetro JSON en lugar de un ? por modelo (límite de variables de SQLite)
+        where, params = ' WHERE m.ID_M IN (SELECT value FROM json_each(?)) ', (json.dumps(model_ids), )
+
+        # los procesos de cada modelo en el mismo orden que en Data.load_model
+        q = ''' SELECT m.ID_M, m.Alpha, m.Beta, m.Delta, ep.ID_EP, ep.ID_P, ep.M, ep.Cmax_out, ep.Cmax_in
+                FROM Modelo m LEFT JOIN Empresa_Proceso ep ON ep.ID_M = m.ID_M %s
+                ORDER BY m.ID_M, ep.ID_EP, ep.ID_P ''' % where
+
+        rows = self.conn.execute(q, params).fetchall()
+
+        connections = dict()
+
+        for row in self._connections(where, params):
+            connections.setdefault(row[0], []).append(row[1:])
+
+        for model_id, model_rows in groupby(rows, key=lambda row: row[0]):
+            model_rows = list(model_rows)
+            processes = [row[4:] for row in model_rows if row[4] is not None]
+
+            yield Data(model_id, self.db_path, (model_rows[0][1:4], processes, connections.get(model_id, [])))
+
+
+    def _connections(self, where: str, params: tuple) -> list:
+        '''
+        Filas de Conexion de los modelos seleccionados ordenadas por modelo (vacío si la tabla no existe)
+        '''
+
+        q = ''' SELECT m.ID_M, c.ID_EP1, c.ID_P1, c.ID_EP2, c.ID_P2, c.Capacidad, c.Costo_Bombeo
+                FROM Conexion c JOIN Modelo m ON m.ID_M = c.ID_M %s
+                ORDER BY m.ID_M, c.ID_EP1, c.ID_P1, c.ID_EP2, c.ID_P2 ''' % where
+
+        try:
+            return self.conn.execute(q, params).fetchall()
+
+        except sqlite3.OperationalError:
+            # bases de datos creadas antes de la tabla Conexion
+            return []
+
+
     def close(self):
-        self.cursor.close()
         self.conn.close()
+
+
+def benchmark_load(models: int, processes: int, db_path: str) -> dict:
+    '''
+    Compara la carga de modelos con un Data por modelo (una conexión y dos consultas por modelo)
+    y con DataSet.load (una conexión y una consulta) sobre una base de datos nueva con parques sintéticos
+
+    :param models: cantidad de modelos
+    :param processes: procesos por modelo
+    :param db_path: ruta de la base de datos temporal (se borra antes y después)
+    :return: diccionario {método: (modelos, segundos)}
+    '''
+
+    from database.insert_db import import_models, synthetic_rows
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        import_models(conn, synthetic_rows(models, processes))
+
+    finally:
+        conn.close()
+
+    rslt = dict()
+
+    try:
+        start = time.time()
+
+        for model_id in range(1, models + 1):
+            Data(model_id, db_path).close()
+
+        rslt['Data'] = (models, time.time() - start)
+
+        start = time.time()
+
+        with DataSet(db_path) as dataset:
+            loaded = sum(1 for _ in dataset.load(range(1, models + 1)))
+
+        rslt['DataSet'] = (loaded, time.time() - start)
+
+    finally:
+        os.remove(db_path)
+
+    return rslt
+
+
+def benchmark_storage(processes: int, runs: int, db_path: str, fp_tol: float = 1e-3, density: float = 0.02,
+                      seed: int = 0) -> dict:
+    '''
+    Compara el almacenamiento denso (una fila de Fp_Results por tubería) y el disperso (fp_tol) de
+    resultados sintéticos de un modelo con la red completa: tamaño de la base de datos y tiempos de
+    escritura y de lectura con Data.load_Fp
+
+    :param processes: procesos del modelo
+    :param runs: cantidad de resultados guardados
+    :param db_path: ruta de la base de datos temporal (se borra antes y después de cada modo)
+    :param fp_tol: tolerancia del almacenamiento disperso
+    :param density: fracción de tuberías con flujo
+    :param seed: semilla
+    :return: diccionario {modo: {'Rows', 'Bytes', 'Write', 'Read'}}
+    '''
+
+    import random
+
+    from types import SimpleNamespace
+
+    from database.insert_db import import_models, synthetic_rows
+
+    rslt = dict()
+
+    for mode, tol in (('dense', None), ('sparse', fp_tol)):
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            import_models(conn, synthetic_rows(1, processes))
+
+        finally:
+            conn.close()
+
+        rng = random.Random(seed)
+        data = Data(1, db_path)
+
+        try:
+            write = read = 0.0
+
+            for run in range(runs):
+                # la mayoría de los flujos son 0 o ruido del solver que se redondea a 0
+                fp = {arc: SimpleNamespace(value=rng.uniform(0, 50) if rng.random() < density else rng.uniform(0, 1e-4))
+                      for arc in data.EP_P_EP_P}
+                fw = {key: SimpleNamespace(value=rng.uniform(0, 50)) for key in data.EP_P}
+
+                start = time.time()
+                data.insert_results(fw, fp, 'bench', '', 'run=%d' % run, 0.0, 'optimal', 'ok', 0.0, fp_tol=tol)
+                write += time.time() - start
+
+            for run in range(runs):
+                start = time.time()
+                data.load_Fp('bench', '', 'run=%d' % run)
+                read += time.time() - start
+
+            rows = data.conn.execute(' SELECT COUNT(*) FROM Fp_Results ').fetchone()[0]
+
+        finally:
+            data.close()
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            conn.execute(' VACUUM ')
+
+        finally:
+            conn.close()
+
+        rslt[mode] = {'Rows': rows, 'Bytes': os.path.getsize(db_path), 'Write': write, 'Read': read}
+        os.remove(db_path)
+
+    return rslt
@@ -1,3 +1,5 @@
+import time
+
 from pyomo.environ import *
 
 from pyomo.mpec import *
@@ -5,20 +7,37 @@ from pyomo.util.model_size import build_model_size_report
 
 from rules import *
 
+from continuation import solve_continuation
+
+from lpcc import solve_lpcc
+
+from multistart import solve_multistart
+
+from presolve import eliminate, reconstruct
+
+from kkt import add_firm_blocks, compute_coefficients, lagrangian_reference
+
+from scaling import SCALING_OPTIONS, is_scaled, scale
+
+from limits import (ITERATION_LIMIT, LIMIT_OPTIONS, META_SOLVERS, TIME_LIMIT, limit_options, limit_termination,
+                    max_violation, solve_meta)
+
+from persistent import persistent_solver, record, reported_time, resolve_stats
+
 from database.utils_db import Data
 
 from pyomo.common.timing import TicTocTimer, report_timing
 
-import pandas as pd
-
 
-def model(model_id: int, param_data: Data) -> AbstractModel:
+def model(model_id: int, param_data: Data, workers: int = 1) -> AbstractModel:
     '''
     Crea una instancia de un modelo abstracto de pyomo.
-    Añade como restricciones del estado (líder) los sistemas KKT concatenados de todas las empresas
+    Añade como restricciones del estado (líder) los sistemas KKT concatenados de todas las empresas.
+    Las filas de estacionariedad de cada empresa van en su bloque firm[ep] (ver kkt.py)
 
     :param model_id: identificador del modelo
     :param param_data: instancia de la clase Data que contiene los parámetros de entrada para crear el modelo
+    :param workers: procesos que calculan en paralelo los coeficientes de las filas de estacionariedad
     :return: instancia de un modelo abstracto de pyomo
     '''
 
@@ -31,8 +50,17 @@ def model(model_id: int, param_data: Data) -> AbstractModel:
     # Conjuntos de entrada #
 
     # Conjunto de índices para las variables  
+    model.EP = Set(ordered=Set.SortedOrder)  # Empresas
     model.EP_P = Set(dimen=2, ordered=Set.SortedOrder)  # Tuplas (ep, p)
-    model.EP_P_EP_P = Set(dimen=4, ordered=Set.SortedOrder)  # Tuplas (ep, p, ep', p')
+    model.EP_P_EP_P = Set(dimen=4, ordered=Set.SortedOrder)  # Tuplas (ep, p, ep', p') de las tuberías permitidas
+
+    # Procesos que envían agua a (ep, p) y procesos que la reciben de (ep, p)
+    model.EP_P_IN = Set(model.EP_P, dimen=2, ordered=Set.SortedOrder)
+    model.EP_P_OUT = Set(model.EP_P, dimen=2, ordered=Set.SortedOrder)
+
+    # Tuberías con capacidad y con costo de bombeo propio (tabla Conexion)
+    model.EP_P_EP_P_CAP = Set(dimen=4, within=model.EP_P_EP_P, ordered=Set.SortedOrder)
+    model.EP_P_EP_P_CB = Set(dimen=4, within=model.EP_P_EP_P, ordered=Set.SortedOrder)
 
     # Conjunto de índices de las restricciones de desigualdad C = {1, 4}
     model.C = Set(within=NonNegativeReals, initialize=[1, 4])
@@ -51,6 +79,9 @@ def model(model_id: int, param_data: Data) -> AbstractModel:
     model.beta = Param(mutable=True)  # Costo de descarga de agua contaminada
     model.delta = Param(mutable=True)  # Costo de bombeo de agua contaminada
 
+    model.Fp_max = Param(model.EP_P_EP_P_CAP, mutable=True)  # Capacidad de la tubería
+    model.Cb = Param(model.EP_P_EP_P_CB, mutable=True)  # Costo de bombeo de la tubería (reemplaza a delta)
+
     ##
 
     # Variables #
@@ -69,6 +100,9 @@ def model(model_id: int, param_data: Data) -> AbstractModel:
     # multiplicador asociado a la restriccion 2 de
     model.mu_2 = Var(model.EP_P_EP_P, within=NonNegativeReals, rule=mu_2_rule)
     
+    # multiplicador asociado a la restricción de capacidad de la tubería
+    model.mu_5 = Var(model.EP_P_EP_P_CAP, within=NonNegativeReals, rule=mu_5_rule)
+
     # multplicador asociado a la restricción de igualdad para la empresa ep en el proceso p
     model.lmbd = Var(model.EP_P, within=Reals, rule=lmbd_rule)
 
@@ -123,12 +157,20 @@ def model(model_id: int, param_data: Data) -> AbstractModel:
 
     # ##
 
+    # Quinta restricción del nivel inferior (Desigualdad) #
+    # Capacidad de las tuberías: Fp <= Fp_max #
+    model.constraint_5 = Constraint(model.EP_P_EP_P_CAP, rule=lower_level_constraint_5_rule)
+
+    # ##
+
     # Restricciones para multiplicadores #
 
     model.mu_constraint = Constraint(model.EP_P, model.C, rule=mu_constraint_rule)
 
     model.mu_2_constraint = Constraint(model.EP_P_EP_P, rule=mu_2_constraint_rule)
 
+    model.mu_5_constraint = Constraint(model.EP_P_EP_P_CAP, rule=mu_5_constraint_rule)
+
     # ##
 
     # Restricciones de complementariedad para la primera y cuarta restricción #
@@ -144,10 +186,23 @@ def model(model_id: int, param_data: Data) -> AbstractModel:
         model.EP_P_EP_P, rule=complementarity_2_rule)
 
     # ##
-    model.lagrangian = Constraint(model.EP_P_EP_P, rule=lagrangian_expr)
+
+    # Restricciones de complementariedad para la capacidad de las tuberías #
+
+    model.complementarity_5 = Complementarity(
+        model.EP_P_EP_P_CAP, rule=complementarity_5_rule)
+
+    # ##
 
     instance = model.create_instance(data_db.data, name=model_name)
 
+    # Filas de estacionariedad (lagrangian_expr) de cada empresa: solo dependen de sus multiplicadores,
+    # por lo que sus coeficientes se calculan por separado y se arman en un bloque por empresa
+    add_firm_blocks(instance, compute_coefficients(data_db, workers))
+
+    # acceso a las filas como antes: instance.lagrangian[ep, p, ep_, p_]
+    instance.lagrangian = lagrangian_reference(instance)
+
     # report_timing() # reportar tiempo de construcción del modelo
 
     return instance
@@ -163,36 +218,241 @@ def print_instance(instance) -> None:
     instance.pprint() 
 
 
-def solve(instance, solver: str, transformation='', options=''):
+def parse_options(options: str) -> dict:
+    '''
+    Convierte una cadena de opciones del solver ('clave=valor clave=valor') en un diccionario
+
+    :param options: cadena de opciones
+    :return: diccionario de opciones con los valores numéricos convertidos
+    '''
+
+    parsed = dict()
+
+    for item in options.split():
+        key, _, val = item.partition('=')
+
+        for cast in (int, float):
+            try:
+                val = cast(val)
+                break
+
+            except ValueError:
+                pass
+
+        parsed[key] = val
+
+    return parsed
+
+
+def solve(instance, solver: str, transformation='', options='', tee=True, logfile=None, time_limit=None,
+          iter_limit=None, feasibility_tol=1e-5, stats=None):
+    '''
+    Resuelve el modelo con el solver indicado.
+    Si el solver se detiene por un límite de tiempo o de iteraciones se conserva el mejor punto
+    factible encontrado y la condición de parada es 'time_limit' o 'iteration_limit'
+
+    :param instance: instancia de un modelo abstracto de pyomo
+    :param solver: nombre del solver a utilizar
+    :param transformation: transformación de pyomo a aplicar antes de resolver
+    :param options: opciones del solver ('clave=valor clave=valor'); presolve=1 elimina Fw y lmbd antes de resolver,
+                    scaling=1 escala variables y restricciones y persistent=1 usa la interfaz persistente del
+                    solver (o del subsolver de las etapas de mpec_nlp, mpec_minlp y mpec_continuation) si la tiene
+    :param tee: mostrar la salida del solver en la consola
+    :param logfile: archivo donde se guarda la salida del solver (None para no guardarla)
+    :param time_limit: tiempo límite en segundos (None para no limitar)
+    :param iter_limit: límite de iteraciones (None para no limitar)
+    :param feasibility_tol: tolerancia para aceptar como factible el punto de un solve detenido por un límite
+    :param stats: diccionario donde los solvers por etapas guardan información adicional (None para no guardarla)
+    :return: tupla (valor objetivo o None si no hay punto factible, condición de parada, estado del solver, tiempo)
+    '''
+
+    options, presolved = prepare(instance, solver, transformation, options, stats)
+
+    return solve_prepared(instance, solver, options, presolved, tee, logfile, time_limit, iter_limit,
+                          feasibility_tol, stats)
+
+
+def prepare(instance, solver: str, transformation='', options='', stats=None) -> tuple:
     '''
-    Resuelve el modelo con el solver indicado
+    Aplica el presolve, la transformación y el escalado de solve. Es la parte del solve que no llama
+    al solver, por lo que puede adelantarse mientras se resuelve otro modelo (ver campaign.run_pipeline)
 
     :param instance: instancia de un modelo abstracto de pyomo
     :param solver: nombre del solver a utilizar
+    :param transformation: transformación de pyomo a aplicar antes de resolver
+    :param options: opciones del solver ('clave=valor clave=valor')
+    :param stats: diccionario donde se guarda información del presolve (None para no guardarla)
+    :return: tupla (opciones del solver, datos del presolve o None si no se aplicó)
     '''
 
+    options = parse_options(options)
+
+    # presolve=1: eliminar Fw y lmbd del sistema KKT antes de transformar el modelo
+    presolved = eliminate(instance) if options.pop('presolve', 0) else None
+
+    if stats is not None and presolved is not None:
+        stats['presolve'] = {'Variables': presolved['Variables'], 'Rows': presolved['Rows']}
+
+    scaling = options.pop('scaling', 0)
+
+    # scenario=N: escenario del servicio de trabajos (service.py); solo distingue los resultados guardados
+    options.pop('scenario', None)
+
     if transformation != '':
         TransformationFactory(transformation).apply_to(instance) # type: ignore
 
-    opt = SolverFactory(solver, load_solutions=True, tee=True, report_timing=True)
+    if scaling:
+        # scaling=1: factores de escala calculados a partir de los parámetros del modelo
+        scale(instance)
+        options.update(SCALING_OPTIONS.get(subsolver(solver, options), dict()))
+
+    return options, presolved
+
+
+def solve_prepared(instance, solver: str, options: dict, presolved: dict = None, tee=True, logfile=None,
+                   time_limit=None, iter_limit=None, feasibility_tol=1e-5, stats=None):
+    '''
+    Llama al solver sobre un modelo ya preparado con prepare y reconstruye las variables eliminadas
+
+    :param options: opciones del solver devueltas por prepare
+    :param presolved: datos del presolve devueltos por prepare
+    :return: tupla (valor objetivo o None si no hay punto factible, condición de parada, estado del solver, tiempo)
+    '''
 
     # if solver == 'mpec_nlp':
     #     opt.options['mpec_bound'] = 0.1 
 
-    results = opt.solve(instance)
+    if logfile is not None:
+        # los meta-solvers (mpec_nlp, mpec_minlp) no pasan el logfile al subsolver,
+        # por lo que se captura toda la salida del proceso
+        from pyomo.common.tee import capture_output
+
+        with open(logfile, 'a') as log, capture_output(log):
+            rslt = _solve(instance, solver, options, True, time_limit, iter_limit, feasibility_tol, stats)
+
+    else:
+        rslt = _solve(instance, solver, options, tee, time_limit, iter_limit, feasibility_tol, stats)
+
+    termination_condition, solver_status, time, found = rslt
+
+    if presolved is not None and found:
+        reconstruct(instance, presolved)
+
+    obj_value = round(value(instance.upper_level_objective), 3) if found else None # type: ignore
+
+    return obj_value, termination_condition, solver_status, time
+
+
+def subsolver(solver: str, options: dict) -> str:
+    '''
+    Solver que resuelve finalmente los subproblemas (p. ej. ipopt para mpec_nlp o mpec_continuation)
+
+    :param solver: nombre del solver
+    :param options: opciones del solver
+    :return: nombre del subsolver
+    '''
+
+    defaults = dict(META_SOLVERS, mpec_continuation='ipopt', multistart='mpec_nlp')
+
+    # la opción solver solo elige el subsolver del primer nivel
+    if solver in defaults:
+        solver = options.get('solver', defaults[solver])
+
+    while solver in defaults:
+        solver = defaults[solver]
+
+    return solver
+
+
+def _solve(instance, solver: str, options: dict, tee: bool, time_limit, iter_limit, feasibility_tol, stats):
+    '''
+    Llama al solver con los límites traducidos a las opciones de cada backend
+
+    :return: tupla (condición de parada, estado del solver, tiempo, punto factible encontrado)
+    '''
+
+    if solver == 'mpec_continuation':
+        return solve_continuation(instance, options, tee, time_limit, iter_limit, feasibility_tol, stats)
+
+    if solver == 'lpcc_bb':
+        return solve_lpcc(instance, options, tee, time_limit, iter_limit, stats)
+
+    if solver == 'multistart':
+        return solve_multistart(instance, options, tee, time_limit, iter_limit, feasibility_tol, stats)
+
+    # mpec_nlp y mpec_minlp no pasan las opciones ni los límites a su subsolver
+    if solver in META_SOLVERS and (time_limit is not None or iter_limit is not None or is_scaled(instance)
+                                   or options.get('persistent')):
+        return solve_meta(instance, solver, options, tee, time_limit, iter_limit, feasibility_tol, stats)
+
+    options = dict(options)
+    persistent = options.pop('persistent', 0)
+
+    # persistent=1: el modelo queda cargado en el solver (ver persistent.py); sin interfaz persistente,
+    # con el modelo escalado o con componentes que la interfaz no admite se resuelve escribiendo el problema
+    opt = persistent_solver(solver, instance) if persistent and not is_scaled(instance) else None
+
+    if opt is not None:
+        termination_condition, solver_status, solve_time, found = opt.solve(options, tee, time_limit, iter_limit)
+
+        if stats is not None:
+            stats['solves'] = opt.stats
+
+        if found and termination_condition in (TIME_LIMIT, ITERATION_LIMIT):
+            found = max_violation(instance) <= feasibility_tol
+
+        return termination_condition, solver_status, solve_time, found
+
+    opt = SolverFactory(solver, load_solutions=True, tee=tee, report_timing=tee)
+
+    for key, val in dict(options, **limit_options(solver, time_limit, iter_limit)).items():
+        opt.options[key] = val
+
+    # los backends sin opción de tiempo límite reciben timelimit de pyomo
+    timelimit = time_limit if LIMIT_OPTIONS.get(solver, (None, ))[0] is None else None
+
+    call_start = time.time()
+    results = opt.solve(instance, tee=tee, timelimit=timelimit, load_solutions=False)
+
+    if stats is not None:
+        stats['solves'] = resolve_stats('file')
+        record(stats['solves'], time.time() - call_start, reported_time(results))
 
     # results.write() # imprimir los resultados del solver
 
-    obj_value = round(value(instance.upper_level_objective), 3) # type: ignore
+    termination_condition = limit_termination(results)
+
+    if termination_condition is None:
+        termination_condition = results.solver.termination_condition
+        instance.solutions.load_from(results)
+        found = True
+
+    else:
+        found = len(results.solution) > 0
+
+        if found:
+            instance.solutions.load_from(results)
+            found = max_violation(instance) <= feasibility_tol
 
     try:
         # instance.display()
-        return obj_value, results.solver.termination_condition, results.solver.status, results.solver.time
+        return termination_condition, results.solver.status, results.solver.time, found
     
     except:
-        return obj_value, results.solver.termination_condition, results.solver.status, results.solver.wallclock_time
+        return termination_condition, results.solver.status, results.solver.wallclock_time, found
+
 
 def evaluate(model, solver):
+    '''
+    Evalúa las restricciones del modelo resuelto y guarda el resultado en un .csv
+
+    :param model: instancia resuelta de un modelo de pyomo
+    :param solver: nombre del solver (y transformación) empleado
+    '''
+
+    # pandas solo se importa al generar el reporte
+    import pandas as pd
+
     max_val_equal = 0    
     max_val_ineq_g = 0    
     max_val_ineq_l = 0
@@ -262,10 +522,23 @@ def evaluate(model, solver):
         val = round(val, 3) # type: ignore             
         lg.append(['Lg', item, val, val == 0])
 
+    r5 = []
+
+    for item in model.EP_P_EP_P_CAP:
+        val = value(model.constraint_5[item].body)
+
+        val = round(val, 3) # type: ignore
+        r5.append(['R5', item, val, val <= 0])
+
+        val_1 = round(value(model.mu_5[item])) # type: ignore
+        mu.append(['mu_5', item, val_1, val_1 >= 0])
+        comp_2.append(['comp_5', item, val*val_1, val*val_1 == 0])
+
     re.extend(r1)
     re.extend(r2)
     re.extend(r3)
     re.extend(r4)
+    re.extend(r5)
     re.extend(lg)
     re.extend(comp)
     re.extend(comp_2)
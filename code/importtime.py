@@ -0,0 +1,84 @@
+import subprocess
+import sys
+
+# Módulos pesados que no deben cargarse en las rutas de datos, base de datos y reportes
+HEAVY_MODULES = ('pyomo', 'sympy', 'pandas', 'numpy', 'scipy')
+
+# Presupuesto de tiempo de importación en frío (microsegundos) por punto de entrada
+# y si el punto de entrada puede cargar módulos pesados
+BUDGETS = {
+    'database.utils_db': (150_000, False),
+    'database.insert_db': (150_000, False),
+    'reports': (150_000, False),
+    'cli': (200_000, False),
+    'service': (200_000, False),
+    'eip_model': (3_000_000, True),
+}
+
+
+def measure(module: str) -> tuple:
+    '''
+    Mide el tiempo de importación en frío de un módulo con `python -X importtime`
+
+    :param module: nombre del módulo a importar
+    :return: tupla (tiempo acumulado en microsegundos, conjunto de módulos importados)
+    '''
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        capture_output=True, text=True, check=True,
+    )
+
+    total = 0
+    imported = set()
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, raw_name = line[len('import time:'):].split('|')
+        name = raw_name.strip()
+        imported.add(name)
+
+        # la línea del módulo pedido es la de primer nivel (un solo espacio de sangría)
+        if name == module and raw_name == ' ' + name:
+            total = int(cumulative)
+
+    return total, imported
+
+
+def check(budgets: dict = BUDGETS) -> list:
+    '''
+    Verifica los presupuestos de tiempo de importación de los puntos de entrada
+
+    :param budgets: diccionario {módulo: (presupuesto en microsegundos, permite módulos pesados)}
+    :return: lista de mensajes con los presupuestos incumplidos (vacía si se cumplen todos)
+    '''
+
+    failures = []
+
+    for module, (budget, allow_heavy) in budgets.items():
+        total, imported = measure(module)
+
+        if total > budget:
+            failures.append('%s: %d us > %d us' % (module, total, budget))
+
+        if not allow_heavy:
+            heavy = sorted({name.split('.')[0] for name in imported} & set(HEAVY_MODULES))
+
+            if heavy:
+                failures.append('%s importa %s' % (module, ', '.join(heavy)))
+
+    return failures
+
+
+if __name__ == '__main__':
+    for module in BUDGETS:
+        print('%-20s %10d us' % (module, measure(module)[0]))
+
+    failures = check()
+
+    for failure in failures:
+        print('FALLO', failure)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,211 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from pyomo.environ import Block, Constraint, Reference
+
+# Este módulo arma las filas de estacionariedad del sistema KKT de cada empresa (las de lagrangian_expr).
+# Los coeficientes se calculan a partir de los datos del modelo (sin pyomo ni sympy), por lo que cada
+# empresa puede procesarse en un proceso aparte; el proceso principal solo arma las expresiones.
+# Con los parámetros de una instancia (instance_tasks) los coeficientes quedan como expresiones de
+# los parámetros, como los necesita sensitivity
+
+
+def firm_tasks(data) -> dict:
+    '''
+    Datos que necesita el cálculo de las filas de cada empresa: sus procesos y las tuberías que salen de ellos
+
+    :param data: instancia de la clase Data
+    :return: diccionario {empresa: (beta, {proceso: (Cmax_in, Cmax_out)}, [(tubería, costo de bombeo, con capacidad)])}
+    '''
+
+    tasks = {ep: (data.beta, dict(), []) for ep in data.EP}
+
+    for ep, p in data.EP_P:
+        tasks[ep][1][p] = (data.Cmax_in[ep, p], data.Cmax_out[ep, p])
+
+    for arc in data.EP_P_EP_P:
+        tasks[arc[0]][2].append((arc, data.Cb.get(arc, data.delta), arc in data.Fp_max))
+
+    return tasks
+
+
+def instance_tasks(instance) -> dict:
+    '''
+    Datos de cada empresa como en firm_tasks, pero con los parámetros mutables de la instancia en lugar
+    de sus valores: los coeficientes de firm_coefficients quedan en función de beta, delta, Cb, Cmax_in
+    y Cmax_out
+
+    :param instance: instancia de un modelo de pyomo
+    :return: diccionario {empresa: (beta, {proceso: (Cmax_in, Cmax_out)}, [(tubería, costo de bombeo, con capacidad)])}
+    '''
+
+    tasks = {ep: (instance.beta, dict(), []) for ep in instance.EP}
+
+    for ep, p in instance.EP_P:
+        tasks[ep][1][p] = (instance.Cmax_in[ep, p], instance.Cmax_out[ep, p])
+
+    for arc in instance.EP_P_EP_P:
+        cost = instance.Cb[arc] if arc in instance.EP_P_EP_P_CB else instance.delta
+        tasks[arc[0]][2].append((arc, cost, arc in instance.EP_P_EP_P_CAP))
+
+    return tasks
+
+
+def firm_coefficients(task: tuple) -> tuple:
+    '''
+    Calcula las filas de estacionariedad de una empresa: la derivada de su lagrangiana con respecto a
+    cada Fp[ep, p, ep_, p_] que sale de sus procesos. Son las mismas filas que lagrangian_expr deriva con
+    sympy, con los términos en el mismo orden (incluidos los coeficientes nulos):
+
+    - objetivo: costo de bombeo (la mitad si la tubería va a otra empresa, que además paga beta al descargar)
+    - -mu_2 y, si la tubería tiene capacidad, +mu_5
+    - para el proceso que envía (p) y, si es de la misma empresa, el que recibe (p_), en orden:
+      mu[., 1] * dR1, lmbd * dR3 y mu[., 4] * dR4, donde solo el que recibe tiene dR1 y dR3 no nulos
+
+    :param task: datos de la empresa (ver firm_tasks e instance_tasks)
+    :return: tupla (tuberías, constantes, términos); términos[i] es la lista de tuplas
+             (variable, índice, coeficiente) de la fila de la tubería i
+    '''
+
+    beta, processes, arcs = task
+
+    rows, constants, terms = [], [], []
+
+    for arc, cost, capacity in arcs:
+        ep, p, ep_, p_ = arc
+
+        row = [('mu_2', arc, -1.0)]
+
+        if capacity:
+            row.append(('mu_5', arc, 1.0))
+
+        for p_1 in sorted((p, p_) if ep == ep_ else (p, )):
+            receives = ep == ep_ and p_1 == p_
+            cmax_in, cmax_out = processes[p_1]
+
+            c1 = processes[p][1] - cmax_in if receives else 0.0
+            c3 = processes[p][1] - cmax_out if receives else 0.0
+            c4 = (p_1 == p) - receives
+
+            row.extend([('mu', (ep, p_1, 1), c1), ('lmbd', (ep, p_1), c3), ('mu', (ep, p_1, 4), float(c4))])
+
+        rows.append(arc)
+        constants.append(cost if ep == ep_ else cost / 2 - beta)
+        terms.append(row)
+
+    return rows, constants, terms
+
+
+def compute_coefficients(data, workers: int = 1) -> dict:
+    '''
+    Calcula las filas de estacionariedad de todas las empresas
+
+    :param data: instancia de la clase Data
+    :param workers: procesos que calculan en paralelo (1 para calcular en este proceso)
+    :return: diccionario {empresa: resultado de firm_coefficients}
+    '''
+
+    tasks = firm_tasks(data)
+    workers = min(workers, len(tasks))
+
+    if workers <= 1:
+        return {ep: firm_coefficients(task) for ep, task in tasks.items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(tasks) // (4 * workers))
+
+        return dict(zip(tasks, pool.map(firm_coefficients, tasks.values(), chunksize=chunksize)))
+
+
+def row_expr(instance, constant, row: list):
+    '''
+    Expresión de una fila de estacionariedad
+
+    :param instance: instancia de un modelo de pyomo
+    :param constant: término constante de la fila
+    :param row: términos de la fila (ver firm_coefficients)
+    :return: expresión de pyomo
+    '''
+
+    expr = constant
+
+    for name, key, coef in row:
+        var = getattr(instance, name)[key]
+
+        if isinstance(coef, float) and abs(coef) == 1:
+            expr += var if coef > 0 else -var
+
+        else:
+            expr += coef * var
+
+    return expr
+
+
+def add_firm_blocks(instance, coefficients: dict) -> None:
+    '''
+    Añade a la instancia el bloque firm[ep] de cada empresa con su restricción indexada lagrangian,
+    armada a partir de los coeficientes de compute_coefficients. Los bloques se crean sin reglas para
+    que la instancia se pueda serializar (p. ej. en multistart)
+
+    :param instance: instancia de un modelo de pyomo ya construida
+    :param coefficients: diccionario {empresa: resultado de firm_coefficients}
+    '''
+
+    instance.firm = Block(instance.EP)
+
+    for ep in instance.EP:
+        rows, constants, terms = coefficients[ep]
+
+        block = instance.firm[ep]
+        block.lagrangian = Constraint(rows)
+
+        for arc, constant, row in zip(rows, constants, terms):
+            block.lagrangian[arc] = row_expr(instance, constant, row) == 0
+
+
+def lagrangian_reference(instance):
+    '''
+    Componente indexado por EP_P_EP_P con las filas de los bloques de las empresas, para acceder a ellas
+    como instance.lagrangian[tubería] (las restricciones siguen perteneciendo a los bloques)
+
+    :param instance: instancia con los bloques firm
+    :return: referencia a las filas
+    '''
+
+    return Reference({arc: instance.firm[arc[0]].lagrangian[arc] for arc in instance.EP_P_EP_P})
+
+
+def check_reference(instance, tol: float = 1e-9) -> list:
+    '''
+    Compara las filas de los bloques de las empresas con las que deriva rules.lagrangian_expr con sympy
+    (la referencia de firm_coefficients). Con muchas tuberías la derivación simbólica es lenta
+
+    :param instance: instancia con los bloques firm
+    :param tol: diferencia máxima entre coeficientes
+    :return: lista de las tuberías cuyas filas no coinciden
+    '''
+
+    from pyomo.repn import generate_standard_repn
+
+    from rules import lagrangian_expr
+
+    def linear(expr) -> tuple:
+        repn = generate_standard_repn(expr, compute_values=True)
+        coefs = dict()
+
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            coefs[id(var)] = coefs.get(id(var), 0.0) + coef
+
+        return repn.constant, coefs
+
+    mismatches = []
+
+    for arc in instance.EP_P_EP_P:
+        constant, coefs = linear(instance.firm[arc[0]].lagrangian[arc].body)
+        ref_constant, ref_coefs = linear(lagrangian_expr(instance, *arc).args[0])
+
+        diff = [abs(constant - ref_constant)] + [abs(coefs.get(k, 0.0) - ref_coefs.get(k, 0.0)) for k in set(coefs) | set(ref_coefs)]
+
+        if max(diff) > tol:
+            mismatches.append(arc)
+
+    return mismatches
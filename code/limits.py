@@ -0,0 +1,312 @@
+import time
+
+from pyomo.environ import SolverFactory, TransformationFactory, Constraint, Var, value
+from pyomo.opt import TerminationCondition
+from pyomo.mpec import Complementarity
+
+from scaling import is_scaled, scale_rows
+
+# Nombre de las opciones de tiempo límite (s) e iteraciones de cada backend
+LIMIT_OPTIONS = {
+    'ipopt': ('max_cpu_time', 'max_iter'),
+    'glpk': ('tmlim', None),
+    'cbc': ('sec', 'maxIterations'),
+    'appsi_highs': ('time_limit', 'simplex_iteration_limit'),
+    'gurobi': ('TimeLimit', 'IterationLimit'),
+    'cplex': ('timelimit', 'simplex_limits_iterations'),
+    'scip': ('limits/time', None),
+}
+
+# Violación de complementariedad de los puntos aceptados de las relajaciones
+COMP_TOL = 1e-6
+
+# Subsolver por defecto de los meta-solvers de pyomo.mpec
+META_SOLVERS = {'mpec_nlp': 'ipopt', 'mpec_minlp': 'glpk'}
+
+# Condiciones de parada por límite y su nombre en Results_Info
+TIME_LIMIT = 'time_limit'
+ITERATION_LIMIT = 'iteration_limit'
+
+LIMIT_TERMINATIONS = (TerminationCondition.maxTimeLimit, TerminationCondition.maxIterations,
+                      TerminationCondition.maxEvaluations)
+
+
+def limit_options(solver: str, time_limit: float = None, iter_limit: int = None) -> dict:
+    '''
+    Traduce los límites de tiempo e iteraciones a las opciones del backend
+
+    :param solver: nombre del solver
+    :param time_limit: tiempo límite en segundos (None para no limitar)
+    :param iter_limit: límite de iteraciones (None para no limitar)
+    :return: diccionario de opciones del solver
+    '''
+
+    time_key, iter_key = LIMIT_OPTIONS.get(solver, (None, None))
+    options = dict()
+
+    if time_limit is not None and time_key is not None:
+        options[time_key] = time_limit
+
+    if iter_limit is not None and iter_key is not None:
+        options[iter_key] = int(iter_limit)
+
+    return options
+
+
+def limit_termination(results):
+    '''
+    Clasifica la condición de parada de un resultado detenido por un límite
+
+    :param results: resultados del solver
+    :return: TIME_LIMIT, ITERATION_LIMIT o None si el solver no se detuvo por un límite
+    '''
+
+    termination_condition = results.solver.termination_condition
+
+    if termination_condition == TerminationCondition.maxTimeLimit:
+        return TIME_LIMIT
+
+    if termination_condition in LIMIT_TERMINATIONS:
+        # ipopt reporta el límite de tiempo con el mismo código AMPL que el de iteraciones
+        message = str(results.solver.message or '').lower()
+
+        return TIME_LIMIT if 'time' in message else ITERATION_LIMIT
+
+    return None
+
+
+def max_violation(instance, constraints: list = None) -> float:
+    '''
+    Calcula la máxima violación de las restricciones activas en el punto actual
+
+    :param instance: instancia de un modelo de pyomo
+    :param constraints: restricciones que se revisan (None para todas las activas de la instancia)
+    :return: máxima violación (inf si alguna variable no tiene valor)
+    '''
+
+    violation = 0.0
+
+    if constraints is None:
+        constraints = instance.component_data_objects(Constraint, active=True, descend_into=True)
+
+    for con in constraints:
+        try:
+            body = value(con.body)
+
+        except ValueError:
+            return float('inf')
+
+        if con.has_lb():
+            violation = max(violation, value(con.lower) - body)
+
+        if con.has_ub():
+            violation = max(violation, body - value(con.upper))
+
+    return violation
+
+
+def complementarity_pairs(instance) -> list:
+    '''
+    Obtiene los pares de expresiones de las restricciones de complementariedad activas.
+    Debe llamarse antes de transformar el modelo
+
+    :param instance: instancia de un modelo de pyomo
+    :return: lista de tuplas (expresión 1, expresión 2), cada una una desigualdad
+    '''
+
+    return [cdata._args for cdata in instance.component_data_objects(Complementarity, active=True)]
+
+
+def slack(expr) -> float:
+    '''
+    Holgura de una desigualdad (a <= b) o (a <= b <= c) en el punto actual
+
+    :param expr: expresión de desigualdad de pyomo
+    :return: holgura (negativa si se viola)
+    '''
+
+    args = [value(arg) for arg in expr.args]
+
+    return min(args[i + 1] - args[i] for i in range(len(args) - 1))
+
+
+def complementarity_violation(pairs: list) -> float:
+    '''
+    Máxima violación de complementariedad max |min(s1, s2)| en el punto actual
+
+    :param pairs: pares de desigualdades obtenidos con complementarity_pairs
+    :return: máxima violación
+    '''
+
+    return max((abs(min(slack(expr1), slack(expr2))) for expr1, expr2 in pairs), default=0.0)
+
+
+def original_rows(instance, transformation: str = 'mpec.simple_nonlinear') -> list:
+    '''
+    Restricciones activas del modelo fuera de los bloques de complementariedad relajados por
+    la transformación (que dependen de epsilon). Debe llamarse después de la transformación
+
+    :param instance: instancia de un modelo de pyomo transformada
+    :param transformation: transformación de pyomo.mpec aplicada
+    :return: lista de restricciones
+    '''
+
+    relaxed = set()
+
+    for cuid in instance._transformation_data[transformation].compl_cuids:
+        for cdata in cuid.find_component_on(instance).values():
+            relaxed.update(id(con) for con in cdata.component_data_objects(Constraint, descend_into=True))
+
+    return [con for con in instance.component_data_objects(Constraint, active=True, descend_into=True) if id(con) not in relaxed]
+
+
+def snapshot(instance) -> list:
+    '''
+    Guarda los valores actuales de las variables de una instancia
+
+    :param instance: instancia de un modelo de pyomo
+    :return: lista de tuplas (variable, valor)
+    '''
+
+    return [(var, var.value) for var in instance.component_data_objects(Var, descend_into=True)]
+
+
+def restore(values: list) -> None:
+    '''
+    Restaura los valores de las variables guardados con snapshot
+
+    :param values: lista de tuplas (variable, valor)
+    '''
+
+    for var, val in values:
+        var.set_value(val, skip_validation=True)
+
+
+def solve_meta(instance, solver: str, options: dict, tee: bool = False, time_limit: float = None,
+               iter_limit: int = None, feasibility_tol: float = 1e-5, stats: dict = None):
+    '''
+    Resuelve con un meta-solver de pyomo.mpec (mpec_nlp o mpec_minlp) aplicando la transformación
+    y el subsolver de forma explícita, para poder pasarle al subsolver los límites de tiempo e iteraciones.
+    Si un límite se alcanza se conserva el mejor punto factible encontrado.
+
+    :param instance: instancia de un modelo de pyomo
+    :param solver: nombre del meta-solver
+    :param options: opciones del meta-solver (solver, epsilon_initial, epsilon_final, bigM, persistent, comp_tol)
+                    y del subsolver (el resto); con persistent=1 el subsolver mantiene el modelo cargado
+                    entre etapas si tiene interfaz persistente (ver persistent.py)
+    :param tee: mostrar la salida del subsolver en la consola
+    :param time_limit: tiempo límite total en segundos
+    :param iter_limit: límite de iteraciones de cada llamada al subsolver
+    :param feasibility_tol: tolerancia de factibilidad del mejor punto
+    :param stats: diccionario donde se guardan el tiempo del subsolver y la sobrecarga de sus llamadas
+                  en 'solves' (None para no guardarlos)
+    :return: tupla (condición de parada, estado del solver, tiempo, punto factible encontrado)
+    '''
+
+    # persistent importa este módulo
+    from persistent import PersistentSolver, persistent_solver, record, reported_time, resolve_stats
+
+    start = time.time()
+    options = dict(options)
+
+    subsolver = options.pop('solver', META_SOLVERS[solver])
+    epsilon_final = options.pop('epsilon_final', 1e-7)
+    epsilon = options.pop('epsilon_initial', epsilon_final)
+    bigM = options.pop('bigM', 10**6)
+    persistent = options.pop('persistent', 0)
+    comp_tol = options.pop('comp_tol', COMP_TOL)
+
+    pairs = complementarity_pairs(instance)
+
+    if solver == 'mpec_nlp':
+        TransformationFactory('mpec.simple_nonlinear').apply_to(instance)
+        rows = original_rows(instance)
+        schedule = []
+
+        while True:
+            schedule.append(epsilon)
+            epsilon /= 10.0
+
+            if epsilon < epsilon_final:
+                break
+
+    else:
+        TransformationFactory('mpec.simple_disjunction').apply_to(instance)
+        TransformationFactory('gdp.bigm').apply_to(instance, bigM=bigM)
+        rows = None
+        schedule = [None]
+
+    if is_scaled(instance):
+        scale_rows(instance)
+
+    # las interfaces persistentes no leen el suffix scaling_factor
+    opt = persistent_solver(subsolver, instance) if persistent and not is_scaled(instance) else None
+
+    if opt is None:
+        opt = SolverFactory(subsolver)
+        solves = resolve_stats('file')
+
+    else:
+        solves = opt.stats
+
+    best = None
+    termination_condition = TerminationCondition.unknown
+    solver_status = None
+
+    for epsilon in schedule:
+        remaining = None
+
+        if time_limit is not None:
+            remaining = time_limit - (time.time() - start)
+
+            if remaining <= 0:
+                termination_condition = TIME_LIMIT
+                break
+
+        if epsilon is not None:
+            instance.mpec_bound.set_value(epsilon)
+
+        if isinstance(opt, PersistentSolver):
+            termination_condition, solver_status, _, found = opt.solve(options, tee, remaining, iter_limit)
+
+        else:
+            for key, val in dict(options, **limit_options(subsolver, remaining, iter_limit)).items():
+                opt.options[key] = val
+
+            # el límite de tiempo del subsolver se pasa como opción; timelimit solo
+            # se usa en los backends sin opción propia (pyomo lo traduce o corta el proceso)
+            timelimit = remaining if LIMIT_OPTIONS.get(subsolver, (None, ))[0] is None else None
+
+            call_start = time.time()
+            results = opt.solve(instance, tee=tee, timelimit=timelimit, load_solutions=False)
+            record(solves, time.time() - call_start, reported_time(results))
+
+            solver_status = results.solver.status
+            found = len(results.solution) > 0
+
+            if found:
+                instance.solutions.load_from(results)
+
+            termination_condition = limit_termination(results) or results.solver.termination_condition
+
+        # un punto de la relajación (v * g <= epsilon) no es solución del MPEC hasta que la complementariedad se cumple
+        if found and complementarity_violation(pairs) <= comp_tol and max_violation(instance, rows) <= feasibility_tol:
+            best = snapshot(instance)
+
+        if termination_condition in (TIME_LIMIT, ITERATION_LIMIT):
+            break
+
+    # reclasificar los componentes de complementariedad como lo hace el meta-solver
+    xfrm = 'mpec.simple_nonlinear' if solver == 'mpec_nlp' else 'mpec.simple_disjunction'
+
+    for cuid in instance._transformation_data[xfrm].compl_cuids:
+        cobj = cuid.find_component_on(instance)
+        cobj.parent_block().reclassify_component_type(cobj, Complementarity)
+
+    if best is not None:
+        restore(best)
+
+    if stats is not None:
+        stats['solves'] = solves
+
+    return termination_condition, solver_status, time.time() - start, best is not None
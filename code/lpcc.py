@@ -0,0 +1,498 @@
+import heapq
+import math
+import time
+
+from pyomo.environ import Constraint, Objective, value, minimize
+from pyomo.mpec import Complementarity
+from pyomo.opt import TerminationCondition
+from pyomo.repn import generate_standard_repn
+
+from limits import ITERATION_LIMIT, TIME_LIMIT
+
+INF = float('inf')
+
+# Estado del LP de un nodo (los demás estados son los mensajes de cada backend)
+OPTIMAL = 'optimal'
+INFEASIBLE = 'infeasible'
+
+# Tolerancias por defecto
+COMP_TOL = 1e-6  # complementariedad (relativa a la magnitud de las holguras)
+GAP_TOL = 1e-6  # brecha relativa entre la cota y la mejor solución
+HEURISTIC_FREQ = 50  # cada cuántos nodos se intenta la heurística de redondeo
+
+
+class LPCC:
+    '''
+    Representación lineal de un programa con restricciones de complementariedad (LPCC):
+
+        min c'x  s.a.  row_lb <= A x <= row_ub,  col_lb <= x <= col_ub,
+                       0 <= s1_k(x) ⊥ s2_k(x) >= 0  para cada par k
+
+    Cada lado de un par es una columna (holgura = x_j - cota) o una fila de A (holgura = A_i x - cota).
+    Fijar un lado en cero equivale a fijar la cota de esa columna o fila.
+    '''
+
+    def __init__(self, instance):
+        self.vars = []  # variables de pyomo en el orden de las columnas
+        self.col_lb = []
+        self.col_ub = []
+        self.cost = []
+        self.obj_offset = 0.0
+
+        self.rows = []  # filas como diccionarios {columna: coeficiente}
+        self.row_lb = []
+        self.row_ub = []
+
+        # cada lado es una tupla ('col' | 'row', índice, cota): la holgura es |valor - cota|
+        self.pairs = []
+
+        self._col_index = dict()
+
+        # factores de escala de las columnas (suffix scaling_factor): la columna es factor * variable
+        self.col_scale = []
+        self._scaling = instance.component('scaling_factor')
+
+        self.load(instance)
+
+    def col(self, var) -> int:
+        idx = self._col_index.get(id(var))
+
+        if idx is None:
+            idx = self._col_index[id(var)] = len(self.vars)
+            factor = self._scaling.get(var, 1.0) if self._scaling is not None else 1.0
+
+            self.vars.append(var)
+            self.col_scale.append(factor)
+            self.col_lb.append(-INF if var.lb is None else value(var.lb) * factor)
+            self.col_ub.append(INF if var.ub is None else value(var.ub) * factor)
+            self.cost.append(0.0)
+
+        return idx
+
+    def linear(self, expr) -> tuple:
+        '''
+        Expresión lineal {columna: coeficiente} y constante de una expresión de pyomo
+
+        :param expr: expresión de pyomo
+        :return: tupla (coeficientes, constante)
+        '''
+
+        repn = generate_standard_repn(expr, compute_values=True, quadratic=False)
+
+        if not repn.is_linear():
+            raise ValueError('lpcc_bb requiere un modelo lineal: %s no es lineal' % expr)
+
+        coefs = dict()
+
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            if coef != 0:
+                idx = self.col(var)
+                coefs[idx] = coefs.get(idx, 0.0) + coef / self.col_scale[idx]
+
+        return coefs, value(repn.constant)
+
+    def row_factor(self, coefs: dict) -> float:
+        '''
+        Factor que lleva a 1 el mayor coeficiente de una fila (1 si el modelo no tiene factores de escala)
+        '''
+
+        largest = max(map(abs, coefs.values()), default=0.0)
+
+        return 1 / largest if self._scaling is not None and largest > 0 else 1.0
+
+    def values(self, x: list) -> list:
+        '''
+        Valores de las variables originales a partir de las columnas (escaladas)
+        '''
+
+        return [float(val) / factor for val, factor in zip(x, self.col_scale)]
+
+    def add_row(self, coefs: dict, lb: float, ub: float) -> int:
+        self.rows.append(coefs)
+        self.row_lb.append(lb)
+        self.row_ub.append(ub)
+
+        return len(self.rows) - 1
+
+    def side(self, expr) -> tuple:
+        '''
+        Lado de un par de complementariedad a partir de una desigualdad a <= b
+
+        :param expr: desigualdad de pyomo con dos argumentos
+        :return: tupla ('col' | 'row', índice, cota)
+        '''
+
+        coefs, const = self.linear(expr.args[1] - expr.args[0])  # holgura >= 0
+        factor = self.row_factor(coefs)
+        coefs, const = {idx: coef * factor for idx, coef in coefs.items()}, const * factor
+
+        if len(coefs) == 1:
+            (idx, coef), = coefs.items()
+
+            # holgura = coef * x + const >= 0 es una cota de la columna
+            bound = -const / coef
+
+            if coef > 0 and self.col_lb[idx] <= bound:
+                self.col_lb[idx] = max(self.col_lb[idx], bound)
+                return ('col', idx, bound)
+
+            if coef < 0 and self.col_ub[idx] >= bound:
+                self.col_ub[idx] = min(self.col_ub[idx], bound)
+                return ('col', idx, bound)
+
+        return ('row', self.add_row(coefs, -const, INF), -const)
+
+    def load(self, instance) -> None:
+        # solo las variables que aparecen en el objetivo o en alguna restricción son columnas
+        objectives = list(instance.component_data_objects(Objective, active=True, descend_into=True))
+
+        if len(objectives) != 1:
+            raise ValueError('lpcc_bb requiere exactamente un objetivo activo')
+
+        sense = 1.0 if objectives[0].sense == minimize else -1.0
+        coefs, self.obj_offset = self.linear(objectives[0].expr)
+        self.sense = sense
+
+        for idx, coef in coefs.items():
+            self.cost[idx] = sense * coef
+
+        for con in instance.component_data_objects(Constraint, active=True, descend_into=True):
+            coefs, const = self.linear(con.body)
+            factor = self.row_factor(coefs)
+
+            coefs = {idx: coef * factor for idx, coef in coefs.items()}
+            lb = -INF if not con.has_lb() else (value(con.lower) - const) * factor
+            ub = INF if not con.has_ub() else (value(con.upper) - const) * factor
+
+            if not coefs:
+                if lb > 1e-9 or ub < -1e-9:
+                    raise ValueError('La restricción %s es infactible' % con.name)
+                continue
+
+            self.add_row(coefs, lb, ub)
+
+        for cdata in instance.component_data_objects(Complementarity, active=True, descend_into=True):
+            self.pairs.append((self.side(cdata._args[0]), self.side(cdata._args[1])))
+
+    def objective(self, lp_obj: float) -> float:
+        '''
+        Valor del objetivo del modelo a partir del objetivo del LP (que siempre minimiza)
+        '''
+
+        if math.isinf(lp_obj):
+            return lp_obj
+
+        return self.sense * lp_obj + self.obj_offset
+
+    def slack(self, side: tuple, x: list, row_values: list) -> float:
+        kind, idx, bound = side
+        val = x[idx] if kind == 'col' else row_values[idx]
+
+        return abs(val - bound)
+
+
+class HighsLP:
+    '''
+    LP de los nodos resuelto con highspy; la base del último nodo se reutiliza (arranque en caliente).
+    solve devuelve (estado, objetivo, valores de las columnas, valores de las filas)
+    '''
+
+    def __init__(self, lpcc: LPCC):
+        import highspy
+        import numpy as np
+
+        self.highspy = highspy
+        self.np = np
+        self.h = highspy.Highs()
+        self.h.setOptionValue('output_flag', False)
+
+        inf = highspy.kHighsInf
+        lp = highspy.HighsLp()
+        lp.num_col_ = len(lpcc.vars)
+        lp.num_row_ = len(lpcc.rows)
+        lp.col_cost_ = np.array(lpcc.cost, dtype=float)
+        lp.col_lower_ = np.clip(np.array(lpcc.col_lb, dtype=float), -inf, inf)
+        lp.col_upper_ = np.clip(np.array(lpcc.col_ub, dtype=float), -inf, inf)
+        lp.row_lower_ = np.clip(np.array(lpcc.row_lb, dtype=float), -inf, inf)
+        lp.row_upper_ = np.clip(np.array(lpcc.row_ub, dtype=float), -inf, inf)
+
+        # matriz por filas
+        start, index, values = [0], [], []
+
+        for coefs in lpcc.rows:
+            index.extend(coefs.keys())
+            values.extend(coefs.values())
+            start.append(len(index))
+
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.start_ = np.array(start, dtype=np.int32)
+        lp.a_matrix_.index_ = np.array(index, dtype=np.int32)
+        lp.a_matrix_.value_ = np.array(values, dtype=float)
+        lp.a_matrix_.num_col_ = lp.num_col_
+        lp.a_matrix_.num_row_ = lp.num_row_
+
+        self.h.passModel(lp)
+        self.iterations = 0
+
+    def set_col_bounds(self, idx: int, lb: float, ub: float) -> None:
+        self.h.changeColBounds(idx, max(lb, -self.highspy.kHighsInf), min(ub, self.highspy.kHighsInf))
+
+    def set_row_bounds(self, idx: int, lb: float, ub: float) -> None:
+        self.h.changeRowBounds(idx, max(lb, -self.highspy.kHighsInf), min(ub, self.highspy.kHighsInf))
+
+    def solve(self) -> tuple:
+        self.h.run()
+        self.iterations += self.h.getInfo().simplex_iteration_count
+
+        status = self.h.getModelStatus()
+
+        if status == self.highspy.HighsModelStatus.kInfeasible:
+            return INFEASIBLE, None, None, None
+
+        if status != self.highspy.HighsModelStatus.kOptimal:
+            return self.h.modelStatusToString(status), None, None, None
+
+        solution = self.h.getSolution()
+
+        return OPTIMAL, self.h.getInfo().objective_function_value, list(solution.col_value), list(solution.row_value)
+
+
+class ScipyLP:
+    '''
+    LP de los nodos resuelto con scipy.optimize.linprog (HiGHS); cada nodo se resuelve desde cero
+    '''
+
+    def __init__(self, lpcc: LPCC):
+        from scipy.optimize import linprog
+        from scipy.sparse import csr_matrix
+
+        self.linprog = linprog
+
+        data, index, start = [], [], [0]
+
+        for coefs in lpcc.rows:
+            index.extend(coefs.keys())
+            data.extend(coefs.values())
+            start.append(len(index))
+
+        self.A = csr_matrix((data, index, start), shape=(len(lpcc.rows), len(lpcc.vars)))
+        self.cost = list(lpcc.cost)
+        self.col_lb, self.col_ub = list(lpcc.col_lb), list(lpcc.col_ub)
+        self.row_lb, self.row_ub = list(lpcc.row_lb), list(lpcc.row_ub)
+        self.iterations = 0
+
+    def set_col_bounds(self, idx: int, lb: float, ub: float) -> None:
+        self.col_lb[idx], self.col_ub[idx] = lb, ub
+
+    def set_row_bounds(self, idx: int, lb: float, ub: float) -> None:
+        self.row_lb[idx], self.row_ub[idx] = lb, ub
+
+    def solve(self) -> tuple:
+        from scipy.sparse import vstack
+
+        # l <= A x <= u como A x <= u, -A x <= -l
+        upper = [i for i, ub in enumerate(self.row_ub) if ub < INF and self.row_lb[i] != ub]
+        lower = [i for i, lb in enumerate(self.row_lb) if lb > -INF and self.row_ub[i] != lb]
+        equal = [i for i, lb in enumerate(self.row_lb) if lb == self.row_ub[i]]
+
+        A_ub = vstack([self.A[upper], -self.A[lower]])
+        b_ub = [self.row_ub[i] for i in upper] + [-self.row_lb[i] for i in lower]
+
+        res = self.linprog(self.cost, A_ub=A_ub, b_ub=b_ub, A_eq=self.A[equal] if equal else None,
+                           b_eq=[self.row_lb[i] for i in equal] if equal else None,
+                           bounds=[(None if lb == -INF else lb, None if ub == INF else ub) for lb, ub in zip(self.col_lb, self.col_ub)],
+                           method='highs')
+        self.iterations += res.nit
+
+        if res.status == 2:
+            return INFEASIBLE, None, None, None
+
+        if res.status != 0:
+            return res.message, None, None, None
+
+        x = list(res.x)
+
+        return OPTIMAL, res.fun, x, list(self.A @ res.x)
+
+
+def lp_backend(lpcc: LPCC, name: str = None):
+    '''
+    Crea el solver de LP de los nodos: highspy si está instalado, si no scipy
+
+    :param lpcc: LPCC a resolver
+    :param name: 'highs' o 'scipy' (None para elegir automáticamente)
+    :return: instancia de HighsLP o ScipyLP
+    '''
+
+    if name in (None, 'highs'):
+        try:
+            return HighsLP(lpcc)
+
+        except ImportError:
+            if name == 'highs':
+                raise
+
+    return ScipyLP(lpcc)
+
+
+def solve_lpcc(instance, options: dict, tee: bool = False, time_limit: float = None,
+               iter_limit: int = None, stats: dict = None):
+    '''
+    Resuelve el sistema KKT del modelo como un LPCC por ramificación y acotamiento.
+    Cada nodo es un LP en el que algunos pares de complementariedad tienen uno de sus lados fijado en cero;
+    se ramifica sobre el par más violado. Si el árbol se agota la solución es un óptimo global certificado.
+    Solo se podan los nodos cuyo LP es infactible: si el LP de un nodo termina en otro estado la búsqueda
+    se detiene con la condición error (el estado queda en stats['lpcc']['lp_status'])
+
+    :param instance: instancia de un modelo de pyomo con objetivo, restricciones y complementariedades lineales
+    :param options: opciones (lp: 'highs' | 'scipy', comp_tol, gap_tol, heuristic_freq)
+    :param tee: imprimir el progreso del árbol
+    :param time_limit: tiempo límite en segundos
+    :param iter_limit: límite de nodos
+    :param stats: diccionario donde se guardan los nodos, la cota y la brecha (None para no guardarlos)
+    :return: tupla (condición de parada, estado del solver, tiempo, punto factible encontrado)
+    '''
+
+    start = time.time()
+
+    comp_tol = options.get('comp_tol', COMP_TOL)
+    gap_tol = options.get('gap_tol', GAP_TOL)
+    heuristic_freq = options.get('heuristic_freq', HEURISTIC_FREQ)
+
+    lpcc = LPCC(instance)
+    lp = lp_backend(lpcc, options.get('lp'))
+
+    applied = dict()  # par -> lado fijado actualmente en el LP
+
+    def fix(side: tuple, fixed: bool) -> None:
+        kind, idx, bound = side
+
+        if kind == 'col':
+            if fixed:
+                lp.set_col_bounds(idx, bound, bound)
+            else:
+                lp.set_col_bounds(idx, lpcc.col_lb[idx], lpcc.col_ub[idx])
+
+        else:
+            lp.set_row_bounds(idx, bound, bound if fixed else lpcc.row_ub[idx])
+
+    def solve_node(fixes: dict) -> tuple:
+        # aplicar solo las diferencias con el nodo anterior
+        for k in [k for k in applied if applied[k] != fixes.get(k)]:
+            fix(lpcc.pairs[k][applied.pop(k)], False)
+
+        for k, s in fixes.items():
+            if applied.get(k) != s:
+                fix(lpcc.pairs[k][s], True)
+                applied[k] = s
+
+        return lp.solve()
+
+    def violations(x: list, row_values: list) -> list:
+        viol = []
+
+        for k, (side1, side2) in enumerate(lpcc.pairs):
+            s1 = lpcc.slack(side1, x, row_values)
+            s2 = lpcc.slack(side2, x, row_values)
+
+            viol.append(min(s1, s2) / (1.0 + max(s1, s2)))
+
+        return viol
+
+    incumbent, incumbent_x = INF, None
+    nodes, lps = 0, 0
+    termination_condition = None
+    lp_status = None
+
+    # cola de nodos ordenada por la cota del padre (primero el mejor) y luego por profundidad
+    queue = [(-INF, 0, 0, dict())]
+    counter = 1
+    bound = -INF
+
+    while queue:
+        if time_limit is not None and time.time() - start > time_limit:
+            termination_condition = TIME_LIMIT
+            break
+
+        if iter_limit is not None and nodes >= iter_limit:
+            termination_condition = ITERATION_LIMIT
+            break
+
+        parent_bound, _, _, fixes = heapq.heappop(queue)
+        bound = parent_bound
+
+        if parent_bound >= incumbent - gap_tol * max(1.0, abs(incumbent)):
+            continue
+
+        nodes += 1
+        status, obj, x, row_values = solve_node(fixes)
+        lps += 1
+
+        if status == INFEASIBLE:
+            continue
+
+        if status != OPTIMAL:
+            # un nodo sin resolver no se puede podar: el árbol ya no certifica el óptimo ni la infactibilidad
+            termination_condition = TerminationCondition.error
+            lp_status = status
+            break
+
+        if obj >= incumbent - gap_tol * max(1.0, abs(incumbent)):
+            continue
+
+        viol = violations(x, row_values)
+        k = max(range(len(viol)), key=viol.__getitem__, default=None)
+
+        if k is None or viol[k] <= comp_tol:
+            incumbent, incumbent_x = obj, x
+
+            if tee:
+                print('lpcc_bb: nodo %d, nueva solución %.6f' % (nodes, lpcc.objective(obj)))
+
+            continue
+
+        if incumbent_x is None or nodes % heuristic_freq == 1:
+            # heurística: fijar cada par en su lado más cercano a cero
+            rounded = dict(fixes)
+
+            for j, (side1, side2) in enumerate(lpcc.pairs):
+                if j not in rounded:
+                    rounded[j] = 0 if lpcc.slack(side1, x, row_values) <= lpcc.slack(side2, x, row_values) else 1
+
+            h_status, h_obj, h_x, h_rows = solve_node(rounded)
+            lps += 1
+
+            if h_status == OPTIMAL and h_obj < incumbent and max(violations(h_x, h_rows), default=0.0) <= comp_tol:
+                incumbent, incumbent_x = h_obj, h_x
+
+                if tee:
+                    print('lpcc_bb: nodo %d, solución heurística %.6f' % (nodes, lpcc.objective(h_obj)))
+
+        # ramificar sobre el par más violado
+        for s in (0, 1):
+            child = dict(fixes)
+            child[k] = s
+            heapq.heappush(queue, (obj, -len(child), counter, child))
+            counter += 1
+
+    if termination_condition is None:
+        bound = incumbent
+        termination_condition = TerminationCondition.globallyOptimal if incumbent_x is not None \
+            else TerminationCondition.infeasible
+
+    elif queue:
+        bound = min(bound, min(item[0] for item in queue))
+
+    if incumbent_x is not None:
+        for var, val in zip(lpcc.vars, lpcc.values(incumbent_x)):
+            var.set_value(val, skip_validation=True)
+
+    if stats is not None:
+        stats['lpcc'] = {'nodes': nodes, 'lps': lps, 'iterations': lp.iterations, 'pairs': len(lpcc.pairs),
+                         'bound': lpcc.objective(bound), 'incumbent': lpcc.objective(incumbent),
+                         'gap': abs(incumbent - bound) / max(1.0, abs(incumbent)) if incumbent_x is not None else INF,
+                         'lp_status': lp_status}
+
+    solver_status = 'ok' if lp_status is None else 'error'
+
+    return termination_condition, solver_status, time.time() - start, incumbent_x is not None
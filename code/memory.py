@@ -0,0 +1,264 @@
+import gc
+import importlib
+import os
+import sys
+import tracemalloc
+import weakref
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+# Memoria de las campañas largas: medición por trabajo, liberación de recursos al terminar cada trabajo y
+# reciclado de los procesos que resuelven. Este módulo no debe importar pyomo al cargarse
+
+
+def rss() -> int:
+    '''
+    Memoria residente (RSS) actual del proceso en bytes. Fuera de Linux se usa el máximo alcanzado
+    '''
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # ru_maxrss está en KiB en Linux y en bytes en macOS
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class MemoryTracker:
+    '''
+    Mide la memoria de un trabajo: RSS al empezar y al terminar y, con trace, la memoria reservada por
+    Python (tracemalloc). tracemalloc queda activo en el proceso una vez iniciado, para que los trabajos
+    siguientes se midan igual
+    '''
+
+    def __init__(self, trace: bool = False):
+        self.trace = trace
+
+        if trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            # reset_peak es de Python 3.9; antes Traced_Peak es el máximo desde que se inició tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+            self.traced = tracemalloc.get_traced_memory()[0]
+
+        self.rss = rss()
+
+
+    def stop(self) -> dict:
+        '''
+        :return: diccionario con PID, RSS y RSS_Delta y, con trace, Traced (memoria de Python), Traced_Delta
+                 y Traced_Peak (máximo durante el trabajo por encima de la memoria al empezar), en bytes
+        '''
+
+        current = rss()
+        stats = {'PID': os.getpid(), 'RSS': current, 'RSS_Delta': current - self.rss}
+
+        if self.trace:
+            traced, peak = tracemalloc.get_traced_memory()
+            stats.update({'Traced': traced, 'Traced_Delta': traced - self.traced, 'Traced_Peak': peak - self.traced})
+
+        return stats
+
+
+@contextmanager
+def solver_tempfiles():
+    '''
+    Contexto de archivos temporales de pyomo (archivos .nl/.lp/.sol de los solvers) de un trabajo: al salir
+    se borran aunque el solve haya lanzado una excepción
+    '''
+
+    from pyomo.common.tempfiles import TempfileManager
+
+    TempfileManager.push()
+
+    try:
+        yield
+
+    finally:
+        TempfileManager.pop(remove=True)
+
+
+def release() -> None:
+    '''
+    Libera la memoria que queda después de un trabajo: los ciclos de referencias de las instancias de pyomo
+    y la caché de expresiones de sympy (si está cargado)
+    '''
+
+    if 'sympy' in sys.modules:
+        from sympy.core.cache import clear_cache
+
+        clear_cache()
+
+    gc.collect()
+
+
+def freeze_worker(*modules: str) -> None:
+    '''
+    Inicializador de los procesos que resuelven: carga los módulos y excluye sus objetos de las recolecciones
+    siguientes (gc.freeze), que así solo recorren lo creado por cada trabajo. Solo se usa en procesos propios
+    del grupo, nunca en el proceso que llama a run_job
+
+    :param modules: módulos que se cargan antes de congelar (p. ej. 'eip_model', que carga pyomo)
+    '''
+
+    for module in modules:
+        importlib.import_module(module)
+
+    gc.collect()
+    gc.freeze()
+
+
+class WorkerPool:
+    '''
+    Grupo de procesos que se reemplaza por uno nuevo después de max_tasks trabajos por worker o cuando
+    algún worker supera max_memory de RSS (según la memoria informada en el resultado de sus trabajos).
+    Los trabajos ya enviados terminan en el grupo viejo, cuyos procesos salen al vaciarse su cola
+    '''
+
+    def __init__(self, workers: int = 1, max_tasks: int = None, max_memory: int = None, preload: tuple = ()):
+        '''
+        :param workers: procesos que resuelven
+        :param max_tasks: trabajos por worker antes de reciclar el grupo (None para no reciclar por trabajos)
+        :param max_memory: RSS en bytes de un worker a partir del cual se recicla el grupo (None para no reciclar por memoria)
+        :param preload: módulos que cada worker carga y congela al iniciarse (ver freeze_worker)
+        '''
+
+        self.workers = max(1, workers)
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.preload = tuple(preload)
+
+        self.pool = None
+        self.submitted = 0  # trabajos enviados al grupo actual
+        self.expired = False
+        self.recycled = 0
+        self.owners = weakref.WeakKeyDictionary()  # future -> grupo al que se envió
+
+
+    def submit(self, fn, *args, **kwargs):
+        if self.pool is None or self.expired or (self.max_tasks and self.submitted >= self.workers * self.max_tasks):
+            self.recycle()
+
+        self.submitted += 1
+
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+
+        except BrokenProcessPool:
+            # un worker del grupo terminó abruptamente antes de que se leyera su resultado
+            self.recycle()
+            self.submitted += 1
+
+            future = self.pool.submit(fn, *args, **kwargs)
+
+        self.owners[future] = self.pool
+
+        return future
+
+
+    def recycle(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.recycled += 1
+
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=freeze_worker, initargs=self.preload)
+        self.submitted = 0
+        self.expired = False
+
+
+    def result(self, future) -> dict:
+        '''
+        Resultado de un trabajo; revisa la memoria que informó el worker
+
+        :raises BrokenProcessPool: si un worker terminó abruptamente (p. ej. sin memoria); el grupo se reemplaza
+                                   en el próximo envío
+        '''
+
+        # solo los trabajos del grupo actual lo marcan para reciclar: los de un grupo ya reemplazado (p. ej.
+        # los demás trabajos en curso cuando se rompió) no deben cerrar el grupo nuevo
+        current = self.owners.pop(future, None) is self.pool
+
+        try:
+            rslt = future.result()
+
+        except BrokenProcessPool:
+            self.expired = self.expired or current
+            raise
+
+        memory = rslt.get('Memory') if isinstance(rslt, dict) else None
+
+        if current and self.max_memory and memory and memory['RSS'] > self.max_memory:
+            self.expired = True
+
+        return rslt
+
+
+    def map(self, fn, jobs, on_error, window: int = None, **kwargs):
+        '''
+        Ejecuta fn(*job, **kwargs) para cada trabajo y devuelve los resultados en orden. Solo se envían
+        `window` trabajos por adelantado (2 por worker por defecto), por lo que los datos de la campaña no se
+        cargan todos a la vez y el reciclado alcanza a los trabajos siguientes. Un trabajo que falla porque
+        un worker terminó abruptamente se reenvía una vez; si vuelve a fallar se usa on_error
+
+        :param fn: función que se ejecuta en los workers
+        :param jobs: iterable de tuplas de argumentos
+        :param on_error: función (trabajo, excepción) que devuelve el resultado de un trabajo que falló en el grupo
+        :param window: trabajos enviados sin resultado
+        :return: generador de resultados
+        '''
+
+        window = window or 2 * self.workers
+        pending = deque()
+
+        def collect():
+            job, future, retried = pending.popleft()
+
+            try:
+                return self.result(future)
+
+            except BrokenProcessPool as e:
+                if retried:
+                    return on_error(job, e)
+
+                # la caída de un worker hace fallar a todos los trabajos en curso del grupo, no solo al que
+                # la provocó: cada uno se reenvía una vez al grupo nuevo
+                pending.appendleft((job, self.submit(fn, *job, **kwargs), True))
+
+                return collect()
+
+            except Exception as e:
+                return on_error(job, e)
+
+        for job in jobs:
+            pending.append((job, self.submit(fn, *job, **kwargs), False))
+
+            if len(pending) >= window:
+                yield collect()
+
+        while pending:
+            yield collect()
+
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.shutdown()
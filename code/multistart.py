@@ -0,0 +1,224 @@
+import math
+import os
+import pickle
+import random
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Value
+
+from pyomo.environ import Constraint, Var, value
+
+from limits import ITERATION_LIMIT, TIME_LIMIT, restore
+
+# Valores por defecto de la búsqueda
+STARTS = 8  # cantidad de puntos iniciales (el primero es el punto por defecto de fw_rule/fp_rule)
+DENSITY = 0.5  # probabilidad de usar cada tubería en un punto inicial aleatorio
+SUBSOLVER = 'mpec_nlp'
+
+# Estado de cada proceso de la búsqueda: instancia de referencia e incumbente compartido
+_STATE = dict()
+
+
+def random_start(instance, rng: random.Random, density: float = DENSITY) -> None:
+    '''
+    Genera un punto inicial aleatorio factible para las restricciones primales del nivel inferior.
+    Recorre las tuberías en orden aleatorio y envía por cada una una fracción aleatoria del máximo
+    flujo que permiten el balance de agua (restricción 4), la concentración de entrada del proceso
+    que recibe (restricción 1), Fw >= 0 y la capacidad de la tubería. Fw se recalcula con el
+    balance de contaminante (restricción 3), por lo que el punto la cumple exactamente
+
+    :param instance: instancia de un modelo de pyomo
+    :param rng: generador de números aleatorios
+    :param density: probabilidad de usar cada tubería
+    '''
+
+    c_out = {k: value(instance.Cmax_out[k]) for k in instance.EP_P}
+    c_in = {k: value(instance.Cmax_in[k]) for k in instance.EP_P}
+
+    fw = {k: value(instance.M[k]) / c_out[k] for k in instance.EP_P}
+    inflow = {k: 0.0 for k in instance.EP_P}  # agua que recibe de otros procesos
+    load = {k: 0.0 for k in instance.EP_P}  # contaminante que recibe de otros procesos
+    outflow = {k: 0.0 for k in instance.EP_P}
+
+    fp = {arc: 0.0 for arc in instance.EP_P_EP_P}
+    arcs = [arc for arc in instance.EP_P_EP_P if arc[:2] != arc[2:]]
+    rng.shuffle(arcs)
+
+    for arc in arcs:
+        if rng.random() > density:
+            continue
+
+        a, b = arc[:2], arc[2:]
+
+        # variación de Fw[b] por unidad de flujo recibido (restricción 3)
+        ratio = (c_out[a] - c_out[b]) / c_out[b]
+
+        limits = [fw[a] + inflow[a] - outflow[a]]
+
+        if ratio < 0:
+            limits.append(fw[b] / -ratio)
+
+        slope = c_out[a] - c_in[b] * (1 + ratio)
+
+        if slope > 0:
+            limits.append((c_in[b] * (fw[b] + inflow[b]) - load[b]) / slope)
+
+        if arc in instance.EP_P_EP_P_CAP:
+            limits.append(value(instance.Fp_max[arc]))
+
+        flow = rng.random() * max(0.0, min(limits))
+
+        fp[arc] = flow
+        fw[b] += ratio * flow
+        inflow[b] += flow
+        load[b] += c_out[a] * flow
+        outflow[a] += flow
+
+    for k in instance.EP_P:
+        instance.Fw[k].set_value(max(0.0, fw[k]))
+
+    for arc in instance.EP_P_EP_P:
+        instance.Fp[arc].set_value(fp[arc])
+
+
+def _init_worker(template: bytes, incumbent) -> None:
+    '''
+    Inicializa un proceso de la búsqueda con la instancia serializada y el incumbente compartido
+    '''
+
+    _STATE['template'] = template
+    _STATE['incumbent'] = incumbent
+
+
+def _run_start(start: int, seed: int, subsolver: str, options: dict, density: float, cutoff: bool,
+               deadline: float, iter_limit: int, feasibility_tol: float) -> dict:
+    '''
+    Resuelve el modelo desde un punto inicial
+
+    :return: diccionario con el resultado del punto inicial y los valores de las variables si es factible
+    '''
+
+    # eip_model importa este módulo: el despachador de solvers se importa al resolver
+    from eip_model import _solve
+
+    start_time = time.time()
+    rslt = {'Start': start, 'Seed': seed, 'Objective': None, 'Cutoff': None, 'Values': None}
+
+    remaining = None
+
+    if deadline is not None:
+        remaining = deadline - start_time
+
+        if remaining <= 0:
+            rslt.update({'Termination': TIME_LIMIT, 'Status': None, 'Time': 0.0})
+            return rslt
+
+    instance = pickle.loads(_STATE['template'])
+    variables = list(instance.component_data_objects(Var, descend_into=True))
+
+    if start > 0:
+        random_start(instance, random.Random(seed), density)
+
+    incumbent = _STATE['incumbent'].value
+
+    if cutoff and math.isfinite(incumbent):
+        # solo interesan los puntos que mejoran el incumbente de los demás procesos
+        instance.multistart_cutoff = Constraint(expr=instance.upper_level_objective.expr <= incumbent)
+        rslt['Cutoff'] = incumbent
+
+    termination_condition, solver_status, _, found = _solve(instance, subsolver, options, False, remaining,
+                                                            iter_limit, feasibility_tol, None)
+
+    rslt.update({'Termination': str(termination_condition), 'Status': str(solver_status),
+                 'Time': time.time() - start_time})
+
+    if found:
+        obj = value(instance.upper_level_objective)
+
+        rslt['Objective'] = obj
+        rslt['Values'] = [var.value for var in variables]
+
+        with _STATE['incumbent'].get_lock():
+            if obj < _STATE['incumbent'].value:
+                _STATE['incumbent'].value = obj
+
+    return rslt
+
+
+def solve_multistart(instance, options: dict, tee: bool = False, time_limit: float = None,
+                     iter_limit: int = None, feasibility_tol: float = 1e-5, stats: dict = None):
+    '''
+    Resuelve el modelo con un solver local desde varios puntos iniciales en paralelo y conserva el mejor.
+    El primer punto es el de fw_rule/fp_rule y el resto se generan con random_start. El mejor objetivo
+    encontrado se comparte entre los procesos y, con cutoff=1, se añade como cota del objetivo a los
+    puntos que empiezan después, para que los que no pueden mejorarlo terminen antes
+
+    :param instance: instancia de un modelo de pyomo
+    :param options: opciones de la búsqueda (solver, starts, workers, seed, density, cutoff)
+                    y del subsolver (el resto)
+    :param tee: no se usa, la salida de los procesos no se muestra
+    :param time_limit: tiempo límite total en segundos
+    :param iter_limit: límite de iteraciones de cada punto inicial
+    :param feasibility_tol: tolerancia de factibilidad de los puntos aceptados
+    :param stats: diccionario donde se guarda el resultado de cada punto en 'starts' (None para no guardarlo)
+    :return: tupla (condición de parada, estado del solver, tiempo, punto factible encontrado)
+    '''
+
+    start = time.time()
+    options = dict(options)
+
+    subsolver = options.pop('solver', SUBSOLVER)
+    starts = int(options.pop('starts', STARTS))
+    workers = int(options.pop('workers', os.cpu_count() or 1))
+    seed = int(options.pop('seed', 0))
+    density = float(options.pop('density', DENSITY))
+    cutoff = bool(options.pop('cutoff', 1))
+
+    deadline = start + time_limit if time_limit is not None else None
+
+    variables = list(instance.component_data_objects(Var, descend_into=True))
+    template = pickle.dumps(instance)
+    incumbent = Value('d', math.inf)
+
+    seeds = random.Random(seed).sample(range(2**31), starts)
+    jobs = [(i, seeds[i], subsolver, options, density, cutoff, deadline, iter_limit, feasibility_tol)
+            for i in range(starts)]
+
+    workers = max(1, min(workers, starts))
+
+    if workers == 1:
+        _init_worker(template, incumbent)
+
+        try:
+            rslt = [_run_start(*job) for job in jobs]
+
+        finally:
+            # el proceso sigue resolviendo otros trabajos: no se conserva la instancia serializada
+            _STATE.clear()
+
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(template, incumbent)) as pool:
+            rslt = list(pool.map(_run_start, *zip(*jobs)))
+
+    feasible = [r for r in rslt if r['Objective'] is not None]
+    best = min(feasible, key=lambda r: r['Objective'], default=None)
+
+    last = best if best is not None else rslt[-1]
+    termination_condition, solver_status = last['Termination'], last['Status']
+
+    if best is not None:
+        restore(zip(variables, best['Values']))
+
+    # los puntos que no llegaron a resolverse se reportan como límite de tiempo
+    if any(r['Termination'] == TIME_LIMIT for r in rslt):
+        termination_condition = TIME_LIMIT
+
+    elif best is None and any(r['Termination'] == ITERATION_LIMIT for r in rslt):
+        termination_condition = ITERATION_LIMIT
+
+    if stats is not None:
+        stats['starts'] = [{key: val for key, val in r.items() if key != 'Values'} for r in rslt]
+
+    return termination_condition, solver_status, time.time() - start, best is not None
@@ -0,0 +1,259 @@
+import time
+
+from pyomo.common.timing import HierarchicalTimer
+
+from limits import ITERATION_LIMIT, LIMIT_OPTIONS, TIME_LIMIT, limit_options
+
+# Interfaz persistente (APPSI) de cada subsolver: nombre de la clase en pyomo.contrib.appsi.solvers
+PERSISTENT_SOLVERS = {'ipopt': 'Ipopt', 'highs': 'Highs', 'appsi_highs': 'Highs', 'gurobi': 'Gurobi',
+                      'appsi_gurobi': 'Gurobi', 'cplex': 'Cplex', 'cbc': 'Cbc'}
+
+# Secciones del temporizador de APPSI que corresponden al trabajo del solver; el resto es sobrecarga
+# (set_instance, update, escritura de archivos y carga de la solución)
+SOLVER_SECTIONS = ('optimize', 'subprocess', 'cplex solve')
+
+
+def resolve_stats(mode: str) -> dict:
+    '''
+    Acumulador de las llamadas a un subsolver: cantidad, tiempo del solver y sobrecarga de cada llamada
+
+    :param mode: 'persistent' o 'file' (se escribe el problema completo en cada llamada)
+    :return: diccionario con Mode, Solves, Solver_Time, Overhead, Set_Instance y Update
+    '''
+
+    return {'Mode': mode, 'Solves': 0, 'Solver_Time': 0.0, 'Overhead': 0.0, 'Set_Instance': 0.0, 'Update': 0.0}
+
+
+def record(stats: dict, wall: float, solver_time: float) -> None:
+    '''
+    Suma una llamada al acumulador de resolve_stats
+
+    :param wall: tiempo total de la llamada
+    :param solver_time: tiempo del solver (None si el backend no lo informa: la llamada cuenta como tiempo del solver)
+    '''
+
+    solver_time = wall if solver_time is None else min(solver_time, wall)
+
+    stats['Solves'] += 1
+    stats['Solver_Time'] += solver_time
+    stats['Overhead'] += wall - solver_time
+
+
+def reported_time(results) -> float:
+    '''
+    Tiempo del solver informado en los resultados de SolverFactory (None si el backend no lo informa)
+    '''
+
+    for attr in ('time', 'wallclock_time'):
+        val = getattr(results.solver, attr, None)
+
+        if isinstance(val, (int, float)):
+            return val
+
+    return None
+
+
+class PersistentSolver:
+    '''
+    Subsolver que mantiene el modelo cargado entre llamadas con las interfaces persistentes de pyomo (APPSI).
+    La primera carga envía el modelo completo; en las llamadas siguientes solo se envían los parámetros
+    mutables y las cotas de las variables que cambiaron, por lo que las restricciones y el objetivo no deben
+    añadirse ni quitarse entre llamadas (p. ej. las etapas de mpec_nlp y mpec_continuation solo cambian mpec_bound)
+    '''
+
+    def __init__(self, solver: str, instance):
+        '''
+        :param solver: nombre del subsolver (ver PERSISTENT_SOLVERS)
+        :param instance: instancia ya transformada de un modelo de pyomo
+        :raises ValueError: si el solver no tiene interfaz persistente, no está instalado o no admite el modelo
+        '''
+
+        from pyomo.contrib.appsi import solvers
+
+        if solver not in PERSISTENT_SOLVERS:
+            raise ValueError('El solver %s no tiene interfaz persistente' % solver)
+
+        name = PERSISTENT_SOLVERS[solver]
+
+        self.solver = solver
+        self.instance = instance
+        self.opt = getattr(solvers, name)()
+        self.options = getattr(self.opt, name.lower() + '_options')
+
+        if not self.opt.available():
+            raise ValueError('La interfaz persistente de %s no está disponible' % solver)
+
+        # solo se revisan los cambios de parámetros y de cotas
+        update = self.opt.update_config
+        update.check_for_new_or_removed_constraints = False
+        update.check_for_new_or_removed_vars = False
+        update.check_for_new_or_removed_params = False
+        update.check_for_new_objective = False
+        update.update_constraints = False
+        update.update_named_expressions = False
+        update.update_objective = False
+
+        self.opt.config.load_solution = False
+
+        self.stats = resolve_stats('persistent')
+
+        start = time.time()
+
+        try:
+            self.opt.set_instance(instance)
+
+        except Exception as e:
+            # p. ej. HiGHS con las restricciones no lineales de mpec.simple_nonlinear
+            raise ValueError('%s no admite el modelo: %s' % (solver, e))
+
+        self.stats['Set_Instance'] = time.time() - start
+        self.stats['Overhead'] += self.stats['Set_Instance']
+
+
+    def solve(self, options: dict, tee: bool = False, time_limit: float = None, iter_limit: int = None) -> tuple:
+        '''
+        Resuelve el modelo cargado con los valores actuales de los parámetros y las cotas y carga el punto
+        encontrado en las variables de la instancia
+
+        :param options: opciones del subsolver
+        :param tee: mostrar la salida del solver en la consola
+        :param time_limit: tiempo límite en segundos (None para no limitar)
+        :param iter_limit: límite de iteraciones (None para no limitar)
+        :return: tupla (condición de parada, estado del solver, tiempo del solver, punto encontrado)
+        '''
+
+        from pyomo.contrib.appsi.base import (TerminationCondition, legacy_solver_status_map,
+                                              legacy_termination_condition_map)
+
+        # las claves de los límites pueden estar definidas con el nombre de la interfaz APPSI
+        name = self.solver if self.solver in LIMIT_OPTIONS else 'appsi_' + self.solver
+
+        self.options.clear()
+        self.options.update(options)
+        self.options.update(limit_options(name, None, iter_limit))
+
+        self.opt.config.stream_solver = tee
+        self.opt.config.time_limit = time_limit
+
+        timer = HierarchicalTimer()
+        start = time.time()
+
+        results = self.opt.solve(self.instance, timer=timer)
+        found = results.best_feasible_objective is not None
+
+        if found:
+            results.solution_loader.load_vars()
+
+        wall = time.time() - start
+
+        timers = timer.get_timers()
+        solver_time = sum(timer.get_total_time(section) for section in SOLVER_SECTIONS if section in timers)
+
+        self.stats['Update'] += timer.get_total_time('update') if 'update' in timers else 0.0
+        record(self.stats, wall, solver_time)
+
+        if results.termination_condition == TerminationCondition.maxTimeLimit:
+            termination_condition = TIME_LIMIT
+
+        elif results.termination_condition == TerminationCondition.maxIterations:
+            termination_condition = ITERATION_LIMIT
+
+        else:
+            termination_condition = legacy_termination_condition_map[results.termination_condition]
+
+        return termination_condition, legacy_solver_status_map[results.termination_condition], solver_time, found
+
+
+def persistent_solver(solver: str, instance):
+    '''
+    Crea el subsolver persistente de una instancia
+
+    :param solver: nombre del subsolver
+    :param instance: instancia ya transformada de un modelo de pyomo
+    :return: PersistentSolver o None si no se puede usar (se resuelve escribiendo el problema en cada llamada)
+    '''
+
+    try:
+        return PersistentSolver(solver, instance)
+
+    except ValueError:
+        return None
+
+
+def benchmark(model_id: int, solver: str = 'appsi_highs', solves: int = 10, db_path: str = None, seed: int = 0,
+              bigM: float = 10**6) -> dict:
+    '''
+    Compara la sobrecarga por re-solve de cargar el modelo completo en cada llamada (SolverFactory, como
+    solve_meta sin persistent=1) y de la interfaz persistente. Si el backend de SolverFactory no informa el
+    tiempo del solver, toda la llamada cuenta como tiempo del solver: la comparación es el tiempo total
+    Resuelve la reformulación MILP de mpec_minlp (mpec.simple_disjunction y gdp.bigm) en un barrido en el que
+    las cargas M de los procesos cambian en cada llamada (±10 %)
+
+    :param model_id: identificador del modelo
+    :param solver: subsolver con interfaz persistente
+    :param solves: cantidad de resoluciones del barrido
+    :param db_path: ruta de la base de datos (None para la ruta por defecto)
+    :param seed: semilla del barrido
+    :param bigM: constante de gdp.bigm
+    :return: diccionario {'File': estadísticas, 'Persistent': estadísticas} (ver resolve_stats) con la
+             lista de objetivos de cada resolución en 'Objectives'
+    '''
+
+    import random
+
+    from pyomo.environ import SolverFactory, TransformationFactory, value
+
+    from database.utils_db import DB_PATH, Data
+    from eip_model import model
+
+    data = Data(model_id, db_path or DB_PATH)
+    data.close()
+
+    instance = model(model_id, data)
+    TransformationFactory('mpec.simple_disjunction').apply_to(instance)
+    TransformationFactory('gdp.bigm').apply_to(instance, bigM=bigM)
+
+    base = {k: value(instance.M[k]) for k in instance.EP_P}
+    rng = random.Random(seed)
+    sweep = [{k: val * rng.uniform(0.9, 1.1) for k, val in base.items()} for _ in range(solves)]
+
+    # File: la misma llamada que solve_meta sin persistent=1 (SolverFactory vuelve a cargar el modelo completo)
+    opt = SolverFactory(solver)
+    stats = resolve_stats('file')
+    objectives = []
+
+    for loads in sweep:
+        for k, val in loads.items():
+            instance.M[k].set_value(val)
+
+        call_start = time.time()
+        results = opt.solve(instance, load_solutions=False)
+        record(stats, time.time() - call_start, reported_time(results))
+
+        found = len(results.solution) > 0
+
+        if found:
+            instance.solutions.load_from(results)
+
+        objectives.append(value(instance.upper_level_objective) if found else None)
+
+    stats['Objectives'] = objectives
+    rslt = {'File': stats}
+
+    # Persistent: el modelo se carga una vez y cada llamada solo actualiza las cargas M
+    opt = PersistentSolver(solver, instance)
+    objectives = []
+
+    for loads in sweep:
+        for k, val in loads.items():
+            instance.M[k].set_value(val)
+
+        _, _, _, found = opt.solve(dict())
+        objectives.append(value(instance.upper_level_objective) if found else None)
+
+    rslt['Persistent'] = dict(opt.stats, Objectives=objectives)
+
+    for k, val in base.items():
+        instance.M[k].set_value(val)
+
+    return rslt
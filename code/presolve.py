@@ -0,0 +1,133 @@
+from pyomo.environ import Constraint, Objective, value
+from pyomo.mpec import Complementarity
+from pyomo.core.expr.visitor import identify_variables, replace_expressions
+from pyomo.repn import generate_standard_repn
+
+
+def fresh_water(instance, ep, p):
+    '''
+    Expresión de Fw[ep, p] despejada de la tercera restricción (balance de contaminante):
+    Fw = (M + sum(Cmax_out' * Fp_in) - Cmax_out * sum(Fp_in)) / Cmax_out
+
+    :param instance: instancia de un modelo de pyomo
+    :param ep: identificador de la empresa
+    :param p: identificador del proceso
+    :return: expresión de Fw en función de los Fp que recibe el proceso
+    '''
+
+    return (
+        instance.M[ep, p]
+        + sum(
+            (instance.Cmax_out[ep_, p_] - instance.Cmax_out[ep, p]) * instance.Fp[ep_, p_, ep, p]
+            for ep_, p_ in instance.EP_P_IN[ep, p]
+        )
+    ) / instance.Cmax_out[ep, p]
+
+
+def substitute(instance, substitution: dict) -> None:
+    '''
+    Reemplaza variables por expresiones en el objetivo, las restricciones activas y las
+    restricciones de complementariedad del modelo
+
+    :param instance: instancia de un modelo de pyomo
+    :param substitution: diccionario {id(variable): expresión}
+    '''
+
+    def references(expr) -> bool:
+        return any(id(var) in substitution for var in identify_variables(expr, include_fixed=False))
+
+    for obj in instance.component_data_objects(Objective, active=True, descend_into=True):
+        if references(obj.expr):
+            obj.set_value(replace_expressions(obj.expr, substitution))
+
+    for con in instance.component_data_objects(Constraint, active=True, descend_into=True):
+        if references(con.body):
+            con.set_value(replace_expressions(con.expr, substitution))
+
+    for cdata in instance.component_data_objects(Complementarity, active=True, descend_into=True):
+        if any(references(arg) for arg in cdata._args):
+            cdata.set_value(tuple(replace_expressions(arg, substitution) for arg in cdata._args))
+
+
+def eliminate(instance) -> dict:
+    '''
+    Elimina Fw y lmbd del sistema KKT antes de resolver:
+
+    - Fw se reemplaza por su expresión en función de los Fp (fresh_water) y se desactiva constraint_3.
+      La no negatividad de Fw queda como upper_level_constraint sobre esa expresión.
+    - lmbd solo aparece en las filas de la lagrangiana de las tuberías internas de cada empresa.
+      Para cada lmbd se despeja su valor de una de esas filas (la de mayor coeficiente), se
+      reemplaza en las demás y se desactiva la fila usada
+
+    Los valores de Fw y lmbd se recuperan con reconstruct después de resolver
+
+    :param instance: instancia de un modelo de pyomo (sin transformar)
+    :return: diccionario con las expresiones de Fw y lmbd ('Fw', 'lmbd') y la cantidad de variables y filas eliminadas
+    '''
+
+    fw = {k: fresh_water(instance, *k) for k in instance.EP_P}
+
+    instance.constraint_3.deactivate()
+    substitute(instance, {id(instance.Fw[k]): expr for k, expr in fw.items()})
+
+    # filas de la lagrangiana que contienen a cada lmbd y su coeficiente
+    rows = {k: [] for k in instance.EP_P}
+    lmbd = {id(instance.lmbd[k]): k for k in instance.EP_P}
+
+    for row in instance.lagrangian.values():
+        # los coeficientes se mantienen como expresiones de los parámetros mutables
+        repn = generate_standard_repn(row.body, compute_values=False)
+
+        if not repn.is_linear():
+            continue
+
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            if id(var) in lmbd and value(coef) != 0:
+                rows[lmbd[id(var)]].append((abs(value(coef)), coef, row, repn))
+
+    expressions = dict()
+    pivots = set()
+
+    for k, candidates in rows.items():
+        candidates = [item for item in candidates if id(item[2]) not in pivots]
+
+        if not candidates:
+            continue
+
+        _, coef, pivot, repn = max(candidates, key=lambda item: item[0])
+        pivots.add(id(pivot))
+
+        # fila: resto + coef * lmbd == 0  =>  lmbd = -resto / coef
+        var = instance.lmbd[k]
+        rest = repn.constant + sum(coef_ * var_ for var_, coef_ in zip(repn.linear_vars, repn.linear_coefs)
+                                   if var_ is not var)
+        expr = -rest / coef
+
+        # las expresiones ya despejadas pueden contener este lmbd y viceversa
+        expr = replace_expressions(expr, {id(instance.lmbd[k_]): expr_ for k_, expr_ in expressions.items()})
+
+        for k_ in expressions:
+            expressions[k_] = replace_expressions(expressions[k_], {id(var): expr})
+
+        expressions[k] = expr
+        pivot.deactivate()
+
+    substitute(instance, {id(instance.lmbd[k]): expr for k, expr in expressions.items()})
+
+    return {'Fw': fw, 'lmbd': expressions, 'Variables': len(fw) + len(expressions),
+            'Rows': len(fw) + len(pivots)}
+
+
+def reconstruct(instance, presolved: dict) -> None:
+    '''
+    Calcula los valores de Fw y lmbd a partir de la solución del modelo reducido
+
+    :param instance: instancia de un modelo de pyomo resuelta después de eliminate
+    :param presolved: diccionario devuelto por eliminate
+    '''
+
+    for k, expr in presolved['Fw'].items():
+        instance.Fw[k].set_value(value(expr), skip_validation=True)
+
+    for k, expr in presolved['lmbd'].items():
+        instance.lmbd[k].set_value(value(expr), skip_validation=True)
@@ -0,0 +1,79 @@
+import sqlite3
+
+from database.utils_db import DB_PATH
+
+# Este módulo no debe importar pyomo, sympy ni pandas: solo consulta la base de datos
+
+
+def list_models(db_path: str = DB_PATH) -> list:
+    '''
+    Lista los modelos registrados en la base de datos
+
+    :param db_path: ruta de la base de datos
+    :return: lista de tuplas (ID_M, cantidad de empresas, cantidad de procesos)
+    '''
+
+    q = ''' SELECT m.ID_M, COUNT(DISTINCT ep.ID_EP), COUNT(ep.ID_P)
+            FROM Modelo m LEFT JOIN Empresa_Proceso ep ON ep.ID_M = m.ID_M
+            GROUP BY m.ID_M ORDER BY m.ID_M '''
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        return conn.execute(q).fetchall()
+
+    finally:
+        conn.close()
+
+
+def load_results(model_id: int = None, db_path: str = DB_PATH) -> list:
+    '''
+    Carga los resultados de los solvers almacenados en Results_Info
+
+    :param model_id: identificador del modelo (None para todos los modelos)
+    :param db_path: ruta de la base de datos
+    :return: lista de diccionarios con una entrada por resultado
+    '''
+
+    q = ''' SELECT ID_M, Solver, Transformation, Options, Total_Fw, Termination_Condition, Solver_Status, Time
+            FROM Results_Info '''
+    params = ()
+
+    if model_id is not None:
+        q += ' WHERE ID_M=? '
+        params = (model_id, )
+
+    q += ' ORDER BY ID_M, Solver, Transformation, Options '
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        cursor = conn.execute(q, params)
+        columns = [col[0] for col in cursor.description]
+
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    finally:
+        conn.close()
+
+
+def format_table(rows: list, columns: list) -> str:
+    '''
+    Da formato de tabla de texto a una lista de filas
+
+    :param rows: lista de filas (secuencias o diccionarios)
+    :param columns: nombres de las columnas
+    :return: tabla como cadena de texto
+    '''
+
+    rows = [[row[col] for col in columns] if isinstance(row, dict) else list(row) for row in rows]
+    cells = [[str(col) for col in columns]] + [['' if val is None else str(val) for val in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+
+    return '\n'.join('  '.join(val.ljust(widths[i]) for i, val in enumerate(row)).rstrip() for row in cells)
+
+
+if __name__ == '__main__':
+    print(format_table(list_models(), ['Model', 'Empresas', 'Procesos']))
+    print()
+    print(format_table(load_results(), ['ID_M', 'Solver', 'Transformation', 'Total_Fw', 'Termination_Condition', 'Time']))
@@ -47,6 +47,21 @@ def mu_2_rule(model, ep, p, ep_, p_):
     return 0
 
 
+def mu_5_rule(model, ep, p, ep_, p_):
+    '''
+    Define el valor de inicialización de la variable mu_5 en el modelo
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: 0
+    '''    
+
+    return 0
+
+
 def lmbd_rule(model, ep, p): 
     '''
     Define el valor de inicialización de la variable lmbd en el modelo
@@ -121,44 +136,66 @@ def lower_level_objective_rule(model, ep):
             + (
                 sum(
                     model.Fp[ep_, p_, ep, p]
-                    for ep_, p_ in model.EP_P
-                    if (ep, p) != (ep_, p_)
+                    for ep_, p_ in model.EP_P_IN[ep, p]
                 )
             )
             - (
                 sum(
                     model.Fp[ep, p, ep_, p_]
-                    for ep_, p_ in model.EP_P
-                    if (ep, p) != (ep_, p_)
+                    for ep_, p_ in model.EP_P_OUT[ep, p]
                 )
             )
             for ep1, p in model.EP_P
             if ep == ep1
         )
-        + model.delta.value
-        * (
-            sum(
-                model.Fp[ep, p, ep, p_]
-                for ep1, p in model.EP_P
-                if ep == ep1
-                for ep2, p_ in model.EP_P
-                if ep == ep2
-                if p != p_
-            )
+        + sum(
+            pumping_cost(model, ep, p, ep, p_)
+            * model.Fp[ep, p, ep, p_]
+            for ep1, p in model.EP_P
+            if ep == ep1
+            for ep2, p_ in model.EP_P_OUT[ep, p]
+            if ep == ep2
         )
-        + model.delta.value
-        / 2
-        * (
-            sum(
-                (model.Fp[ep, p, ep_, p_] + model.Fp[ep_, p_, ep, p])
-                for ep_, p_ in model.EP_P
-                for ep1, p in model.EP_P
-                if ep == ep1 and ep != ep_
-            )
+        + sum(
+            pumping_cost(model, ep, p, ep_, p_)
+            / 2
+            * model.Fp[ep, p, ep_, p_]
+            for ep1, p in model.EP_P
+            if ep == ep1
+            for ep_, p_ in model.EP_P_OUT[ep, p]
+            if ep != ep_
+        )
+        + sum(
+            pumping_cost(model, ep_, p_, ep, p)
+            / 2
+            * model.Fp[ep_, p_, ep, p]
+            for ep1, p in model.EP_P
+            if ep == ep1
+            for ep_, p_ in model.EP_P_IN[ep, p]
+            if ep != ep_
         )
     )
 
 
+def pumping_cost(model, ep, p, ep_, p_):
+    '''
+    Costo de bombeo de la tubería (ep, p) -> (ep_, p_): el de la tabla Conexion si está
+    definido, si no el costo delta del modelo
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: costo de bombeo
+    '''
+
+    if (ep, p, ep_, p_) in model.EP_P_EP_P_CB:
+        return model.Cb[ep, p, ep_, p_].value
+
+    return model.delta.value
+
+
 def lower_level_constraint_1(model, ep, p):
     '''
     Expresión de la primera restricción del problema de una empresa con respecto a uno de sus procesos.
@@ -172,14 +209,12 @@ def lower_level_constraint_1(model, ep, p):
 
     return sum(
         model.Cmax_out[ep_, p_] * model.Fp[ep_, p_, ep, p]
-        for ep_, p_ in model.EP_P
-        if (ep, p) != (ep_, p_)
+        for ep_, p_ in model.EP_P_IN[ep, p]
     ) - model.Cmax_in[ep, p] * (
         model.Fw[ep, p]
         + sum(
             model.Fp[ep_, p_, ep, p]
-            for ep_, p_ in model.EP_P
-            if (ep, p) != (ep_, p_)
+            for ep_, p_ in model.EP_P_IN[ep, p]
         )
     )
 
@@ -248,16 +283,14 @@ def lower_level_constraint_3(model, ep, p):
         model.M[ep, p]
         + sum(
             model.Cmax_out[ep_, p_] * model.Fp[ep_, p_, ep, p]
-            for ep_, p_ in model.EP_P
-            if (ep, p) != (ep_, p_)
+            for ep_, p_ in model.EP_P_IN[ep, p]
         )
         - model.Cmax_out[ep, p]
         * (
             model.Fw[ep, p]
             + sum(
                 model.Fp[ep_, p_, ep, p]
-                for ep_, p_ in model.EP_P
-                if (ep, p) != (ep_, p_)
+                for ep_, p_ in model.EP_P_IN[ep, p]
             )
         )
     )
@@ -292,13 +325,11 @@ def lower_level_constraint_4(model, ep, p):
         -model.Fw[ep, p]
         - sum(
             model.Fp[ep_, p_, ep, p]
-            for ep_, p_ in model.EP_P
-            if (ep, p) != (ep_, p_)
+            for ep_, p_ in model.EP_P_IN[ep, p]
         )
         + sum(
             model.Fp[ep, p, ep_, p_]
-            for ep_, p_ in model.EP_P
-            if (ep, p) != (ep_, p_)
+            for ep_, p_ in model.EP_P_OUT[ep, p]
         )
     )
 
@@ -317,6 +348,40 @@ def lower_level_constraint_4_rule(model, ep, p):
     return lower_level_constraint_4(model, ep, p) <= 0
 
 
+def lower_level_constraint_5(model, ep, p, ep_, p_):
+    '''
+    Expresión de la quinta restricción del problema de una empresa: capacidad de la tubería
+    (ep, p) -> (ep_, p_) definida en la tabla Conexion.
+    Restricción de desigualdad
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: expresión de la restricción
+    '''
+
+    return model.Fp[ep, p, ep_, p_] - model.Fp_max[ep, p, ep_, p_]
+
+
+def lower_level_constraint_5_rule(model, ep, p, ep_, p_):
+    '''
+    Regla para añadir la quinta restricción del problema de una empresa.
+    La cantidad de agua que circula por una tubería no supera su capacidad (Fp <= Fp_max).
+    Restricción de desigualdad
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: restricción
+    '''
+
+    return lower_level_constraint_5(model, ep, p, ep_, p_) <= 0
+
+
 def mu_constraint_rule(model, ep, p, c):
     '''
     Regla para añadir la restricción de no negatividad del multiplicador (mu)
@@ -348,6 +413,22 @@ def mu_2_constraint_rule(model, ep, p, ep_, p_):
     return model.mu_2[ep, p, ep_, p_] >= 0
 
 
+def mu_5_constraint_rule(model, ep, p, ep_, p_):
+    '''
+    Regla para añadir la restricción de no negatividad del multiplicador (mu_5)
+    asociado a la restricción de capacidad de una tubería
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: restricción
+    '''
+
+    return model.mu_5[ep, p, ep_, p_] >= 0
+
+
 def select_constraint_rule(model, ep, p, c):
     '''
     Selecciona una restricción asociada al problema de la empresa ep con su proceso p
@@ -415,8 +496,24 @@ def complementarity_2_rule(model, ep, p, ep_, p_):
     return complements(mu_2_constraint_rule(model, ep, p, ep_, p_), lower_level_constraint_2_rule(model, ep, p, ep_, p_))
 
 
+def complementarity_5_rule(model, ep, p, ep_, p_):
+    '''
+    Regla para añadir la restricción de complementariedad asociada a la capacidad de una tubería
+
+    :param model: instancia de un modelo abstracto
+    :param ep: identificador de la empresa que envía
+    :param p: identificador del proceso que envía
+    :param ep_: identificador de la empresa que recibe
+    :param p_: identificador del proceso que recibe
+    :return: restricción de complementariedad
+    '''
+
+    return complements(mu_5_constraint_rule(model, ep, p, ep_, p_), lower_level_constraint_5_rule(model, ep, p, ep_, p_))
+
+
 def lagrangian_expr(model, ep, p, ep_, p_):
     '''
+    Referencia de las filas de kkt.firm_coefficients, que son las que usa el modelo; pei-opt verify compara ambas.
     Solo toma los gradientes con respecto a los Fp del problema de la empresa ep 
     Expresión de lagrangiana del problema de una empresa con respecto a una de las variables (Fp[ep, p, ep_, p_])
 
@@ -448,10 +545,23 @@ def lagrangian_expr(model, ep, p, ep_, p_):
     
     expr += constraint_2_gradient 
 
+    if (ep, p, ep_, p_) in model.EP_P_EP_P_CAP:
+        constraint_5_gradient = model.mu_5[ep, p, ep_, p_] * differentiate(
+            lower_level_constraint_5(model, ep, p, ep_, p_),
+            wrt=model.Fp[ep, p, ep_, p_],
+            mode='sympy',
+        )
+
+        expr += constraint_5_gradient
+
+    # solo las restricciones del proceso que envía (p) y del que recibe (p_, si es de la empresa ep)
+    # contienen a Fp[ep, p, ep_, p_]; el gradiente de las demás es cero
+    related = (p, p_) if ep == ep_ else (p, )
+
     # siempre se halla el diferencial con respecto a la misma variable 
     for ep_1, p_1 in model.EP_P: # analizar todas las restricciones de la 
                                  # empresa ep (de cada tipo de restricción hay tantas como procesos tiene la empresa)
-        if ep == ep_1: # comprobar si p_1 es proceso de la empresa actual
+        if ep == ep_1 and p_1 in related: # comprobar si p_1 es proceso de la empresa actual
             
             # calcular el gradiente de la restricción 1 del proceso p_1 con respecto a Fp[e, p, ep_, p_]
             # model.mu[ep, p_1, 1] multiplicador de la restriccion 1 del proceso p_1 de la empresa ep
@@ -0,0 +1,134 @@
+import math
+
+from pyomo.common.collections import ComponentMap
+from pyomo.environ import Constraint, Objective, Suffix, value
+from pyomo.repn import generate_standard_repn
+
+# Cotas de los factores de escala
+MIN_FACTOR = 1e-6
+MAX_FACTOR = 1e6
+
+# Opciones que activan el escalado del usuario en cada subsolver
+SCALING_OPTIONS = {'ipopt': {'nlp_scaling_method': 'user-scaling'}}
+
+
+def geometric_mean(values) -> float:
+    '''
+    Media geométrica de los valores positivos (1 si no hay ninguno)
+    '''
+
+    logs = [math.log(val) for val in values if val > 0]
+
+    return math.exp(sum(logs) / len(logs)) if logs else 1.0
+
+
+def clip(factor: float) -> float:
+    return min(MAX_FACTOR, max(MIN_FACTOR, factor))
+
+
+def column_factors(instance) -> ComponentMap:
+    '''
+    Calcula los factores de escala de las variables a partir de los rangos de los parámetros:
+
+    - Fw y Fp se escalan con el flujo típico M / Cmax_out (el punto inicial de fw_rule)
+    - mu[., 4], mu_2 y mu_5 se escalan con el precio típico (alpha, beta, delta y Cb)
+    - mu[., 1] y lmbd multiplican filas con coeficientes de concentración, por lo que se
+      escalan con precio / concentración
+
+    :param instance: instancia de un modelo de pyomo
+    :return: ComponentMap {variable: factor}, la variable escalada es factor * variable
+    '''
+
+    flow = geometric_mean(value(instance.M[k]) / value(instance.Cmax_out[k]) for k in instance.EP_P)
+    price = max([value(instance.alpha), value(instance.beta), value(instance.delta)]
+                + [value(instance.Cb[arc]) for arc in instance.EP_P_EP_P_CB])
+    concentration = geometric_mean([value(instance.Cmax_out[k]) for k in instance.EP_P]
+                                   + [value(instance.Cmax_in[k]) for k in instance.EP_P])
+
+    price = price if price > 0 else 1.0
+
+    factors = ComponentMap()
+
+    for var in instance.Fw.values():
+        factors[var] = clip(1 / flow)
+
+    for var in instance.Fp.values():
+        factors[var] = clip(1 / flow)
+
+    for (ep, p, c), var in instance.mu.items():
+        factors[var] = clip(concentration / price if c == 1 else 1 / price)
+
+    for var in list(instance.mu_2.values()) + list(instance.mu_5.values()):
+        factors[var] = clip(1 / price)
+
+    for var in instance.lmbd.values():
+        factors[var] = clip(concentration / price)
+
+    return factors
+
+
+def row_factor(expr, factors) -> float:
+    '''
+    Factor de escala de una fila: inverso del mayor coeficiente expresado en las variables escaladas
+
+    :param expr: cuerpo de la restricción u objetivo
+    :param factors: suffix o ComponentMap con los factores de las variables
+    :return: factor de escala de la fila
+    '''
+
+    repn = generate_standard_repn(expr, compute_values=True, quadratic=True)
+
+    coefs = [abs(coef) / factors.get(var, 1.0) for var, coef in zip(repn.linear_vars, repn.linear_coefs)]
+    coefs.extend(abs(coef) / (factors.get(var1, 1.0) * factors.get(var2, 1.0))
+                 for (var1, var2), coef in zip(repn.quadratic_vars, repn.quadratic_coefs))
+
+    largest = max(coefs, default=0.0)
+
+    return clip(1 / largest) if largest > 0 else 1.0
+
+
+def scale_rows(instance) -> None:
+    '''
+    Añade al suffix scaling_factor los factores de las restricciones activas que aún no tienen uno
+    (p. ej. las creadas por las transformaciones de pyomo.mpec después de scale)
+
+    :param instance: instancia de un modelo de pyomo con el suffix scaling_factor
+    '''
+
+    suffix = instance.scaling_factor
+
+    for con in instance.component_data_objects(Constraint, active=True, descend_into=True):
+        if con not in suffix:
+            suffix[con] = row_factor(con.body, suffix)
+
+
+def scale(instance) -> Suffix:
+    '''
+    Adjunta al modelo el suffix scaling_factor con los factores de las variables (column_factors),
+    del objetivo y de las restricciones. Los solvers que lo leen (ipopt con nlp_scaling_method=user-scaling,
+    lpcc_bb) devuelven la solución en las variables originales
+
+    :param instance: instancia de un modelo de pyomo
+    :return: suffix con los factores de escala
+    '''
+
+    if instance.component('scaling_factor') is None:
+        instance.scaling_factor = Suffix(direction=Suffix.EXPORT)
+
+    suffix = instance.scaling_factor
+    suffix.update(column_factors(instance))
+
+    for obj in instance.component_data_objects(Objective, active=True, descend_into=True):
+        suffix[obj] = row_factor(obj.expr, suffix)
+
+    scale_rows(instance)
+
+    return suffix
+
+
+def is_scaled(instance) -> bool:
+    '''
+    Indica si el modelo tiene factores de escala
+    '''
+
+    return isinstance(instance.component('scaling_factor'), Suffix)
@@ -0,0 +1,259 @@
+import math
+import sqlite3
+
+from database.utils_db import DB_PATH, DataSet
+
+# Este módulo no debe importar pyomo: la selección se hace antes de construir los modelos
+
+# Vecinos que se consultan y modelos con historial necesarios para no resolver con todas las configuraciones
+NEIGHBOURS = 5
+MIN_HISTORY = 3
+
+# Tolerancia relativa para considerar que una configuración alcanzó el mejor objetivo de un modelo
+OBJ_TOL = 1e-4
+
+FEATURES = ('Processes', 'Firms', 'Max_Processes', 'Arcs', 'Density', 'Cmax_in_Spread', 'Cmax_out_Spread',
+            'M_Spread', 'M_Scale')
+
+
+def spread(values) -> float:
+    '''
+    Rango de los valores positivos en órdenes de magnitud (log10(max / min)), 0 si no hay ninguno
+    '''
+
+    values = [val for val in values if val is not None and val > 0]
+
+    return math.log10(max(values) / min(values)) if values else 0.0
+
+
+def features(data) -> tuple:
+    '''
+    Características baratas de una instancia calculadas a partir de sus datos (ver FEATURES)
+
+    :param data: instancia de la clase Data
+    :return: tupla con los valores de FEATURES
+    '''
+
+    processes = len(data.EP_P)
+    arcs = len(data.EP_P_EP_P)
+    m = [val for val in data.M.values() if val is not None and val > 0]
+
+    return (processes,
+            len(data.EP),
+            max(data.np.values(), default=0),
+            arcs,
+            arcs / (processes * (processes - 1)) if processes > 1 else 0.0,
+            spread(data.Cmax_in.values()),
+            spread(data.Cmax_out.values()),
+            spread(data.M.values()),
+            math.log10(sum(m) / len(m)) if m else 0.0)
+
+
+def config_key(config: dict) -> tuple:
+    '''
+    Identificador de una configuración de solver en Results_Info: (Solver, Transformation, Options)
+    '''
+
+    return config['solver'], config.get('transformation', ''), config.get('solver_options', '')
+
+
+class History:
+    '''
+    Resultados conocidos de cada configuración por modelo y características de los modelos. Se carga de
+    Results_Info y se actualiza con add a medida que terminan los trabajos
+    '''
+
+    def __init__(self):
+        self.features = dict()  # ID_M -> características
+        self.results = dict()  # ID_M -> {configuración: (objetivo, tiempo)}
+
+
+    @classmethod
+    def load(cls, db_path: str = DB_PATH, keys: list = None):
+        '''
+        Carga el historial de la base de datos
+
+        :param db_path: ruta de la base de datos
+        :param keys: configuraciones que interesan (None para todas)
+        :return: historial
+        '''
+
+        history = cls()
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            rows = conn.execute(' SELECT ID_M, Solver, Transformation, Options, Total_Fw, Time FROM Results_Info ').fetchall()
+
+        except sqlite3.OperationalError:
+            rows = []
+
+        finally:
+            conn.close()
+
+        keys = None if keys is None else set(keys)
+
+        for model_id, solver, transformation, options, objective, time in rows:
+            key = (solver, transformation or '', options or '')
+
+            if keys is None or key in keys:
+                history.results.setdefault(model_id, dict())[key] = (objective, time)
+
+        with DataSet(db_path) as dataset:
+            for data in dataset.load(sorted(history.results)):
+                history.features[data.model_id] = features(data)
+
+        # resultados de modelos que ya no están en la base de datos
+        for model_id in set(history.results) - set(history.features):
+            del history.results[model_id]
+
+        return history
+
+
+    def add(self, model_id: int, feats: tuple, key: tuple, objective: float, time: float) -> None:
+        '''
+        Agrega el resultado de una configuración sobre un modelo (aprendizaje en línea)
+        '''
+
+        self.features[model_id] = feats
+        self.results.setdefault(model_id, dict())[key] = (objective, time)
+
+
+    def successes(self, model_id: int) -> dict:
+        '''
+        Indica para cada configuración probada en el modelo si alcanzó el mejor objetivo conocido
+
+        :return: diccionario {configuración: (alcanzó el mejor objetivo, tiempo)}
+        '''
+
+        results = self.results[model_id]
+        objectives = [obj for obj, _ in results.values() if obj is not None]
+
+        if not objectives:
+            return {key: (False, time) for key, (_, time) in results.items()}
+
+        best = min(objectives)
+
+        return {key: (obj is not None and obj <= best + OBJ_TOL * max(1.0, abs(best)), time)
+                for key, (obj, time) in results.items()}
+
+
+    def neighbours(self, feats: tuple, k: int = NEIGHBOURS, exclude: int = None) -> list:
+        '''
+        Modelos del historial más parecidos: distancia euclídea entre características estandarizadas
+
+        :param feats: características de la instancia
+        :param k: cantidad de vecinos
+        :param exclude: modelo que no se considera (p. ej. el propio en una evaluación)
+        :return: lista de tuplas (distancia, ID_M) ordenada
+        '''
+
+        models = [model_id for model_id in self.results if model_id != exclude]
+
+        if not models:
+            return []
+
+        scales = []
+
+        for i in range(len(feats)):
+            column = [self.features[model_id][i] for model_id in models]
+            mean = sum(column) / len(column)
+            std = math.sqrt(sum((val - mean) ** 2 for val in column) / len(column))
+            scales.append(std if std > 0 else 1.0)
+
+        distances = [(math.sqrt(sum(((a - b) / s) ** 2 for a, b, s in zip(feats, self.features[model_id], scales))), model_id)
+                     for model_id in models]
+
+        return sorted(distances)[:k]
+
+
+    def rank(self, feats: tuple, keys: list, k: int = NEIGHBOURS, exclude: int = None) -> list:
+        '''
+        Ordena las configuraciones según su desempeño en los modelos vecinos: primero la fracción
+        (ponderada por cercanía) de vecinos en los que alcanzaron el mejor objetivo y luego el tiempo medio
+
+        :param feats: características de la instancia
+        :param keys: configuraciones candidatas
+        :param k: cantidad de vecinos
+        :param exclude: modelo que no se considera
+        :return: lista de tuplas (configuración, tasa de éxito, tiempo medio, vecinos en los que se probó);
+                 la tasa y el tiempo son None para las configuraciones sin historial en los vecinos
+        '''
+
+        stats = {key: [0.0, 0.0, 0.0, 0] for key in keys}  # peso con éxito, peso total, tiempo ponderado, vecinos
+
+        for distance, model_id in self.neighbours(feats, k, exclude):
+            weight = 1 / (1 + distance)
+
+            for key, (success, time) in self.successes(model_id).items():
+                if key in stats:
+                    stats[key][0] += weight * success
+                    stats[key][1] += weight
+                    stats[key][2] += weight * (time or 0.0)
+                    stats[key][3] += 1
+
+        ranking = [(key, won / total if total else None, time / total if total else None, count)
+                   for key, (won, total, time, count) in stats.items()]
+
+        # las configuraciones sin historial van al final
+        return sorted(ranking, key=lambda item: (item[1] is None, -(item[1] or 0), item[2] or 0))
+
+
+    def select(self, feats: tuple, configs: list, top_k: int = 1, k: int = NEIGHBOURS, exclude: int = None) -> tuple:
+        '''
+        Elige las configuraciones que se ejecutan sobre una instancia. Si no hay suficiente historial
+        (MIN_HISTORY modelos vecinos con resultados de todas las candidatas) se ejecutan todas
+
+        :param feats: características de la instancia
+        :param configs: configuraciones candidatas
+        :param top_k: cantidad de configuraciones que se ejecutan
+        :param k: cantidad de vecinos
+        :param exclude: modelo que no se considera
+        :return: tupla (configuraciones elegidas, tiempos medios estimados {configuración: tiempo} de las candidatas)
+        '''
+
+        by_key = {config_key(config): config for config in configs}
+        ranking = self.rank(feats, list(by_key), k, exclude)
+        predicted = {key: time for key, _, time, _ in ranking if time is not None}
+
+        if top_k <= 0 or min(count for *_, count in ranking) < MIN_HISTORY:
+            return list(configs), predicted
+
+        return [by_key[key] for key, *_ in ranking[:top_k]], predicted
+
+
+def evaluate(history: History, configs: list, top_k: int = 1, k: int = NEIGHBOURS) -> dict:
+    '''
+    Evalúa la selección dejando un modelo afuera: para cada modelo con resultados de todas las
+    configuraciones elige con el historial de los demás y compara con la ejecución exhaustiva
+
+    :param history: historial
+    :param configs: configuraciones candidatas
+    :param top_k: cantidad de configuraciones que se ejecutan
+    :param k: cantidad de vecinos
+    :return: diccionario con Models, Solved (modelos en los que alguna configuración encontró un objetivo),
+             Hits (modelos resueltos en los que alguna elegida alcanzó el mejor objetivo), Time (tiempo de
+             las elegidas), Exhaustive_Time y Saved (fracción del tiempo ahorrada)
+    '''
+
+    keys = [config_key(config) for config in configs]
+    report = {'Models': 0, 'Solved': 0, 'Hits': 0, 'Time': 0.0, 'Exhaustive_Time': 0.0}
+
+    for model_id in sorted(history.results):
+        successes = history.successes(model_id)
+
+        if any(key not in successes for key in keys):
+            continue
+
+        selected, _ = history.select(history.features[model_id], configs, top_k, k, exclude=model_id)
+        selected = [config_key(config) for config in selected]
+
+        report['Models'] += 1
+        report['Solved'] += any(success for success, _ in successes.values())
+        report['Hits'] += any(successes[key][0] for key in selected)
+        report['Time'] += sum(successes[key][1] or 0.0 for key in selected)
+        report['Exhaustive_Time'] += sum(successes[key][1] or 0.0 for key in keys)
+
+    report['Saved'] = 1 - report['Time'] / report['Exhaustive_Time'] if report['Exhaustive_Time'] > 0 else 0.0
+
+    return report
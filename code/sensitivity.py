@@ -0,0 +1,276 @@
+import math
+
+from pyomo.environ import value
+from pyomo.core.expr.visitor import identify_mutable_parameters
+from pyomo.repn import generate_standard_repn
+
+from kkt import firm_coefficients, instance_tasks, row_expr
+from rules import (lower_level_constraint_1, lower_level_constraint_3, lower_level_constraint_4,
+                   lower_level_constraint_5, upper_level_objective_rule)
+
+# Parámetros para los que se calculan las derivadas por defecto
+PARAMETERS = ('alpha', 'beta', 'delta', 'M', 'Cmax_in', 'Cmax_out')
+
+# Tolerancia para considerar activa una desigualdad
+ACTIVE_TOL = 1e-6
+
+
+def kkt_rows(instance) -> tuple:
+    '''
+    Filas del sistema KKT de todas las empresas como expresiones lineales con los parámetros simbólicos:
+    igualdades (restricción 3 y lagrangiana), pares de complementariedad (dos holguras >= 0) y la
+    no negatividad de Fw del nivel superior
+
+    :param instance: instancia de un modelo de pyomo
+    :return: tupla (igualdades, pares, desigualdades); cada fila es una tupla (nombre, expresión)
+             y cada par una tupla de dos filas
+    '''
+
+    c1 = {k: lower_level_constraint_1(instance, *k) for k in instance.EP_P}
+    c3 = {k: lower_level_constraint_3(instance, *k) for k in instance.EP_P}
+    c4 = {k: lower_level_constraint_4(instance, *k) for k in instance.EP_P}
+
+    equalities = [('constraint_3[%s,%s]' % k, c3[k]) for k in instance.EP_P]
+
+    # las mismas filas de estacionariedad que los bloques firm, con los parámetros sin evaluar
+    lagrangian = dict()
+
+    for rows, constants, terms in map(firm_coefficients, instance_tasks(instance).values()):
+        for arc, constant, row in zip(rows, constants, terms):
+            lagrangian[arc] = row_expr(instance, constant, row)
+
+    equalities.extend(('lagrangian[%s,%s,%s,%s]' % arc, lagrangian[arc]) for arc in instance.EP_P_EP_P)
+
+    pairs = []
+
+    for k in instance.EP_P:
+        pairs.append((('mu[%s,%s,1]' % k, instance.mu[k + (1, )]), ('constraint_1[%s,%s]' % k, -c1[k])))
+        pairs.append((('mu[%s,%s,4]' % k, instance.mu[k + (4, )]), ('constraint_4[%s,%s]' % k, -c4[k])))
+
+    for arc in instance.EP_P_EP_P:
+        pairs.append((('mu_2[%s,%s,%s,%s]' % arc, instance.mu_2[arc]), ('Fp[%s,%s,%s,%s]' % arc, instance.Fp[arc])))
+
+    for arc in instance.EP_P_EP_P_CAP:
+        pairs.append((('mu_5[%s,%s,%s,%s]' % arc, instance.mu_5[arc]),
+                      ('constraint_5[%s,%s,%s,%s]' % arc, -lower_level_constraint_5(instance, *arc))))
+
+    inequalities = [('Fw[%s,%s]' % k, instance.Fw[k]) for k in instance.EP_P]
+
+    return equalities, pairs, inequalities
+
+
+def parameter_data(instance, parameters) -> list:
+    '''
+    Parámetros escalares o elementos de parámetros indexados a analizar
+
+    :param instance: instancia de un modelo de pyomo
+    :param parameters: nombres de los parámetros
+    :return: lista de parámetros (ParamData)
+    '''
+
+    return [param for name in parameters for param in getattr(instance, name).values()]
+
+
+def sensitivity(instance, parameters=PARAMETERS, active_tol: float = ACTIVE_TOL) -> dict:
+    '''
+    Derivadas de primer orden del objetivo del nivel superior y de los flujos con respecto a los
+    parámetros del modelo en la solución actual, con el conjunto activo fijo.
+
+    Con cada par de complementariedad fijado en su lado activo, el problema del nivel superior es un LP
+    cuyas filas son lineales en las variables y afines en cada parámetro. El LP se resuelve con HiGHS y
+    la base óptima define un sistema cuadrado J dx = -dr/dp (filas no básicas y variables no básicas),
+    que se factoriza una sola vez para todos los parámetros. Para cada parámetro se calcula además el
+    rango en el que ninguna holgura básica se anula, es decir, en el que el conjunto activo no cambia
+
+    :param instance: instancia resuelta de un modelo de pyomo
+    :param parameters: nombres de los parámetros a analizar
+    :param active_tol: tolerancia para considerar activa una desigualdad
+    :return: diccionario con 'Objective' (valor), 'LP_Objective' (valor del LP), 'Active' (filas activas),
+             'Variables', 'Degenerate' (igualdades básicas en el LP) y 'Parameters': {nombre: {'Value',
+             'Objective', 'Fw', 'Fp', 'Lower', 'Upper', 'Lower_Limit', 'Upper_Limit'}}
+    '''
+
+    import highspy
+    import numpy as np
+    from scipy.sparse import csc_matrix, csr_matrix, vstack
+    from scipy.sparse.linalg import splu
+
+    equalities, pairs, inequalities = kkt_rows(instance)
+
+    # cada par se fija en su lado activo (el de menor holgura); el otro queda como desigualdad
+    fixed, free = [], list(inequalities)
+
+    for side1, side2 in pairs:
+        slack1, slack2 = value(side1[1]), value(side2[1])
+
+        if min(slack1, slack2) > active_tol * (1 + max(abs(slack1), abs(slack2))):
+            raise ValueError('La solución no cumple la complementariedad de %s y %s' % (side1[0], side2[0]))
+
+        fixed.append(side1 if slack1 <= slack2 else side2)
+        free.append(side2 if slack1 <= slack2 else side1)
+
+    rows = equalities + fixed + free
+    n_eq = len(equalities) + len(fixed)
+
+    columns = dict()
+    variables = []
+    data, row_idx, col_idx, const = [], [], [], []
+
+    for i, (_, expr) in enumerate(rows):
+        repn = generate_standard_repn(expr, compute_values=True)
+
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            if id(var) not in columns:
+                columns[id(var)] = len(variables)
+                variables.append(var)
+
+            data.append(coef)
+            row_idx.append(i)
+            col_idx.append(columns[id(var)])
+
+        const.append(value(repn.constant))
+
+    n = len(variables)
+    A = csr_matrix((data, (row_idx, col_idx)), shape=(len(rows), n))
+
+    # objetivo del nivel superior en función de Fw (el de la instancia puede estar modificado por presolve)
+    repn = generate_standard_repn(upper_level_objective_rule(instance), compute_values=True)
+    cost = np.zeros(n)
+
+    for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+        cost[columns[id(var)]] += coef
+
+    # LP con el conjunto activo fijo: igualdades y lados fijados == 0, el resto >= 0
+    inf = highspy.kHighsInf
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = n, len(rows)
+    lp.col_cost_ = cost
+    lp.col_lower_ = np.full(n, -inf)
+    lp.col_upper_ = np.full(n, inf)
+    lp.row_lower_ = -np.array(const)
+    lp.row_upper_ = np.array([-const[i] if i < n_eq else inf for i in range(len(rows))])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = A.indptr.astype(np.int32)
+    lp.a_matrix_.index_ = A.indices.astype(np.int32)
+    lp.a_matrix_.value_ = A.data.astype(float)
+    lp.a_matrix_.num_col_, lp.a_matrix_.num_row_ = n, len(rows)
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    h.passModel(lp)
+    h.run()
+
+    if h.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+        raise ValueError('El LP con el conjunto activo fijo no tiene solución óptima')
+
+    basis = h.getBasis()
+    basic_rows = [i for i, status in enumerate(basis.row_status) if status == highspy.HighsBasisStatus.kBasic]
+    nonbasic_rows = [i for i, status in enumerate(basis.row_status) if status != highspy.HighsBasisStatus.kBasic]
+    nonbasic_cols = [j for j, status in enumerate(basis.col_status) if status != highspy.HighsBasisStatus.kBasic]
+
+    params = parameter_data(instance, parameters)
+
+    # filas que dependen de cada parámetro
+    depends = {id(param): [] for param in params}
+
+    for i, (_, expr) in enumerate(rows):
+        for param in identify_mutable_parameters(expr):
+            if id(param) in depends:
+                depends[id(param)].append(i)
+
+    # dr/dp es exacta porque cada fila es afín en cada parámetro
+    dr = np.zeros((len(rows), len(params)))
+
+    for j, param in enumerate(params):
+        base = param.value
+        step = max(1.0, abs(base))
+        current = {i: value(rows[i][1]) for i in depends[id(param)]}
+
+        try:
+            param.set_value(base + step)
+
+            for i in depends[id(param)]:
+                dr[i, j] = (value(rows[i][1]) - current[i]) / step
+
+        finally:
+            param.set_value(base)
+
+    # sistema de la base: filas no básicas activas y variables no básicas fijas
+    bound_rows = csr_matrix((np.ones(len(nonbasic_cols)), (range(len(nonbasic_cols)), nonbasic_cols)),
+                            shape=(len(nonbasic_cols), n))
+
+    J = csc_matrix(vstack([A[nonbasic_rows], bound_rows]))
+    rhs = np.vstack([-dr[nonbasic_rows], np.zeros((len(nonbasic_cols), len(params)))])
+
+    dx = splu(J).solve(rhs)
+
+    # variación de las holguras de las filas básicas; el conjunto activo cambia cuando alguna se anula
+    x = np.array(h.getSolution().col_value)
+    slacks = A @ x + np.array(const)
+    slack = slacks[basic_rows]
+    dslack = A[basic_rows] @ dx + dr[basic_rows]
+
+    fw = {id(instance.Fw[k]): k for k in instance.EP_P}
+    fp = {id(instance.Fp[arc]): arc for arc in instance.EP_P_EP_P}
+
+    report = dict()
+
+    for j, param in enumerate(params):
+        upper, lower = math.inf, math.inf
+        upper_limit, lower_limit = None, None
+
+        for i, s, ds in zip(basic_rows, slack, dslack[:, j]):
+            if abs(ds) <= active_tol:
+                continue
+
+            if i < n_eq:
+                # una igualdad básica (degenerada) no admite ningún cambio de su holgura
+                upper, upper_limit = 0.0, rows[i][0]
+                lower, lower_limit = 0.0, rows[i][0]
+
+            elif ds < 0 and max(s, 0.0) / -ds < upper:
+                upper, upper_limit = max(s, 0.0) / -ds, rows[i][0]
+
+            elif ds > 0 and max(s, 0.0) / ds < lower:
+                lower, lower_limit = max(s, 0.0) / ds, rows[i][0]
+
+        d_fw = {fw[id(var)]: dx[i, j] for i, var in enumerate(variables) if id(var) in fw}
+        d_fp = {fp[id(var)]: dx[i, j] for i, var in enumerate(variables) if id(var) in fp}
+
+        report[param.name] = {'Value': param.value, 'Objective': float(cost @ dx[:, j]), 'Fw': d_fw, 'Fp': d_fp,
+                              'Lower': param.value - lower, 'Upper': param.value + upper,
+                              'Lower_Limit': lower_limit, 'Upper_Limit': upper_limit}
+
+    return {'Objective': value(instance.upper_level_objective), 'LP_Objective': h.getInfo().objective_function_value,
+            'Active': n_eq + int(np.sum(np.abs(slacks[n_eq:]) <= active_tol)), 'Variables': n,
+            'Degenerate': sum(1 for i in basic_rows if i < n_eq), 'Parameters': report}
+
+
+def predict(report: dict, parameter: str, change: float) -> tuple:
+    '''
+    Estima el objetivo del nivel superior si un parámetro cambia en 'change' (p. ej. beta un 10%:
+    change = 0.1 * report['Parameters']['beta']['Value'])
+
+    :param report: resultado de sensitivity
+    :param parameter: nombre del parámetro (p. ej. 'beta' o 'M[1,2]')
+    :param change: variación del parámetro
+    :return: tupla (objetivo estimado, el conjunto activo cambia y la estimación deja de ser exacta)
+    '''
+
+    item = report['Parameters'][parameter]
+    new = item['Value'] + change
+
+    return report['Objective'] + item['Objective'] * change, not item['Lower'] <= new <= item['Upper']
+
+
+def sensitivity_table(report: dict) -> list:
+    '''
+    Resumen del análisis de sensibilidad con una fila por parámetro (para reports.format_table o un .csv)
+
+    :param report: resultado de sensitivity
+    :return: lista de diccionarios con Parameter, Value, dObjective, Lower, Upper, Lower_Limit y Upper_Limit
+    '''
+
+    return [{'Parameter': name, 'Value': item['Value'], 'dObjective': item['Objective'], 'Lower': item['Lower'],
+             'Upper': item['Upper'], 'Lower_Limit': item['Lower_Limit'], 'Upper_Limit': item['Upper_Limit']}
+            for name, item in report['Parameters'].items()]
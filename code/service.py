@@ -0,0 +1,486 @@
+import json
+import signal
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from campaign import SOLVERS, WORKER_MODULES, parse_config, run_job
+from database.utils_db import DB_PATH, Data
+from memory import freeze_worker
+
+# Servicio local de trabajos: los escenarios se encolan en una base SQLite propia y un grupo fijo de
+# procesos los resuelve. Este módulo no debe importar pyomo: los modelos se construyen en los workers
+
+# Ruta por defecto de la cola (relativa al directorio code/)
+QUEUE_PATH = 'database/jobs.db'
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Procesos que resuelven y tamaño estimado total (variables) de los trabajos que se ejecutan a la vez
+WORKERS = 2
+CAPACITY = 200_000
+
+# Segundos entre revisiones de la cola mientras hay trabajos en ejecución
+POLL = 0.5
+
+# Veces que un trabajo vuelve a la cola cuando falla porque un worker del grupo terminó abruptamente
+RETRIES = 1
+
+QUEUE_SCHEMA = ''' CREATE TABLE IF NOT EXISTS Jobs (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                ID_M INTEGER NOT NULL,
+                Overrides TEXT,
+                Config TEXT NOT NULL,
+                Size INTEGER NOT NULL,
+                State TEXT NOT NULL,
+                Submitted REAL NOT NULL,
+                Started REAL,
+                Finished REAL,
+                Objective REAL,
+                Termination_Condition TEXT,
+                Time REAL,
+                Error TEXT,
+                Retries INTEGER NOT NULL DEFAULT 0) '''
+
+JOB_COLUMNS = ('ID', 'ID_M', 'Overrides', 'Config', 'Size', 'State', 'Submitted', 'Started', 'Finished', 'Objective',
+               'Termination_Condition', 'Time', 'Error', 'Retries')
+
+
+def instance_size(data: Data) -> int:
+    '''
+    Tamaño estimado de la instancia sin construirla: cantidad de variables (Fp y mu_2 por tubería, mu_5 por
+    tubería con capacidad y Fw, lmbd y dos mu por proceso). Las filas y complementariedades crecen igual
+
+    :param data: instancia de la clase Data
+    :return: cantidad de variables
+    '''
+
+    return 2 * len(data.EP_P_EP_P) + len(data.Fp_max) + 4 * len(data.EP_P)
+
+
+def scenario_config(config: dict, job_id: int) -> dict:
+    '''
+    Configuración con la opción scenario=ID en ella y en sus fallbacks, para que los resultados de un
+    escenario no se mezclen en la base de datos con los del modelo original
+    '''
+
+    config = dict(config, solver_options=('%s scenario=%d' % (config['solver_options'], job_id)).strip())
+
+    if config.get('fallback'):
+        config['fallback'] = [scenario_config(fallback, job_id) for fallback in config['fallback']]
+
+    return config
+
+
+def run_service_job(job_id: int, model_id: int, overrides: dict, config: dict, db_path: str = DB_PATH,
+                    **kwargs) -> dict:
+    '''
+    Resuelve un trabajo de la cola en un worker y guarda sus resultados con Data.insert_results
+
+    :param job_id: identificador del trabajo
+    :param model_id: identificador del modelo
+    :param overrides: parámetros que se reemplazan (ver Data.override)
+    :param config: configuración del solver
+    :param db_path: ruta de la base de datos de los modelos
+    :param kwargs: argumentos adicionales de run_job
+    :return: resultado de run_job
+    '''
+
+    data = Data(model_id, db_path)
+
+    if overrides:
+        try:
+            data.override(overrides)
+
+        except Exception:
+            data.close()
+            raise
+
+        config = scenario_config(config, job_id)
+
+    return run_job(model_id, config, db_path, data=data, evaluate_csv=False, **kwargs)
+
+
+def percentile(values: list, q: float) -> float:
+    '''
+    Percentil q (entre 0 y 1) de una lista ordenada por el método del rango más cercano (None si está vacía)
+    '''
+
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+class JobService:
+    '''
+    Cola persistente de trabajos {modelo, parámetros reemplazados, configuración de solver} y grupo fijo de
+    workers que la procesa en orden de llegada. Un trabajo se admite si hay un worker libre y el tamaño
+    estimado de los trabajos en ejecución más el suyo no supera la capacidad; si no entra, los siguientes
+    esperan (no se adelantan trabajos chicos a uno grande)
+    '''
+
+    def __init__(self, db_path: str = DB_PATH, queue_path: str = QUEUE_PATH, workers: int = WORKERS,
+                 capacity: int = CAPACITY, default_config: dict = None, **kwargs):
+        '''
+        :param db_path: ruta de la base de datos de los modelos
+        :param queue_path: ruta de la base de datos de la cola
+        :param workers: procesos que resuelven
+        :param capacity: tamaño estimado total (variables) de los trabajos en ejecución
+        :param default_config: configuración de los trabajos que no definen una (None para la primera de SOLVERS)
+        :param kwargs: argumentos adicionales de run_job (time_limit, iter_limit, fp_tol, build_workers)
+        '''
+
+        self.db_path = db_path
+        self.queue_path = queue_path
+        self.workers = max(1, workers)
+        self.capacity = capacity
+        self.default_config = default_config or SOLVERS[0]
+        self.kwargs = kwargs
+
+        self.running = dict()  # future -> (ID del trabajo, tamaño, grupo de workers)
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+        self.started = time.time()
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                conn.execute(QUEUE_SCHEMA)
+
+                # colas creadas antes de los reintentos
+                if 'Retries' not in [row[1] for row in conn.execute(' PRAGMA table_info(Jobs) ')]:
+                    conn.execute(' ALTER TABLE Jobs ADD COLUMN Retries INTEGER NOT NULL DEFAULT 0 ')
+
+                # los trabajos que estaban en ejecución cuando se detuvo el servicio vuelven a la cola
+                conn.execute(" UPDATE Jobs SET State='queued', Started=NULL WHERE State='running' ")
+
+        finally:
+            conn.close()
+
+
+    def connect(self) -> sqlite3.Connection:
+        # una conexión por operación: la cola se usa desde los hilos del servidor y el del despachador
+        return sqlite3.connect(self.queue_path, timeout=30)
+
+
+    def submit(self, model_id: int, overrides: dict = None, config: dict = None) -> dict:
+        '''
+        Valida y encola un trabajo
+
+        :param model_id: identificador del modelo
+        :param overrides: parámetros que se reemplazan (ver Data.override)
+        :param config: configuración del solver (None para la configuración por defecto)
+        :return: diccionario {'ID', 'Size', 'State'}
+        :raises ValueError: si el modelo, los parámetros o la configuración no son válidos o el trabajo
+                            supera la capacidad del servicio
+        '''
+
+        overrides = overrides or dict()
+
+        try:
+            config = parse_config(config) if config else self.default_config
+
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError('Configuración de solver inválida: %s' % (config, ))
+
+        data = Data(int(model_id), self.db_path)
+        data.close()
+
+        if not data.EP_P:
+            raise ValueError('El modelo %s no existe' % model_id)
+
+        data.override(overrides)
+        size = instance_size(data)
+
+        if size > self.capacity:
+            raise ValueError('El trabajo (%d variables) supera la capacidad del servicio (%d)' % (size, self.capacity))
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                cursor = conn.execute(' INSERT INTO Jobs (ID_M, Overrides, Config, Size, State, Submitted) VALUES (?, ?, ?, ?, ?, ?) ',
+                                      (data.model_id, json.dumps(overrides), json.dumps(config), size, 'queued', time.time()))
+
+        finally:
+            conn.close()
+
+        self.wake.set()
+
+        return {'ID': cursor.lastrowid, 'Size': size, 'State': 'queued'}
+
+
+    def job(self, job_id: int) -> dict:
+        '''
+        Estado y resultado de un trabajo (None si no existe)
+        '''
+
+        conn = self.connect()
+
+        try:
+            row = conn.execute(' SELECT %s FROM Jobs WHERE ID=? ' % ', '.join(JOB_COLUMNS), (job_id, )).fetchone()
+
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+
+        job = dict(zip(JOB_COLUMNS, row))
+        job['Overrides'] = json.loads(job['Overrides'])
+        job['Config'] = json.loads(job['Config'])
+
+        return job
+
+
+    def metrics(self) -> dict:
+        '''
+        Métricas de la cola desde que se inició el servicio
+
+        :return: diccionario con la cantidad de trabajos por estado, la latencia en la cola (tiempo entre el
+                 envío y el inicio: media, p50, p95 y máxima, y la espera del trabajo encolado más antiguo), el
+                 tiempo medio de ejecución, el throughput (trabajos terminados por hora) y el tamaño en ejecución
+        '''
+
+        now = time.time()
+        conn = self.connect()
+
+        try:
+            states = dict(conn.execute(' SELECT State, COUNT(*) FROM Jobs GROUP BY State ').fetchall())
+            latencies = sorted(val for val, in conn.execute(' SELECT Started - Submitted FROM Jobs WHERE Started >= ? ', (self.started, )))
+            runs = [val for val, in conn.execute(' SELECT Finished - Started FROM Jobs WHERE Finished >= ? ', (self.started, ))]
+            oldest, = conn.execute(" SELECT MIN(Submitted) FROM Jobs WHERE State='queued' ").fetchone()
+
+        finally:
+            conn.close()
+
+        uptime = now - self.started
+
+        return {'Uptime': uptime,
+                'Jobs': {state: states.get(state, 0) for state in ('queued', 'running', 'done', 'failed')},
+                'Queue_Latency': {'Mean': sum(latencies) / len(latencies) if latencies else None,
+                                  'P50': percentile(latencies, 0.5),
+                                  'P95': percentile(latencies, 0.95),
+                                  'Max': latencies[-1] if latencies else None,
+                                  'Oldest_Queued': now - oldest if oldest is not None else None},
+                'Run_Time': sum(runs) / len(runs) if runs else None,
+                'Throughput': 3600 * len(runs) / uptime if uptime > 0 else 0.0,
+                'Running_Size': sum(size for _, size, _ in self.running.values()),
+                'Capacity': self.capacity,
+                'Workers': self.workers}
+
+
+    def run(self) -> None:
+        '''
+        Despachador: admite trabajos de la cola y registra los resultados hasta que se llame a shutdown.
+        Al detenerse espera a los trabajos en ejecución
+        '''
+
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=freeze_worker, initargs=WORKER_MODULES)
+
+        try:
+            while not self.stop.is_set():
+                if not self._admit(pool):
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=self.workers, initializer=freeze_worker, initargs=WORKER_MODULES)
+
+                if not self.running:
+                    self.wake.wait(POLL)
+                    self.wake.clear()
+                    continue
+
+                done, _ = wait(list(self.running), timeout=POLL, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    # un worker terminó abruptamente (p. ej. sin memoria): se reemplaza el grupo una sola vez,
+                    # aunque los demás trabajos del grupo roto terminen después
+                    if self._finish(future) is pool:
+                        pool.shutdown(wait=False)
+                        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=freeze_worker, initargs=WORKER_MODULES)
+
+            for future in list(self.running):
+                self._finish(future)
+
+        finally:
+            pool.shutdown()
+
+
+    def shutdown(self) -> None:
+        self.stop.set()
+        self.wake.set()
+
+
+    def _admit(self, pool: ProcessPoolExecutor) -> bool:
+        '''
+        Envía al grupo los trabajos de la cola que entran
+
+        :return: False si el grupo de workers quedó inutilizable antes de enviar un trabajo
+        '''
+
+        used = sum(size for _, size, _ in self.running.values())
+        conn = self.connect()
+
+        try:
+            queued = conn.execute(" SELECT ID, ID_M, Overrides, Config, Size FROM Jobs WHERE State='queued' ORDER BY ID ").fetchall()
+
+            for job_id, model_id, overrides, config, size in queued:
+                if len(self.running) >= self.workers or (self.running and used + size > self.capacity):
+                    break
+
+                with conn:
+                    conn.execute(" UPDATE Jobs SET State='running', Started=? WHERE ID=? ", (time.time(), job_id))
+
+                try:
+                    future = pool.submit(run_service_job, job_id, model_id, json.loads(overrides), json.loads(config),
+                                         self.db_path, **self.kwargs)
+
+                except BrokenProcessPool:
+                    # un worker terminó abruptamente después de la última revisión: el trabajo vuelve a la cola
+                    with conn:
+                        conn.execute(" UPDATE Jobs SET State='queued', Started=NULL WHERE ID=? ", (job_id, ))
+
+                    return False
+
+                self.running[future] = (job_id, size, pool)
+                used += size
+
+        finally:
+            conn.close()
+
+        return True
+
+
+    def _finish(self, future):
+        '''
+        Registra en la cola el resultado de un trabajo terminado. La caída de un worker hace fallar a todos los
+        trabajos en curso del grupo, no solo al que la provocó: cada uno vuelve a la cola hasta RETRIES veces
+
+        :return: el grupo de workers del trabajo si quedó inutilizable, si no None
+        '''
+
+        job_id, _, pool = self.running.pop(future)
+        broken = None
+
+        try:
+            rslt = future.result()
+
+        except BrokenProcessPool as e:
+            rslt = {'Error': '%s: %s' % (type(e).__name__, e)}
+            broken = pool
+
+        except Exception as e:
+            rslt = {'Error': '%s: %s' % (type(e).__name__, e)}
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                retries, = conn.execute(' SELECT Retries FROM Jobs WHERE ID=? ', (job_id, )).fetchone()
+
+                if broken is not None and retries < RETRIES:
+                    conn.execute(" UPDATE Jobs SET State='queued', Started=NULL, Error=?, Retries=? WHERE ID=? ",
+                                 (rslt['Error'], retries + 1, job_id))
+                    self.wake.set()
+
+                else:
+                    conn.execute(' UPDATE Jobs SET State=?, Finished=?, Objective=?, Termination_Condition=?, Time=?, Error=? WHERE ID=? ',
+                                 ('failed' if 'Error' in rslt else 'done', time.time(), rslt.get('Objective Value'),
+                                  rslt.get('Termination Condition'), rslt.get('Time'), rslt.get('Error'), job_id))
+
+        finally:
+            conn.close()
+
+        return broken
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    '''
+    API HTTP del servicio:
+
+    - POST /jobs con {"model": ID_M, "overrides": {...}, "config": {...}}: encola un trabajo
+    - GET /jobs/ID: estado y resultado de un trabajo
+    - GET /metrics: métricas de la cola
+    '''
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self.reply(404, {'error': 'ruta desconocida %s' % self.path})
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.service.submit(body['model'], body.get('overrides'), body.get('config'))
+
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            return self.reply(400, {'error': '%s: %s' % (type(e).__name__, e)})
+
+        self.reply(201, job)
+
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+
+        if parts == ['metrics']:
+            return self.reply(200, self.server.service.metrics())
+
+        if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            job = self.server.service.job(int(parts[1]))
+
+            if job is not None:
+                return self.reply(200, job)
+
+        self.reply(404, {'error': 'ruta desconocida %s' % self.path})
+
+
+    def reply(self, code: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(service: JobService, host: str = HOST, port: int = PORT, verbose: bool = False) -> None:
+    '''
+    Atiende la API HTTP y despacha los trabajos hasta que se interrumpa el proceso (Ctrl+C o SIGTERM).
+    Por defecto solo escucha en la interfaz local
+
+    :param service: servicio de trabajos
+    :param host: dirección donde escuchar
+    :param port: puerto
+    :param verbose: registrar cada petición en la consola
+    '''
+
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.service = service
+    server.verbose = verbose
+
+    # SIGTERM (p. ej. systemd) detiene el servicio igual que Ctrl+C; shutdown debe llamarse desde otro hilo
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    dispatcher = threading.Thread(target=service.run, name='dispatcher')
+    dispatcher.start()
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+        service.shutdown()
+        dispatcher.join()